@@ -1,8 +1,11 @@
 # api/endpoints/agent.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
-# This will import the fully configured agent from our service file
-from services.deep_agent_service import agent
+# The agent is built lazily by the service layer on the first invocation
+from services.deep_agent_service import get_agent, get_llm, invoke_subagent_directly
+from services.conversation_service import compact_thread_safely, thread_lock
+from services.intent_router import route_fast_path
+from services.metrics_service import agent_routes
 
 router = APIRouter()
 
@@ -10,7 +13,7 @@ class AgentRequest(BaseModel):
     content: str
 
 @router.post("/agent/invoke/{thread_id}")
-async def invoke_agent_endpoint(thread_id: str, request: AgentRequest):
+async def invoke_agent_endpoint(thread_id: str, request: AgentRequest, background_tasks: BackgroundTasks):
     """
     Invokes the agent for a specific conversation thread, maintaining history via Redis.
     """
@@ -19,9 +22,21 @@ async def invoke_agent_endpoint(thread_id: str, request: AgentRequest):
         input_data = {"messages": [{"role": "user", "content": request.content}]}
         
         # Asynchronously invoke the agent from the service layer
-        result = await agent.ainvoke(input_data, config=config) # type: ignore
-        
-        final_answer = result['messages'][-1].content
+        agent = await get_agent()
+
+        # Confidently classified turns skip the router model and go straight to the sub-agent.
+        subagent = route_fast_path(request.content)
+        # Serializes turns on this thread; compaction only takes the lock for its final write
+        async with thread_lock(thread_id):
+            if subagent:
+                final_answer = await invoke_subagent_directly(subagent, config, request.content)
+            else:
+                result = await agent.ainvoke(input_data, config=config) # type: ignore
+                final_answer = result['messages'][-1].content
+        agent_routes.inc(subagent or "llm_router")
+
+        # Compact the thread after the response is sent so the next turn's prompt stays small.
+        background_tasks.add_task(compact_thread_safely, agent, config, get_llm())
         return {"response": final_answer}
         
     except Exception as e:
@@ -17,6 +17,10 @@ import jwt
 import traceback
 import time
 from firebase_config import realtime_db
+from services.rtdb_budget import rtdb_budget
+from services.auth_store import (
+    claim_signup_code, delete_session, delete_verification, get_verification, save_session, update_verification,
+)
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
@@ -30,17 +34,15 @@ def get_db_ref():
     return firebase_db.reference()
 
 
-generated_codes = set()
-verification_codes = {}
-user_sessions = {}
+# Issued codes, pending verifications and sessions are kept in Redis
+# (services/auth_store.py) so they work across server workers.
 
-def generate_unique_code(length: int = 8):
+async def generate_unique_code(org_id: str, length: int = 8):
     """Generates a unique alphanumeric code."""
     alphabet = string.ascii_uppercase + string.digits
     while True:
         code = ''.join(secrets.choice(alphabet) for _ in range(length))
-        if code not in generated_codes:
-            generated_codes.add(code)
+        if await claim_signup_code(code, org_id):
             return code
 
 @router.post("/orgs/{org_id}/generate-code")
@@ -49,7 +51,7 @@ async def create_patient_code(org_id: str):
     Generates a new, unique sign-up code for a patient associated with a clinical org.
     """
     # In a real app, you would first validate the org_id against your database.
-    new_code = generate_unique_code()
+    new_code = await generate_unique_code(org_id)
     # TODO: Save the code to your database, linking it to the org_id with an expiration.
     return {"org_id": org_id, "signup_code": new_code}
 
@@ -144,6 +146,7 @@ async def send_verification_email(email: str, verification_code: str):
 
 # Authentication endpoints
 @router.post("/signup")
+@rtdb_budget(max_calls=4)
 async def sign_up(user_data: UserSignUp):
     user_id, existing_user = find_user_by_email(user_data.email)
     if existing_user:
@@ -173,16 +176,11 @@ async def sign_up(user_data: UserSignUp):
 async def verify_email(verify_data: VerifyCodeRequest):
     """Verify email with the sent code."""
     try:
-        if verify_data.email not in verification_codes:
+        # Expired codes are dropped by their Redis TTL
+        stored_data = await get_verification(verify_data.email)
+        if stored_data is None:
             raise HTTPException(status_code=400, detail="No verification code found for this email")
         
-        stored_data = verification_codes[verify_data.email]
-        
-        # Check if code expired
-        if datetime.utcnow() > stored_data["expires"]:
-            del verification_codes[verify_data.email]
-            raise HTTPException(status_code=400, detail="Verification code expired")
-        
         # Check if code matches
         if stored_data["code"] != verify_data.code:
             raise HTTPException(status_code=400, detail="Invalid verification code")
@@ -194,7 +192,7 @@ async def verify_email(verify_data: VerifyCodeRequest):
         user_ref.update({'isVerified': True})
         
         # Mark as verified and clean up
-        stored_data["verified"] = True
+        await update_verification(verify_data.email, {**stored_data, "verified": True})
         
         return {"success": True, "message": "Email verified successfully", "user_id": user_id}
         
@@ -205,6 +203,7 @@ async def verify_email(verify_data: VerifyCodeRequest):
         raise HTTPException(status_code=500, detail="Verification failed")
 
 @router.post("/login")
+@rtdb_budget(max_calls=1)
 async def login(login_data: UserLogin):
     user_id, user_data = find_user_by_email(login_data.email)
     if not user_data or not verify_password(login_data.password, user_data['password']):
@@ -230,20 +229,14 @@ async def login(login_data: UserLogin):
 async def verify_2fa(verify_data: VerifyCodeRequest):
     """Verify 2FA code and complete login."""
     try:
-        if verify_data.email not in verification_codes:
+        stored_data = await get_verification(verify_data.email)
+        if stored_data is None:
             raise HTTPException(status_code=400, detail="No 2FA code found")
         
-        stored_data = verification_codes[verify_data.email]
-        
         # Check if this is a login verification
         if not stored_data.get("is_login", False):
             raise HTTPException(status_code=400, detail="Invalid verification type")
         
-        # Check if code expired
-        if datetime.utcnow() > stored_data["expires"]:
-            del verification_codes[verify_data.email]
-            raise HTTPException(status_code=400, detail="2FA code expired")
-        
         # Check if code matches
         if stored_data["code"] != verify_data.code:
             raise HTTPException(status_code=400, detail="Invalid 2FA code")
@@ -269,14 +262,11 @@ async def verify_2fa(verify_data: VerifyCodeRequest):
         }
         sessions_ref.set(session_data)
         
-        # Also store in memory for quick access
-        user_sessions[user_id] = {
-            "token": token,
-            "expires": datetime.utcnow() + timedelta(days=7)
-        }
+        # Also store in Redis for quick access from any worker
+        await save_session(user_id, token)
         
         # Clean up verification code
-        del verification_codes[verify_data.email]
+        await delete_verification(verify_data.email)
         
         return {
             "success": True,
@@ -300,19 +290,15 @@ async def verify_2fa(verify_data: VerifyCodeRequest):
 # async def resend_verification_code(resend_data: ResendCodeRequest):
 #     """Resend verification or 2FA code."""
 #     try:
-#         if resend_data.email not in verification_codes:
+#         stored_data = await get_verification(resend_data.email)
+#         if stored_data is None:
 #             raise HTTPException(status_code=400, detail="No active verification for this email")
         
 #         # Generate new code
 #         new_code = generate_verification_code()
-#         stored_data = verification_codes[resend_data.email]
         
 #         # Update with new code and extended time
-#         verification_codes[resend_data.email] = {
-#             **stored_data,
-#             "code": new_code,
-#             "expires": datetime.utcnow() + timedelta(minutes=10)
-#         }
+#         await save_verification(resend_data.email, {**stored_data, "code": new_code})
         
 #         # Send new code
 #         email_sent = await send_verification_email(resend_data.email, new_code)
@@ -336,9 +322,8 @@ async def logout(user_id: str):
         session_ref = db_ref.child('user_sessions').child(user_id)
         session_ref.delete()
         
-        # Remove from memory
-        if user_id in user_sessions:
-            del user_sessions[user_id]
+        # Remove from Redis
+        await delete_session(user_id)
         
         return {"message": "Logged out successfully"}
         
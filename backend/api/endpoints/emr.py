@@ -2,10 +2,13 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 from services.extraction_service import parse_emr_with_gemini
 from services.timeline_service import extract_text_from_pdf
 from firebase_config import realtime_db
+from services.rtdb_budget import rtdb_budget
+from services.etag_service import invalidate_etags
 
 router = APIRouter()
 
 @router.post("/emr/upload-pdf/{patient_id}")
+@rtdb_budget(max_calls=2)
 async def upload_emr_pdf(patient_id: str, file: UploadFile = File(...)):
     """
     Accepts a patient's EMR PDF, extracts text, uses a specialized Gemini model
@@ -48,7 +51,9 @@ async def upload_emr_pdf(patient_id: str, file: UploadFile = File(...)):
             realtime_db.reference(f'users/{patient_id}').update(profile_data)
         if emr_data:
             realtime_db.reference(f'emr_records/{patient_id}').update(emr_data)
-            
+        # Don't wait for the change feed: the app re-fetches right after uploading
+        invalidate_etags(("patient_profile", "patient_emr"), patient_id)
+
         return {"status": "EMR uploaded and saved successfully.", "data": structured_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save data to database: {e}")
\ No newline at end of file
@@ -1,6 +1,12 @@
 # api/endpoints/organization.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from services.deep_agent_service import get_active_patients_for_org
+from services.matching_service import get_trial_candidates
+from services.org_summary_service import get_org_summary
+from services.rtdb_budget import rtdb_budget
+from services.change_feed import change_feed
+from services.live_updates import org_projection, org_snapshot, stream_changes
 
 router = APIRouter()
 
@@ -13,4 +19,47 @@ async def get_active_patients_endpoint(org_id: str):
         patient_list = await get_active_patients_for_org(org_id)
         return {"active_patients": patient_list}
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Failed to fetch active patients.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to fetch active patients.")
+
+@router.get("/org/{org_id}/summary")
+@rtdb_budget(max_calls=1)
+async def get_org_summary_endpoint(org_id: str):
+    """
+    Returns the org's dashboard aggregates: active patients per trial, the
+    currentStage distribution and checklist completion rates.
+    """
+    try:
+        summary = await get_org_summary(org_id)
+        return {"org_id": org_id, "summary": summary}
+    except Exception as e:
+        print(f"Error fetching summary for org {org_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch organization summary.")
+
+@router.get("/org/{org_id}/trials/{trial_id}/candidates")
+async def get_trial_candidates_endpoint(org_id: str, trial_id: str, limit: int = Query(50, ge=1, le=500)):
+    """
+    Ranks the org's patients who are eligible for one of its trials (conditions, age,
+    smoking, open capacity) and not already actively enrolled in it, for CRC screening.
+    """
+    try:
+        candidates = await get_trial_candidates(org_id, trial_id, limit)
+        return {"org_id": org_id, "trial_id": trial_id, "candidates": candidates}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to match candidates for trial.")
+
+@router.get("/org/{org_id}/events")
+async def stream_org_events(request: Request, org_id: str):
+    """
+    Server-sent events with this org's enrollment and dashboard summary
+    records: their current state on connect, then only the changed fields
+    as they change.
+    """
+    if not change_feed.running:
+        raise HTTPException(status_code=503, detail="Live updates are not available.")
+    return StreamingResponse(
+        stream_changes(org_projection(org_id), org_snapshot(org_id), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
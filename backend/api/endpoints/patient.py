@@ -1,11 +1,32 @@
 # api/endpoints/patient.py
-from fastapi import APIRouter, HTTPException
+import asyncio
+from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 # Import the new function from your service file
 from services.deep_agent_service import generate_personalized_timeline, get_patient_emr_for_dashboard, get_patient_profile_for_dashboard
+from services.rtdb_budget import rtdb_budget
+from services.etag_service import conditional_json
+from services.change_feed import change_feed
+from services.live_updates import patient_projection, patient_snapshot, stream_changes
+from services.matching_service import get_matching_trials_for_patient
+from services.checklist_service import apply_checklist_updates
+from services.dashboard_service import get_patient_dashboard
 
 router = APIRouter()
 
+class ChecklistItemUpdate(BaseModel):
+    stage: int = Field(ge=1)
+    # RTDB keys cannot contain . $ # [ ] /
+    item: str = Field(min_length=1, pattern=r"^[^.$#\[\]/]+$")
+    isComplete: bool
+
+class ChecklistBatchUpdate(BaseModel):
+    updates: List[ChecklistItemUpdate] = Field(min_length=1, max_length=200)
+
 @router.get("/patient/{patient_id}/personalized-timeline/{trial_id}")
+@rtdb_budget(max_calls=2)
 async def get_personalized_timeline_endpoint(patient_id: str, trial_id: str):
     """
     Generates and returns a personalized timeline and checklist for a specific
@@ -16,28 +37,90 @@ async def get_personalized_timeline_endpoint(patient_id: str, trial_id: str):
         raise HTTPException(status_code=404, detail=timeline["error"])
     return timeline
 
+@router.get("/patient/{patient_id}/dashboard")
+@rtdb_budget(max_calls=5)
+async def get_patient_dashboard_endpoint(patient_id: str):
+    """
+    Everything the patient dashboard shows in one round trip: profile, EMR
+    summary, active enrollment with its current stage and checklist, and a
+    slim list of available trials.
+    """
+    try:
+        return await get_patient_dashboard(patient_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"Error building dashboard for patient {patient_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch dashboard data.")
+
 @router.get("/patient/{patient_id}/emr")
-async def get_emr_for_patient_dashboard(patient_id: str):
+@rtdb_budget(max_calls=1)
+async def get_emr_for_patient_dashboard(request: Request, patient_id: str):
     """
     Fetches the EMR data for a specific patient to display on their dashboard.
     """
     try:
-        emr_data = await get_patient_emr_for_dashboard(patient_id)
-        return emr_data
+        return await conditional_json(request, ("patient_emr", patient_id),
+                                      lambda: get_patient_emr_for_dashboard(patient_id))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch EMR data.")
     
 @router.get("/patient/{patient_id}/profile")
-async def get_profile_for_patient_dashboard(patient_id: str):
+@rtdb_budget(max_calls=1)
+async def get_profile_for_patient_dashboard(request: Request, patient_id: str):
     """
     Fetches the PII profile data for a specific patient.
     """
     try:
-        profile_data = await get_patient_profile_for_dashboard(patient_id)
-        return profile_data
+        return await conditional_json(request, ("patient_profile", patient_id),
+                                      lambda: get_patient_profile_for_dashboard(patient_id))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to fetch profile data.")
+
+@router.get("/patient/{patient_id}/matching-trials")
+async def get_matching_trials_endpoint(patient_id: str, limit: int = Query(20, ge=1, le=100)):
+    """
+    Returns the open trials this patient is eligible for, best matches first.
+    """
+    try:
+        trials = await get_matching_trials_for_patient(patient_id, limit)
+        return {"matching_trials": trials}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception:
-        raise HTTPException(status_code=500, detail="Failed to fetch profile data.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to match trials for patient.")
+
+@router.patch("/patient/{patient_id}/checklist")
+@rtdb_budget(max_calls=4)
+async def update_checklist_endpoint(patient_id: str, request: ChecklistBatchUpdate):
+    """
+    Applies many checklist item updates to the patient's active enrollment in
+    one write, advancing currentStage when a stage's checklist is complete.
+    """
+    try:
+        entries = [(u.stage, u.item, u.isComplete) for u in request.updates]
+        return await asyncio.to_thread(apply_checklist_updates, patient_id, entries)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"Error updating checklist for patient {patient_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update checklist.")
+
+@router.get("/patient/{patient_id}/events")
+async def stream_patient_events(request: Request, patient_id: str):
+    """
+    Server-sent events with this patient's enrollment progress, stage,
+    profile and EMR summary records: their current state on connect, then
+    only the changed fields as they change.
+    """
+    if not change_feed.running:
+        raise HTTPException(status_code=503, detail="Live updates are not available.")
+    return StreamingResponse(
+        stream_changes(patient_projection(patient_id), patient_snapshot(patient_id), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
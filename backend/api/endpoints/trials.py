@@ -1,50 +1,74 @@
 # api/endpoints/trials.py
-from fastapi import APIRouter, HTTPException
-from services.deep_agent_service import get_available_trials
-from firebase_config import realtime_db
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from services.trials_service import ClinicalTrialsService
+from services.trial_summaries import get_trial_list, parse_fields
+from services.stage_service import get_trial_stages
+from services.rtdb_budget import rtdb_budget
+from services.etag_service import conditional_json
 
 router = APIRouter()
 
 @router.get("/trials/available")
-async def get_available_trials_endpoint():
+@rtdb_budget(max_calls=1)
+async def get_available_trials_endpoint(
+    request: Request,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_miles: Optional[float] = Query(None, gt=0),
+    fields: Optional[str] = Query(None, description="Comma-separated trial fields, or 'all'. Default: a summary without stages."),
+):
     """
     Fetches a list of all clinical trials that are currently active or recruiting.
+    With lat/lng, returns trials nearest-first with their computed distance,
+    limited to radius_miles when given. Without a radius, trials with no site
+    location are listed last, without a distance.
     """
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be provided together.")
+    selected = parse_fields(fields)
+
+    async def load():
+        return {"available_trials": await get_trial_list(selected, lat, lng, radius_miles)}
+
     try:
-        trials_list = await get_available_trials()
-        return {"available_trials": trials_list}
+        return await conditional_json(request, ("trials_available", lat, lng, radius_miles, selected), load)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch available trials.")
 
+@router.get("/trials/search")
+async def search_trials_endpoint(
+    q: str = "",
+    status: str = "All",
+    mode: str = Query("semantic", pattern="^(semantic|keyword)$"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Searches clinical trials. Semantic mode matches by meaning
+    (e.g. "high blood pressure" finds hypertension trials).
+    """
+    try:
+        trials = await ClinicalTrialsService.search_trials(q, status, mode=mode, limit=limit)
+        return {"trials": trials[:limit]}
+    except Exception as e:
+        print(f"Error searching trials: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search trials.")
+
 @router.get("/trials/{trial_id}/stages")
-async def get_trial_stages_endpoint(trial_id: str):
+@rtdb_budget(max_calls=1)
+async def get_trial_stages_endpoint(request: Request, trial_id: str):
     """
     Fetches the stages/timeline data for a specific clinical trial.
     """
-    try:
-        # Get the full trial data first
-        trial_ref = realtime_db.reference(f'trials/{trial_id}')
-        trial_data = trial_ref.get()
-        
-        if not trial_data:
-            raise HTTPException(status_code=404, detail=f"Trial {trial_id} not found")
-        
-        # Extract stages from the trial data
-        stages = trial_data.get('stages')
-        
+    async def load():
+        stages = await asyncio.to_thread(get_trial_stages, trial_id)
         if not stages:
             raise HTTPException(status_code=404, detail=f"No stages found for trial {trial_id}")
-        
-        # Convert array to object format if needed
-        if isinstance(stages, list):
-            # Filter out null values and convert to object format
-            stages_dict = {}
-            for i, stage in enumerate(stages):
-                if stage is not None:
-                    stages_dict[str(i)] = stage
-            stages = stages_dict
-        
         return {"stages": stages}
+
+    try:
+        return await conditional_json(request, ("trial_stages", trial_id), load)
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Checkpoint Serialization Benchmark
+
+Compares bytes stored and encode/decode time per agent turn for the blobs the
+Redis checkpointer writes as pending writes:
+- the saver's default serializer (JsonPlusRedisSerializer)
+- zstd compression (CompressedRedisSerializer)
+- zstd compression with a dictionary trained on sample turns
+
+Payloads are synthetic conversation turns shaped like real ones: a user
+question, a tool call returning a full EMR or trial snapshot, and an answer.
+Sizes are the base64 strings the saver actually stores in Redis.
+
+Usage:
+    python benchmarks/checkpoint_serde.py --turns 200
+    python benchmarks/checkpoint_serde.py --train-dict checkpoint.dict   # then set CHECKPOINT_ZSTD_DICT
+"""
+import argparse
+import base64
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer
+
+from services.checkpoint_serde import CompressedRedisSerializer, compressing_writes, train_dictionary
+
+CONDITIONS = ["Type 2 Diabetes Mellitus", "Hypertension", "Asthma", "Hyperlipidemia", "Early Alzheimer's"]
+MEDICATIONS = ["Metformin 500mg", "Lisinopril 10mg", "Albuterol inhaler", "Atorvastatin 20mg", "Donepezil 5mg"]
+
+
+def fake_emr(rng: random.Random) -> dict:
+    return {
+        "patientId": f"-N{rng.randrange(10**9):09d}",
+        "underlying_conditions": rng.sample(CONDITIONS, 2),
+        "prescriptions": [{"name": m.split()[0], "dosage": m.split()[1]} for m in rng.sample(MEDICATIONS, 2)],
+        "smoker_status": rng.choice(["Current Smoker", "Former Smoker", "Non-smoker"]),
+        "log": [
+            {
+                "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "type": rng.choice(["diagnosis", "medication", "lab", "visit"]),
+                "description": f"{rng.choice(CONDITIONS)} follow-up; {rng.choice(MEDICATIONS)} continued",
+                "provider": "Dr. Smith, Endocrinology"
+            }
+            for _ in range(rng.randint(5, 40))
+        ]
+    }
+
+
+def fake_trial(rng: random.Random) -> dict:
+    return {
+        "title": f"{rng.choice(['DIABETES-CARE', 'HYPERTENSION-NOVA', 'RESPIRATORY-WELLNESS'])}-{rng.randint(2024, 2027)}",
+        "status": rng.choice(["Recruiting", "Active"]),
+        "condition": rng.choice(CONDITIONS),
+        "stages": {
+            str(i): {
+                "name": f"Stage {i}",
+                "duration": f"{rng.randint(2, 24)} weeks",
+                "summary": "Initial screening, consent process, and baseline measurements",
+                "checklist": [f"Checklist item {j} for stage {i}" for j in range(rng.randint(4, 7))]
+            }
+            for i in range(1, 5)
+        }
+    }
+
+
+def fake_turn(rng: random.Random, index: int) -> list:
+    payload = fake_emr(rng) if index % 2 == 0 else fake_trial(rng)
+    call_id = f"call_{index}"
+    return [
+        HumanMessage(content="Give me a full summary for this patient.", id=f"h{index}"),
+        AIMessage(content="", tool_calls=[{"name": "get_patient_emr", "args": {"patient_id": "x"}, "id": call_id}], id=f"a{index}"),
+        ToolMessage(content=json.dumps(payload), tool_call_id=call_id, name="get_patient_emr", id=f"t{index}"),
+        AIMessage(content="Here is the summary of the patient's record and trial progress.", id=f"r{index}"),
+    ]
+
+
+def measure(name: str, serde, turns: list) -> dict:
+    sizes, encode_times, decode_times = [], [], []
+    for turn in turns:
+        start = time.perf_counter()
+        with compressing_writes():
+            blob = serde.dumps_typed(turn)
+        encode_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        serde.loads_typed(blob)
+        decode_times.append(time.perf_counter() - start)
+        sizes.append(len(base64.b64encode(blob[1])))
+    return {
+        "name": name,
+        "avg_bytes": statistics.mean(sizes),
+        "encode_us": statistics.mean(encode_times) * 1e6,
+        "decode_us": statistics.mean(decode_times) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark agent checkpoint serialization")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dict-size", type=int, default=64 * 1024)
+    parser.add_argument("--train-dict", help="Write the trained dictionary to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base = JsonPlusRedisSerializer()
+    training = [base.dumps_typed(fake_turn(rng, i))[1] for i in range(max(args.turns, 500))]
+    turns = [fake_turn(rng, i) for i in range(args.turns)]
+
+    dictionary = train_dictionary(training, args.dict_size)
+    if args.train_dict:
+        Path(args.train_dict).write_bytes(dictionary.as_bytes())
+        print(f"Wrote {len(dictionary.as_bytes())} byte dictionary (id {dictionary.dict_id()}) to {args.train_dict}")
+
+    results = [
+        measure("json", base, turns),
+        measure("json+zstd", CompressedRedisSerializer(), turns),
+        measure("json+zstd+dict", CompressedRedisSerializer(dictionaries=[dictionary]), turns),
+    ]
+
+    baseline = results[0]["avg_bytes"]
+    print(f"{'format':<20}{'bytes/turn':>12}{'ratio':>8}{'encode µs':>12}{'decode µs':>12}")
+    for r in results:
+        print(f"{r['name']:<20}{r['avg_bytes']:>12.0f}{baseline / r['avg_bytes']:>8.2f}{r['encode_us']:>12.1f}{r['decode_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
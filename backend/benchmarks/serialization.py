@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Response Serialization Benchmark
+
+Compares encode time and bytes on the wire for trial-list and EMR payloads:
+- the standard library json encoder (FastAPI's default path)
+- orjson
+- MessagePack
+each uncompressed, gzip-compressed and brotli-compressed. Encoders or
+encodings whose package is not installed are skipped.
+
+Payloads are shaped like the seeded data: trials with four stages of
+checklists, and EMRs with a growing visit log.
+
+Usage:
+    python benchmarks/serialization.py --trials 50 --log-entries 200
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from services import response_encoding
+from services.response_encoding import compress, encode_json, encode_msgpack
+
+CONDITIONS = ["Diabetes", "Hypertension", "Asthma", "Cardiovascular", "Alzheimer's", "Cancer", "Arthritis"]
+SITES = ["Emory University Hospital, Atlanta, GA", "Piedmont Atlanta Hospital, Atlanta, GA", "Grady Health System, Atlanta, GA"]
+
+
+def seeded_trial(rng: random.Random, index: int) -> dict:
+    condition = rng.choice(CONDITIONS)
+    return {
+        "id": f"-N{index:09d}",
+        "title": f"{condition.upper()}-STUDY-{2024 + index % 3}",
+        "status": rng.choice(["Recruiting", "Active"]),
+        "location": rng.choice(SITES),
+        "siteLocation": {"lat": 33.75 + rng.random() / 10, "lng": -84.39 + rng.random() / 10},
+        "description": f"A phase III trial evaluating a new treatment approach for {condition.lower()} patients "
+                       "with improved accuracy and continuous tracking capabilities.",
+        "sponsor": "Emory Healthcare",
+        "insurance": "Most Major Insurance Accepted",
+        "condition": condition,
+        "phases": "Phase III",
+        "estimatedDuration": "12 months",
+        "maxParticipants": 200,
+        "currentParticipants": rng.randint(0, 200),
+        "stages": {
+            str(i): {
+                "name": f"Stage {i}",
+                "duration": f"{rng.randint(2, 24)} weeks",
+                "summary": "Initial screening, consent process, and baseline measurements",
+                "checklist": [f"Complete study task {j} for stage {i} as instructed" for j in range(rng.randint(5, 7))],
+            }
+            for i in range(1, 5)
+        },
+    }
+
+
+def seeded_emr(rng: random.Random, log_entries: int) -> dict:
+    return {
+        "underlying_conditions": rng.sample(CONDITIONS, 2),
+        "prescriptions": [{"name": "Metformin", "dosage": "500mg"}, {"name": "Lisinopril", "dosage": "10mg"}],
+        "smoker_status": "Former Smoker",
+        "alcohol_usage": "Occasional",
+        "log": [
+            {
+                "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "type": rng.choice(["diagnosis", "medication", "lab", "visit"]),
+                "description": f"{rng.choice(CONDITIONS)} follow-up; blood pressure {rng.randint(110, 160)}/{rng.randint(70, 100)} mmHg",
+                "provider": "Dr. Smith, Endocrinology",
+            }
+            for _ in range(log_entries)
+        ],
+    }
+
+
+def stdlib_json(content) -> bytes:
+    # What FastAPI's JSONResponse does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def time_ms(func, payload, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run(name: str, payload, repeat: int):
+    encoders = [("json (stdlib)", stdlib_json)]
+    if response_encoding.orjson is not None:
+        encoders.append(("orjson", encode_json))
+    if response_encoding.msgpack is not None:
+        encoders.append(("msgpack", encode_msgpack))
+    encodings = ["gzip"] + (["br"] if response_encoding.brotli is not None else [])
+
+    print(f"\n{name}")
+    print(f"{'encoder':<16}{'encode ms':>10}{'bytes':>10}" + "".join(f"{e + ' bytes':>12}{e + ' ms':>10}" for e in encodings))
+    for label, encode in encoders:
+        body = encode(payload)
+        row = f"{label:<16}{time_ms(encode, payload, repeat):>10.3f}{len(body):>10}"
+        for encoding in encodings:
+            row += f"{len(compress(body, encoding)):>12}{time_ms(lambda b: compress(b, encoding), body, repeat):>10.3f}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--log-entries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    trials = {"available_trials": [seeded_trial(rng, i) for i in range(args.trials)]}
+    emr = seeded_emr(rng, args.log_entries)
+    run(f"/trials/available ({args.trials} trials)", trials, args.repeat)
+    run(f"/patient/{{id}}/emr ({args.log_entries} log entries)", emr, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
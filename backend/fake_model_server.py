@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Fake Model Server
+
+A local stand-in for the three model providers the backend talks to, so the
+timeline, extraction, personalization and agent paths can be exercised offline
+and benchmarked deterministically:
+
+- MedGemma (RunPod serverless):  POST /runsync
+- Gemini (REST):                 POST /v1beta/models/{model}:generateContent
+                                 POST /v1beta/models/{model}:streamGenerateContent
+- OpenAI:                        POST /v1/chat/completions (with "stream": true)
+
+Usage:
+    python fake_model_server.py --port 8001 --latency lognormal:median_ms=600,sigma=0.4 --error-rate 0.02 --seed 7
+
+Then point the backend at it:
+    MEDGEMMA_BASE_URL=http://localhost:8001  MEDGEMMA_API_KEY=fake
+    GEMINI_API_ENDPOINT=http://localhost:8001  GOOGLE_API_KEY=fake
+    OPENAI_BASE_URL=http://localhost:8001/v1  OPENAI_API_KEY=fake
+
+Latency specs:
+    fixed:ms=250
+    uniform:min_ms=100,max_ms=900
+    normal:mean_ms=500,stddev_ms=120
+    lognormal:median_ms=600,sigma=0.4
+
+A JSON config file (--config or FAKE_MODEL_CONFIG) can override settings per
+provider and add canned responses. Response text is a string.Template with
+$prompt, $prompt_chars, $model and $request_id available:
+
+    {
+      "seed": 7,
+      "latency": "fixed:ms=200",
+      "error_rate": 0.0,
+      "providers": {
+        "medgemma": {"latency": "lognormal:median_ms=1500,sigma=0.3"},
+        "openai": {"error_rate": 0.05, "error_statuses": [429, 500]}
+      },
+      "responses": [
+        {"provider": "openai", "match": "progress", "text": "Patient $request_id is on stage 2."}
+      ]
+    }
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+from string import Template
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PROVIDERS = ("medgemma", "gemini", "openai")
+
+DEFAULT_TIMELINE = {
+    "Stage 1": "Screening and informed consent.",
+    "Stage 2": "Baseline assessments and randomization.",
+    "Stage 3": "Treatment period with scheduled study visits.",
+    "Stage 4": "Follow-up and final assessments."
+}
+
+DEFAULT_EMR = {
+    "age": 52,
+    "gender_at_birth": "Female",
+    "underlying_conditions": ["Hypertension", "Type 2 Diabetes Mellitus"],
+    "prescriptions": [{"name": "Metformin", "dosage": "500mg twice daily"}],
+    "smoker_status": "Former Smoker",
+    "alcohol_usage": "Socially",
+    "pregnancy_status": "Not Applicable"
+}
+
+
+def parse_latency_spec(spec: str) -> dict:
+    """Parses 'kind:key=value,...' into a latency distribution dict."""
+    kind, _, params = spec.partition(":")
+    dist = {"kind": kind.strip() or "fixed"}
+    for pair in filter(None, params.split(",")):
+        key, _, value = pair.partition("=")
+        dist[key.strip()] = float(value)
+    if dist["kind"] not in ("fixed", "uniform", "normal", "lognormal"):
+        raise ValueError(f"Unknown latency distribution '{dist['kind']}'")
+    return dist
+
+
+def sample_latency_ms(dist: dict, rng: random.Random) -> float:
+    """Draws one latency sample (milliseconds) from a distribution dict."""
+    kind = dist["kind"]
+    if kind == "uniform":
+        return rng.uniform(dist.get("min_ms", 0.0), dist.get("max_ms", 0.0))
+    if kind == "normal":
+        return max(0.0, rng.gauss(dist.get("mean_ms", 0.0), dist.get("stddev_ms", 0.0)))
+    if kind == "lognormal":
+        median = max(dist.get("median_ms", 1.0), 1e-3)
+        return rng.lognormvariate(math.log(median), dist.get("sigma", 0.0))
+    return dist.get("ms", 0.0)
+
+
+class FakeModelSettings:
+    """Resolved server settings with per-provider overrides."""
+
+    def __init__(self, config: dict):
+        self.seed = int(config.get("seed", 0))
+        self.stream_chunk_chars = int(config.get("stream_chunk_chars", 24))
+        self.stream_chunk_delay_ms = float(config.get("stream_chunk_delay_ms", 20))
+        self.responses = config.get("responses", [])
+        self.providers = {}
+        for provider in PROVIDERS:
+            override = config.get("providers", {}).get(provider, {})
+            latency = override.get("latency", config.get("latency", "fixed:ms=0"))
+            self.providers[provider] = {
+                "latency": parse_latency_spec(latency) if isinstance(latency, str) else latency,
+                "error_rate": float(override.get("error_rate", config.get("error_rate", 0.0))),
+                "error_statuses": override.get("error_statuses", config.get("error_statuses", [500, 503])),
+            }
+
+
+class FakeModelBehavior:
+    """Decides latency, failures and response text for each request deterministically."""
+
+    def __init__(self, settings: FakeModelSettings):
+        self.settings = settings
+        self._counter = itertools.count()
+
+    def next_rng(self) -> tuple:
+        # One RNG per request keyed on (seed, request index) keeps runs reproducible
+        # regardless of how many random draws a single request makes.
+        index = next(self._counter)
+        return index, random.Random(f"{self.settings.seed}:{index}")
+
+    async def delay_and_maybe_fail(self, provider: str, rng: random.Random) -> Optional[int]:
+        cfg = self.settings.providers[provider]
+        await asyncio.sleep(sample_latency_ms(cfg["latency"], rng) / 1000.0)
+        if rng.random() < cfg["error_rate"]:
+            return int(rng.choice(cfg["error_statuses"]))
+        return None
+
+    def response_text(self, provider: str, prompt: str, model: str, request_id: str) -> str:
+        values = {"prompt": prompt, "prompt_chars": len(prompt), "model": model, "request_id": request_id}
+        for rule in self.settings.responses:
+            if rule.get("provider") not in (None, provider):
+                continue
+            if re.search(rule.get("match", ""), prompt, re.IGNORECASE | re.DOTALL):
+                text = rule.get("text")
+                if text is None:
+                    text = json.dumps(rule.get("json"))
+                return Template(text).safe_substitute(values)
+        return default_response_text(provider, prompt)
+
+
+def default_response_text(provider: str, prompt: str) -> str:
+    """Canned answers shaped like what each backend prompt asks for."""
+    if "Personalize this trial protocol" in prompt:
+        # Echo the protocol back so the caller gets the same structure it sent.
+        match = re.search(r"Generic Trial Protocol:\**\s*(\{.*\})", prompt, re.DOTALL)
+        if match:
+            try:
+                return json.dumps(json.loads(match.group(1)))
+            except ValueError:
+                pass
+        return json.dumps({"1": {"summary": "Personalized stage summary.", "checklist": []}})
+    if "sequential timeline" in prompt:
+        return json.dumps(DEFAULT_TIMELINE)
+    if "Electronic Medical Record" in prompt:
+        return json.dumps(DEFAULT_EMR)
+    if provider == "openai":
+        return "This is a response from the fake model server."
+    return json.dumps({})
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def chunk_text(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def create_app(settings: FakeModelSettings) -> FastAPI:
+    behavior = FakeModelBehavior(settings)
+    app = FastAPI(title="Fake Model Server")
+
+    async def sse(events):
+        for event in events:
+            await asyncio.sleep(settings.stream_chunk_delay_ms / 1000.0)
+            yield f"data: {event}\n\n"
+
+    # --- MedGemma (RunPod runsync wrapping an OpenAI completions route) ---
+    @app.post("/runsync")
+    async def medgemma_runsync(request: Request):
+        body = await request.json()
+        openai_input = body.get("input", {}).get("openai_input", {})
+        prompt = openai_input.get("prompt", "")
+        model = openai_input.get("model", "medgemma")
+        index, rng = behavior.next_rng()
+        job_id = f"fake-{index}"
+        status = await behavior.delay_and_maybe_fail("medgemma", rng)
+        if status:
+            return JSONResponse(status_code=status, content={"id": job_id, "status": "FAILED", "error": "Injected failure"})
+
+        text = behavior.response_text("medgemma", prompt, model, job_id)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {
+            "id": job_id,
+            "status": "COMPLETED",
+            "output": [{
+                "choices": [{"index": 0, "text": text, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }]
+        }
+
+    # --- Gemini REST ---
+    def gemini_prompt(body: dict) -> str:
+        parts = []
+        for content in body.get("contents", []):
+            parts.extend(part.get("text", "") for part in content.get("parts", []))
+        return "\n".join(parts)
+
+    def gemini_payload(text: str, prompt: str, finish: Optional[str]) -> dict:
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finish:
+            candidate["finishReason"] = finish
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {
+            "candidates": [candidate],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": completion_tokens,
+                "totalTokenCount": prompt_tokens + completion_tokens
+            }
+        }
+
+    def gemini_error(status: int) -> JSONResponse:
+        return JSONResponse(status_code=status, content={"error": {"code": status, "message": "Injected failure", "status": "UNAVAILABLE"}})
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def gemini_generate(model: str, request: Request):
+        body = await request.json()
+        prompt = gemini_prompt(body)
+        index, rng = behavior.next_rng()
+        status = await behavior.delay_and_maybe_fail("gemini", rng)
+        if status:
+            return gemini_error(status)
+        text = behavior.response_text("gemini", prompt, model, f"fake-{index}")
+        return gemini_payload(text, prompt, "STOP")
+
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def gemini_stream(model: str, request: Request):
+        body = await request.json()
+        prompt = gemini_prompt(body)
+        index, rng = behavior.next_rng()
+        status = await behavior.delay_and_maybe_fail("gemini", rng)
+        if status:
+            return gemini_error(status)
+        text = behavior.response_text("gemini", prompt, model, f"fake-{index}")
+        chunks = chunk_text(text, settings.stream_chunk_chars)
+        events = [
+            json.dumps(gemini_payload(chunk, prompt, "STOP" if i == len(chunks) - 1 else None))
+            for i, chunk in enumerate(chunks)
+        ]
+        return StreamingResponse(sse(events), media_type="text/event-stream")
+
+    # --- OpenAI chat completions ---
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-fake")
+        prompt = "\n".join(
+            m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+            for m in body.get("messages", [])
+        )
+        index, rng = behavior.next_rng()
+        completion_id = f"chatcmpl-fake-{index}"
+        status = await behavior.delay_and_maybe_fail("openai", rng)
+        if status:
+            return JSONResponse(status_code=status, content={"error": {"message": "Injected failure", "type": "server_error", "code": status}})
+
+        text = behavior.response_text("openai", prompt, model, completion_id)
+        created = int(time.time())
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+        if body.get("stream"):
+            base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+            events = [json.dumps({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})]
+            events += [
+                json.dumps({**base, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+                for chunk in chunk_text(text, settings.stream_chunk_chars)
+            ]
+            final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if body.get("stream_options", {}).get("include_usage"):
+                final["usage"] = usage
+            events += [json.dumps(final), "[DONE]"]
+            return StreamingResponse(sse(events), media_type="text/event-stream")
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    @app.get("/")
+    def root():
+        return {"message": "Fake model server is running"}
+
+    return app
+
+
+def load_config(args) -> dict:
+    config = {}
+    config_path = args.config or os.getenv("FAKE_MODEL_CONFIG")
+    if config_path:
+        with open(config_path) as f:
+            config = json.load(f)
+    # Command-line flags win over the config file.
+    if args.seed is not None:
+        config["seed"] = args.seed
+    if args.latency:
+        config["latency"] = args.latency
+    if args.error_rate is not None:
+        config["error_rate"] = args.error_rate
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake MedGemma/Gemini/OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--config", help="Path to a JSON config file")
+    parser.add_argument("--latency", help="Latency spec, e.g. lognormal:median_ms=600,sigma=0.4")
+    parser.add_argument("--error-rate", type=float, help="Fraction of requests that fail (0-1)")
+    parser.add_argument("--seed", type=int, help="Seed for latency and failure sampling")
+    args = parser.parse_args()
+
+    app = create_app(FakeModelSettings(load_config(args)))
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+- WEB_CONCURRENCY workers (default: one per core) each run their own event
+  loop, so throughput scales with cores. State shared between requests lives
+  in RTDB and Redis; in-process caches are per worker and kept coherent by
+  each worker's change-feed listener.
+- The app is imported once in the master before forking (preload_app), so
+  workers start fast and share the imported code pages. Network clients
+  (Redis, aiohttp, OpenAI, the change-feed listener) are only opened after the
+  fork, by each worker's warm-up.
+- On SIGTERM workers stop accepting connections, finish in-flight requests
+  for up to GRACEFUL_TIMEOUT seconds, then run the lifespan shutdown that
+  closes their pools. Long-lived event streams are cut at the deadline and
+  the app reconnects.
+"""
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+# Worker heartbeat timeout; model-backed requests await I/O and do not block it.
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE_SECONDS", "5"))
+
+# Recycle workers now and then so slow leaks cannot accumulate; jitter keeps
+# them from restarting all at once.
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
@@ -1,7 +1,20 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 import firebase_config
+from services.metrics_service import MetricsMiddleware, instrument_rtdb, render_metrics
+from services.rtdb_budget import RtdbBudgetMiddleware
+from services.admission_control import AdmissionControlMiddleware
+from services.response_encoding import CompressionMiddleware, FastJSONResponse
+from services.warmup_service import readiness, run_warmups
+from services.deep_agent_service import close_agent_resources
+from services.redis_service import close_redis
+from services.timeline_service import close_medgemma_client
+from services.change_feed import change_feed
 
 # We will create these files in the next steps
 #add back in timeline_service
@@ -9,12 +22,43 @@ from api.endpoints import agent, auth, timeline, patient, organization, trials,
 
 load_dotenv()
 
+# --- 1. LIFESPAN ---
+# Warm-up runs in the background so liveness answers immediately, while
+# /health/ready stays 503 until connections are open and caches are loaded.
+# Warm-up also starts the RTDB change feed that keeps those caches current.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(run_warmups())
+    yield
+    # Shutdown runs once in-flight requests have drained (bounded by the
+    # server's graceful timeout); then every pool this worker opened is closed.
+    warmup_task.cancel()
+    change_feed.stop()
+    await close_agent_resources()
+    await close_medgemma_client()
+    await close_redis()
+
 app = FastAPI(
     title="Clinical Trial Unified API",
-    description="A single API for all clinical trial services"
+    description="A single API for all clinical trial services",
+    lifespan=lifespan,
+    # orjson encoding, or MessagePack for clients that send Accept: application/msgpack
+    default_response_class=FastJSONResponse,
 )
 
-# --- 2. INCLUDE ROUTERS ---
+# --- 2. INSTRUMENTATION ---
+# Per-route latency/in-flight metrics and RTDB call timing, served at /metrics.
+# RtdbBudgetMiddleware counts RTDB round trips per request and flags N+1 loops.
+instrument_rtdb()
+app.add_middleware(RtdbBudgetMiddleware)
+# Concurrency and per-user rate limits for model-backed routes; shed requests
+# still show up in the latency metrics.
+app.add_middleware(AdmissionControlMiddleware)
+app.add_middleware(MetricsMiddleware)
+# Outermost, so every response (errors included) is negotiated and compressed.
+app.add_middleware(CompressionMiddleware)
+
+# --- 3. INCLUDE ROUTERS ---
 # This step makes the endpoints defined in other files part of the main application.
 # We add a '/api' prefix to keep all routes organized.
 app.include_router(agent.router, prefix="/api", tags=["Conversational Agent"])
@@ -30,8 +74,28 @@ app.include_router(emr.router, prefix="/api", tags=["EMR"])
 def root():
     return {"message": "Welcome to the Clinical Trial Unified API"}
 
+@app.get("/health/live", include_in_schema=False)
+def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready", include_in_schema=False)
+def health_ready():
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
+# Prometheus-format metrics for dashboards and alerting
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    return render_metrics()
+
 
-# --- 3. RUNNER ---
-# This allows running the server directly with `python main.py`
+# --- 4. RUNNER ---
+# This allows running the server directly with `python main.py` (development).
+# Production runs several workers under gunicorn: `gunicorn -c gunicorn.conf.py main:app`
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
\ No newline at end of file
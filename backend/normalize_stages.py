@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Stage Normalization Script
+
+One-time migration of trial stages into the canonical form read by
+services/stage_service.py:
+    trials/{trial_id}/stages = {"1": {"name", "duration", "summary", "checklist"}, ...}
+
+- Rewrites stages stored in other shapes ({"Stage 1": "summary"} timelines,
+  entries without a stage number, stray nulls) in place.
+- Folds stages saved under the legacy clinicalTrials/{trial_id}/stages node
+  into the trial; fields already on the trial's stage win.
+- Rebuilds trial summaries when anything changed, so stage counts stay right.
+
+Usage:
+    python normalize_stages.py [--dry-run] [--drop-legacy]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+# Import Firebase configuration
+import firebase_config
+from firebase_admin import db as realtime_db
+from services.stage_service import canonical_stages
+from services.trial_summaries import rebuild_trial_summaries
+
+LEGACY_ROOT = "clinicalTrials"
+
+
+def as_stored(stages):
+    """What RTDB actually holds: lists come back for sequential numeric keys."""
+    if isinstance(stages, list):
+        return {str(i): s for i, s in enumerate(stages) if s is not None}
+    return stages or {}
+
+
+def normalized_stages(trial: dict, legacy: dict) -> dict:
+    stages = canonical_stages(trial.get("stages"))
+    for key, stage in canonical_stages(legacy.get("stages") if isinstance(legacy, dict) else None).items():
+        stages[key] = {**stage, **stages.get(key, {})}
+    return {key: stages[key] for key in sorted(stages, key=int)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--drop-legacy", action="store_true", help=f"Delete the {LEGACY_ROOT} node afterwards")
+    args = parser.parse_args()
+
+    print("🔧 Normalizing trial stages")
+    trials = realtime_db.reference('trials').get() or {}
+    legacy = realtime_db.reference(LEGACY_ROOT).get() or {}
+
+    updates = {}
+    for trial_id, trial in trials.items():  # type: ignore
+        if not isinstance(trial, dict):
+            continue
+        stages = normalized_stages(trial, legacy.get(trial_id))  # type: ignore
+        if stages != as_stored(trial.get("stages")):
+            updates[f"{trial_id}/stages"] = stages
+            print(f"   ↻ {trial_id}: {len(stages)} stage(s)")
+
+    orphans = [trial_id for trial_id in legacy if trial_id not in trials]  # type: ignore
+    for trial_id in orphans:
+        print(f"   ⚠️  {LEGACY_ROOT}/{trial_id} has no matching trial; left as is")
+
+    if not updates:
+        print("✅ All stages are already canonical")
+    elif args.dry_run:
+        print(f"ℹ️  Dry run: {len(updates)} trial(s) would be rewritten")
+    else:
+        # One multi-path write for every trial that changed
+        realtime_db.reference('trials').update(updates)
+        rebuild_trial_summaries()
+        print(f"✅ Rewrote stages for {len(updates)} trial(s) and rebuilt trial summaries")
+
+    if args.drop_legacy and legacy and not args.dry_run:
+        if orphans:
+            print(f"❌ Not dropping {LEGACY_ROOT}: it still holds stages for unknown trials")
+            sys.exit(1)
+        realtime_db.reference(LEGACY_ROOT).delete()
+        print(f"🗑️  Deleted {LEGACY_ROOT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,8 @@ sys.path.insert(0, str(backend_dir))
 # Import Firebase configuration
 import firebase_config
 from firebase_admin import db as realtime_db
+from services.org_summary_service import recompute_org_summaries
+from services.trial_summaries import rebuild_trial_summaries
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt."""
@@ -337,8 +339,8 @@ def seed_trials():
         {
             'title': 'DIABETES-CARE-2025',
             'status': 'Recruiting',
-            'distance': '2.3 miles',
             'location': 'Emory University Hospital, Atlanta, GA',
+            'siteLocation': {'lat': 33.7925, 'lng': -84.3239},
             'description': 'A phase III trial evaluating a new glucose monitoring system for Type 2 diabetes patients with improved accuracy and continuous tracking capabilities.',
             'sponsor': 'Emory Healthcare',
             'insurance': 'Most Major Insurance Accepted',
@@ -403,8 +405,8 @@ def seed_trials():
         {
             'title': 'HYPERTENSION-NOVA Study',
             'status': 'Active',
-            'distance': '5.7 miles',
             'location': 'Piedmont Atlanta Hospital, Atlanta, GA',
+            'siteLocation': {'lat': 33.809, 'lng': -84.3943},
             'description': 'Study comparing effectiveness of combination therapy versus traditional treatment approaches for managing hypertension in adults aged 30-65.',
             'sponsor': 'Piedmont Healthcare',
             'insurance': 'Medicare, Medicaid, Private',
@@ -469,8 +471,8 @@ def seed_trials():
         {
             'title': 'RESPIRATORY-WELLNESS Initiative',
             'status': 'Recruiting',
-            'distance': '8.2 miles',
             'location': 'Children\'s Healthcare of Atlanta, Atlanta, GA',
+            'siteLocation': {'lat': 33.794, 'lng': -84.3197},
             'description': 'Research on personalized asthma management using AI-powered inhaler technology and environmental monitoring for better outcomes.',
             'sponsor': 'Children\'s Healthcare of Atlanta',
             'insurance': 'All Insurance Plans Accepted',
@@ -524,8 +526,8 @@ def seed_trials():
         {
             'title': 'CARDIO-PROTECT Trial',
             'status': 'Active',
-            'distance': '12.1 miles',
             'location': 'Northside Hospital, Atlanta, GA',
+            'siteLocation': {'lat': 33.9104, 'lng': -84.3534},
             'description': 'Phase II study investigating novel cardiac protection strategies for patients undergoing major cardiovascular procedures.',
             'sponsor': 'Northside Hospital',
             'insurance': 'Private Insurance Only',
@@ -571,8 +573,8 @@ def seed_trials():
         {
             'title': 'ALZHEIMER-PREVENTION Study',
             'status': 'Recruiting',
-            'distance': '15.4 miles',
             'location': 'Georgia Institute of Technology, Atlanta, GA',
+            'siteLocation': {'lat': 33.7756, 'lng': -84.3963},
             'description': 'Longitudinal study examining early intervention strategies for cognitive decline prevention in at-risk populations aged 55+.',
             'sponsor': 'Georgia Tech Research Institute',
             'insurance': 'Medicare, Private Insurance',
@@ -619,8 +621,8 @@ def seed_trials():
         {
             'title': 'CANCER-IMMUNOTHERAPY Trial',
             'status': 'Active',
-            'distance': '3.8 miles',
             'location': 'Winship Cancer Institute, Atlanta, GA',
+            'siteLocation': {'lat': 33.7932, 'lng': -84.32},
             'description': 'Phase I/II trial testing combination immunotherapy approaches for advanced solid tumors with promising early results.',
             'sponsor': 'Winship Cancer Institute',
             'insurance': 'All Major Insurance Plans',
@@ -666,8 +668,8 @@ def seed_trials():
         {
             'title': 'MENTAL-HEALTH Digital Study',
             'status': 'Recruiting',
-            'distance': '6.9 miles',
             'location': 'Grady Health System, Atlanta, GA',
+            'siteLocation': {'lat': 33.7522, 'lng': -84.3817},
             'description': 'Evaluating effectiveness of digital therapeutic interventions for anxiety and depression management in primary care settings.',
             'sponsor': 'Grady Health System',
             'insurance': 'Medicaid, Sliding Scale',
@@ -714,8 +716,8 @@ def seed_trials():
         {
             'title': 'ARTHRITIS-RELIEF Protocol',
             'status': 'Completed',
-            'distance': '9.7 miles',
             'location': 'Atlanta Medical Center, Atlanta, GA',
+            'siteLocation': {'lat': 33.7625, 'lng': -84.3737},
             'description': 'Recently completed study on non-pharmaceutical pain management techniques for rheumatoid arthritis patients.',
             'sponsor': 'Atlanta Medical Center',
             'insurance': 'Results Available to All',
@@ -964,6 +966,14 @@ def main():
     if not seed_enrollments(user_ids, trial_ids, org_ids):
         print("❌ Failed to seed enrollments. Aborting.")
         sys.exit(1)
+
+    try:
+        rebuild_trial_summaries()
+        recompute_org_summaries()
+        print("✅ Trial summaries and org dashboard summaries computed")
+    except Exception as e:
+        print(f"❌ Error computing summaries: {e}")
+        sys.exit(1)
     
     # Verify all data
     if verify_all_data():
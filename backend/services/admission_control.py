@@ -0,0 +1,222 @@
+# services/admission_control.py
+"""
+Admission control for model-backed routes.
+
+Agent turns, document parsing and personalized timelines each take seconds
+of model time, while list and profile reads take milliseconds on the same
+worker. Each expensive route class gets:
+
+- a concurrency limit per worker, with a bounded FIFO queue in front of it.
+  A request that finds the queue full, or waits past the class's deadline,
+  gets a 503.
+- a per-user token bucket (shared by all workers through Redis). A user over
+  their rate gets a 429.
+
+Users are identified by a valid bearer token when one is sent. The app does
+not send one yet, so otherwise the bucket is keyed on the patient the route
+acts for (the agent thread id, which the app sets to the patient id, or the
+patient id in the path). Only routes with neither (timeline parsing from a
+PDF or text) fall back to the client address; behind a proxy or NAT every
+client shares that address, and so one bucket. Path ids are chosen by the
+client, so these buckets give fairness between patients, not protection
+from a hostile client; the concurrency limits bound total load either way.
+
+Both rejections are immediate and carry Retry-After. Routes outside these
+classes are never queued or limited, so cheap reads keep their latency while
+model-heavy load is shed.
+
+Limits are configured per class, e.g. ADMISSION_AGENT_CONCURRENCY,
+ADMISSION_AGENT_QUEUE, ADMISSION_AGENT_QUEUE_TIMEOUT_SECONDS,
+ADMISSION_AGENT_RATE_PER_MINUTE and ADMISSION_AGENT_BURST.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+import jwt
+
+from services.metrics_service import admission_queue_depth, admission_rejections
+from services.redis_service import get_redis
+from services.response_encoding import FastJSONResponse
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
+
+# Seeds the service-time estimate behind Retry-After until real timings exist
+INITIAL_SERVICE_SECONDS = 5.0
+SERVICE_TIME_SMOOTHING = 0.2
+
+# Atomically refills and takes one token: returns {allowed, seconds until a token is available}
+_TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed, wait = 0, (1 - tokens) / rate
+if tokens >= 1 then
+  tokens, allowed, wait = tokens - 1, 1, 0
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def _env(name: str, key: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{name.upper()}_{key}", str(default)))
+
+
+@dataclass
+class RouteClass:
+    name: str
+    pattern: re.Pattern
+    concurrency: int
+    max_queue: int
+    queue_timeout: float
+    rate_per_minute: float
+    burst: float
+    waiting: int = 0
+    service_seconds: float = INITIAL_SERVICE_SECONDS
+    _slots: Optional[asyncio.Semaphore] = field(default=None, repr=False)
+
+    @classmethod
+    def from_env(cls, name: str, pattern: str, concurrency: int, max_queue: int, queue_timeout: float,
+                 rate_per_minute: float, burst: float) -> "RouteClass":
+        return cls(
+            name=name,
+            pattern=re.compile(pattern),
+            concurrency=int(_env(name, "CONCURRENCY", concurrency)),
+            max_queue=int(_env(name, "QUEUE", max_queue)),
+            queue_timeout=_env(name, "QUEUE_TIMEOUT_SECONDS", queue_timeout),
+            rate_per_minute=_env(name, "RATE_PER_MINUTE", rate_per_minute),
+            burst=_env(name, "BURST", burst),
+        )
+
+    def _retry_after(self) -> float:
+        # Roughly how long until the requests ahead of a new one have been served
+        return self.service_seconds * (self.waiting + 1) / self.concurrency
+
+    async def acquire(self):
+        """Takes a concurrency slot, queueing up to max_queue requests for at most queue_timeout seconds."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if self.waiting >= self.max_queue:
+            raise AdmissionRejected(503, f"Too many {self.name} requests in progress; try again shortly.",
+                                    self._retry_after())
+        self.waiting += 1
+        admission_queue_depth.set(self.name, value=self.waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(503, f"Timed out waiting for a {self.name} slot; try again shortly.",
+                                    self._retry_after())
+        finally:
+            self.waiting -= 1
+            admission_queue_depth.set(self.name, value=self.waiting)
+
+    def release(self, service_seconds: float):
+        self.service_seconds += SERVICE_TIME_SMOOTHING * (service_seconds - self.service_seconds)
+        self._slots.release()  # type: ignore
+
+
+ROUTE_CLASSES: Tuple[RouteClass, ...] = (
+    # (?P<patient>...) captures the patient a request acts for, see client_identity()
+    RouteClass.from_env("agent", r"^/api/agent/invoke/(?P<patient>[^/]+)$",
+                        concurrency=8, max_queue=32, queue_timeout=20, rate_per_minute=20, burst=5),
+    RouteClass.from_env("documents", r"^/api/(timeline/from-(pdf|text)|emr/upload-pdf/(?P<patient>[^/]+))$",
+                        concurrency=2, max_queue=8, queue_timeout=30, rate_per_minute=6, burst=3),
+    RouteClass.from_env("personalization", r"^/api/patient/(?P<patient>[^/]+)/personalized-timeline/[^/]+$",
+                        concurrency=4, max_queue=16, queue_timeout=20, rate_per_minute=10, burst=3),
+)
+
+
+def route_class_for(path: str) -> Optional[RouteClass]:
+    for route_class in ROUTE_CLASSES:
+        if route_class.pattern.match(path):
+            return route_class
+    return None
+
+
+def client_identity(scope, route_class: RouteClass) -> str:
+    """
+    The signed-in user when the request carries a valid bearer token, else the
+    patient in the path, else (routes without one) the client address.
+    """
+    headers = dict(scope.get("headers", []))
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization.lower().startswith("bearer "):
+        try:
+            return f"user:{jwt.decode(authorization[7:], JWT_SECRET, algorithms=['HS256'])['user_id']}"
+        except Exception:
+            pass
+    match = route_class.pattern.match(scope["path"])
+    patient = match.groupdict().get("patient") if match else None
+    if patient:
+        return f"patient:{patient}"
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+async def check_rate_limit(route_class: RouteClass, identity: str):
+    """Takes a token from the user's bucket for this class; raises a 429 rejection when it is empty."""
+    if route_class.rate_per_minute <= 0:
+        return
+    try:
+        allowed, wait = await get_redis().eval(
+            _TOKEN_BUCKET_SCRIPT, 1, f"ratelimit:{route_class.name}:{identity}",
+            route_class.rate_per_minute / 60, route_class.burst, time.time(),
+        )
+    except Exception as e:
+        # Rate limits fail open: a Redis outage must not take the model routes down with it
+        print(f"Rate limit check failed for {route_class.name}: {e}")
+        return
+    if not int(allowed):
+        raise AdmissionRejected(429, f"Rate limit exceeded for {route_class.name} requests.", float(wait))
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying the route-class limits; other routes pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = route_class_for(scope["path"]) if scope["type"] == "http" and ADMISSION_ENABLED else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await check_rate_limit(route_class, client_identity(scope, route_class))
+            await route_class.acquire()
+        except AdmissionRejected as rejected:
+            admission_rejections.inc(route_class.name, str(rejected.status_code))
+            response = FastJSONResponse(
+                {"detail": rejected.detail},
+                status_code=rejected.status_code,
+                headers={"Retry-After": str(rejected.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.release(time.perf_counter() - start)
@@ -0,0 +1,52 @@
+# services/auth_store.py
+"""
+Short-lived authentication state, kept in Redis so every server worker sees it.
+
+A verification code issued by one worker has to be checked by whichever
+worker receives the follow-up request, so codes, issued sign-up codes and
+session markers cannot live in module globals. Every key expires on its own
+through a Redis TTL.
+"""
+import json
+import os
+from typing import Dict, Optional
+
+from services.redis_service import get_redis
+
+VERIFICATION_CODE_TTL_SECONDS = int(os.getenv("VERIFICATION_CODE_TTL_SECONDS", "600"))
+SIGNUP_CODE_TTL_SECONDS = int(os.getenv("SIGNUP_CODE_TTL_SECONDS", str(30 * 24 * 3600)))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+_PREFIX = "auth"
+
+
+async def claim_signup_code(code: str, org_id: str) -> bool:
+    """Records a newly generated sign-up code; False if the code was already issued."""
+    return bool(await get_redis().set(f"{_PREFIX}:signup_code:{code}", org_id, nx=True, ex=SIGNUP_CODE_TTL_SECONDS))
+
+
+async def save_verification(email: str, data: Dict, ttl_seconds: int = VERIFICATION_CODE_TTL_SECONDS):
+    await get_redis().set(f"{_PREFIX}:verification:{email}", json.dumps(data), ex=ttl_seconds)
+
+
+async def update_verification(email: str, data: Dict):
+    """Rewrites a pending verification without extending its expiry."""
+    await get_redis().set(f"{_PREFIX}:verification:{email}", json.dumps(data), keepttl=True, xx=True)
+
+
+async def get_verification(email: str) -> Optional[Dict]:
+    """The pending verification for this email, or None (never issued, used or expired)."""
+    raw = await get_redis().get(f"{_PREFIX}:verification:{email}")
+    return json.loads(raw) if raw else None
+
+
+async def delete_verification(email: str):
+    await get_redis().delete(f"{_PREFIX}:verification:{email}")
+
+
+async def save_session(user_id: str, token: str, ttl_seconds: int = SESSION_TTL_SECONDS):
+    await get_redis().set(f"{_PREFIX}:session:{user_id}", token, ex=ttl_seconds)
+
+
+async def delete_session(user_id: str):
+    await get_redis().delete(f"{_PREFIX}:session:{user_id}")
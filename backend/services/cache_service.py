@@ -0,0 +1,70 @@
+# services/cache_service.py
+"""
+Small in-process caches shared by the service layer.
+
+Hits and misses are reported to the metrics registry under the cache's name.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from services.metrics_service import record_cache_lookup
+
+
+class TTLCache:
+    """A thread-safe key/value cache whose entries expire after ttl_seconds (None = never)."""
+
+    def __init__(self, name: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, stored_at: float) -> bool:
+        return self.ttl_seconds is None or time.monotonic() - stored_at < self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and self._fresh(entry[0])
+        record_cache_lookup(self.name, hit)
+        return entry[1] if hit else default  # type: ignore
+
+    def contains(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._fresh(entry[0])
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            if self.max_entries and key not in self._entries and len(self._entries) >= self.max_entries:
+                # Evict the oldest entry; insertion order doubles as age order.
+                self._entries.pop(next(iter(self._entries)))
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic(), value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and self._fresh(entry[0])
+        record_cache_lookup(self.name, hit)
+        if hit:
+            return entry[1]  # type: ignore
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        """Drops every entry whose key matches predicate."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,183 @@
+# services/change_feed.py
+"""
+Live change feed from the Realtime Database.
+
+One streaming listener per watched root (trials, enrollments, users, EMRs,
+org summaries) keeps an
+in-memory mirror of that root and turns each put/patch event into Change
+records with the record's full current value. Writes from anywhere (API
+workers, agent tools, the seeder) arrive within about a second.
+
+Services register @on_change(root) handlers to patch their caches and indexes
+in place; transient consumers (e.g. streaming endpoints) use subscribe().
+Handlers run on the listener thread and must not block.
+
+Fields listed in MIRROR_PRIVATE_FIELDS (password hashes) are stripped before
+records enter the mirror, so they are never held in memory or handed to
+handlers.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from firebase_config import realtime_db
+from services.metrics_service import change_feed_events
+from services.warmup_service import register_warmup
+
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "1") == "1"
+CHANGE_FEED_ROOTS = tuple(r for r in os.getenv(
+    "CHANGE_FEED_ROOTS", "trials,enrollments,users,emr_records,orgSummaries").split(",") if r)
+# Caches kept current by the feed only fall back to a reload after this long
+CHANGE_FEED_CACHE_TTL_SECONDS = float(os.getenv("CHANGE_FEED_CACHE_TTL_SECONDS", "3600"))
+MIRROR_PRIVATE_FIELDS = {"users": ("password",)}
+
+
+@dataclass
+class Change:
+    root: str
+    # None when the whole root was (re)loaded, e.g. the listener's initial snapshot
+    key: Optional[str]
+    # The record after the change (None = deleted), or the whole root when key is None.
+    # Records are never mutated afterwards; the whole-root value is the live mirror,
+    # so handlers should not keep a reference to it.
+    value: Any
+    # The record before the change (None = it did not exist, or a whole-root change)
+    previous: Any = None
+
+
+ChangeHandler = Callable[[Change], None]
+
+_handlers: Dict[str, List[ChangeHandler]] = {}
+
+
+def on_change(root: str):
+    """Registers a handler for every change under a watched root."""
+    def decorator(func: ChangeHandler) -> ChangeHandler:
+        _handlers.setdefault(root, []).append(func)
+        return func
+    return decorator
+
+
+def _set_path(container: Any, parts: List[str], value: Any) -> Any:
+    """
+    Returns a copy of container with the nested value at parts set (or deleted,
+    for None). Copy-on-write, so values already handed to handlers never change.
+    """
+    if not parts:
+        return value
+    if isinstance(container, list):
+        # RTDB serves integer-keyed maps as lists; convert so any key can be set
+        container = {str(i): v for i, v in enumerate(container) if v is not None}
+    container = dict(container) if isinstance(container, dict) else {}
+    head, rest = parts[0], parts[1:]
+    child = _set_path(container.get(head), rest, value)
+    if child is None:
+        container.pop(head, None)
+    else:
+        container[head] = child
+    return container or None
+
+
+def _strip_private(root: str, record: Any) -> Any:
+    private = MIRROR_PRIVATE_FIELDS.get(root)
+    if not private or not isinstance(record, dict) or not any(f in record for f in private):
+        return record
+    return {k: v for k, v in record.items() if k not in private}
+
+
+class ChangeFeed:
+    def __init__(self, roots: Iterable[str] = CHANGE_FEED_ROOTS):
+        self.roots = tuple(roots)
+        self.mirror: Dict[str, Dict] = {root: {} for root in self.roots}
+        self.running = False
+        self._registrations: list = []
+        self._subscribers: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Opens one streaming listener per root. Blocking; run it off the event loop."""
+        if self.running or not CHANGE_FEED_ENABLED:
+            return
+        for root in self.roots:
+            self._registrations.append(
+                realtime_db.reference(root).listen(lambda event, root=root: self._on_event(root, event))
+            )
+        self.running = True
+        print(f"Change feed listening on: {', '.join(self.roots)}")
+
+    def stop(self):
+        for registration in self._registrations:
+            try:
+                registration.close()
+            except Exception as e:
+                print(f"Error closing change-feed listener: {e}")
+        self._registrations = []
+        self.running = False
+
+    def subscribe(self, callback: ChangeHandler, roots: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """Adds a subscriber for the given roots (default all); returns a function that removes it."""
+        entry = (callback, set(roots) if roots else None)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def snapshot(self, root: str) -> Dict:
+        """A consistent shallow copy of one root's mirror (records themselves are never mutated)."""
+        with self._lock:
+            return dict(self.mirror.get(root) or {})
+
+    def _on_event(self, root: str, event) -> None:
+        change_feed_events.inc(root, event.event_type)
+        parts = [p for p in (event.path or "/").split("/") if p]
+        data = event.data
+        if event.event_type == "put":
+            writes = [(parts, data)]
+        elif event.event_type == "patch" and isinstance(data, dict):
+            writes = [(parts + child.split("/"), value) for child, value in data.items()]
+        else:
+            return
+
+        with self._lock:
+            mirror = self.mirror[root]
+            if not parts and event.event_type == "put":
+                # Initial snapshot (or the whole root replaced)
+                data = data if isinstance(data, dict) else {}
+                self.mirror[root] = mirror = {key: _strip_private(root, record) for key, record in data.items()}
+                changes = [Change(root, None, mirror)]
+            else:
+                previous: Dict[str, Any] = {}
+                for path, value in writes:
+                    key, rest = path[0], path[1:]
+                    previous.setdefault(key, mirror.get(key))
+                    record = _strip_private(root, _set_path(mirror.get(key), rest, value))
+                    if record is None:
+                        mirror.pop(key, None)
+                    else:
+                        mirror[key] = record
+                changes = [Change(root, key, mirror.get(key), before) for key, before in previous.items()]
+            subscribers = [cb for cb, roots in self._subscribers if roots is None or root in roots]
+        for change in changes:
+            self._dispatch(change, _handlers.get(root, []) + subscribers)
+
+    @staticmethod
+    def _dispatch(change: Change, callbacks: List[ChangeHandler]):
+        for callback in callbacks:
+            try:
+                callback(change)
+            except Exception as e:
+                print(f"Change-feed handler {getattr(callback, '__name__', callback)} failed for "
+                      f"{change.root}/{change.key or ''}: {e}")
+
+
+change_feed = ChangeFeed()
+
+
+@register_warmup("change_feed")
+def start_change_feed():
+    change_feed.start()
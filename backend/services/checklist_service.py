@@ -0,0 +1,85 @@
+# services/checklist_service.py
+"""
+Checklist progress updates for a patient's active enrollment.
+
+Any number of (stage, item, is_complete) entries are applied in one
+transaction on enrollments/{key}, together with the recomputed currentStage,
+so the progress and stage never disagree and concurrent updates to the same
+enrollment are never lost. The enrollment is found with an indexed
+query on patientId (needs ".indexOn": ["patientId", "trialId"] on
+enrollments in the database rules) instead of downloading every enrollment.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from firebase_config import realtime_db
+from services.org_summary_service import apply_enrollment_delta
+from services.stage_service import get_trial_stages, stage_checklists
+
+# Characters RTDB does not allow in keys
+_INVALID_KEY_CHARS = set(".$#[]/")
+
+ChecklistUpdate = Tuple[int, str, bool]
+
+
+def find_active_enrollment(patient_id: str) -> Optional[Tuple[str, Dict]]:
+    """Returns (enrollment_key, enrollment) for the patient's active enrollment, or None."""
+    matches = realtime_db.reference('enrollments').order_by_child('patientId').equal_to(patient_id).get() or {}
+    for key, enrollment in matches.items():  # type: ignore
+        if enrollment.get("isActive") is True:
+            return key, enrollment
+    return None
+
+
+def advance_stage(current_stage: int, progress: Dict, checklists: Dict[int, List[str]]) -> int:
+    """Moves past every consecutive stage whose protocol checklist is fully complete. Never moves back."""
+    stage = current_stage
+    while stage + 1 in checklists:
+        items = checklists.get(stage) or []
+        done = progress.get(f"stage{stage}") or {}
+        if not items or not all(done.get(item) is True for item in items):
+            break
+        stage += 1
+    return stage
+
+
+def apply_checklist_updates(patient_id: str, updates: Iterable[ChecklistUpdate]) -> Dict:
+    """
+    Applies checklist updates to the patient's active enrollment in a single write.
+    Raises ValueError when there is no active enrollment or an item name is not a valid key.
+    """
+    updates = list(updates)
+    if not updates:
+        raise ValueError("No checklist updates given.")
+    for _, item, _ in updates:
+        if not item or _INVALID_KEY_CHARS & set(item):
+            raise ValueError(f"Invalid checklist item '{item}': names cannot contain . $ # [ ] /")
+
+    found = find_active_enrollment(patient_id)
+    if found is None:
+        raise ValueError(f"No active enrollment found for patient '{patient_id}'.")
+    key, enrollment = found
+    checklists = stage_checklists(get_trial_stages(enrollment.get("trialId")))
+
+    # Set by the last run of transaction_update, i.e. the one that was committed
+    outcome: Dict = {}
+
+    def transaction_update(before):
+        if not before or before.get("isActive") is not True:
+            raise ValueError(f"No active enrollment found for patient '{patient_id}'.")
+        progress = {k: dict(v) for k, v in (before.get("checklistProgress") or {}).items() if isinstance(v, dict)}
+        for stage, item, is_complete in updates:
+            progress.setdefault(f"stage{stage}", {})[item] = bool(is_complete)
+        current_stage = int(before.get("currentStage") or 1)
+        new_stage = advance_stage(current_stage, progress, checklists)
+        after = {**before, "checklistProgress": progress, "currentStage": new_stage}
+        outcome.update(before=before, after=after, previousStage=current_stage, currentStage=new_stage)
+        return after
+
+    realtime_db.reference(f'enrollments/{key}').transaction(transaction_update)
+    apply_enrollment_delta(outcome["before"], outcome["after"])
+    return {
+        "enrollmentId": key,
+        "updated": len(updates),
+        "previousStage": outcome["previousStage"],
+        "currentStage": outcome["currentStage"],
+    }
@@ -0,0 +1,130 @@
+# services/checkpoint_serde.py
+"""
+zstd-compressed pending writes for the agent's Redis checkpointer.
+
+The saver stores each checkpoint as a RedisJSON document that it indexes and
+reads back by JSON path, so checkpoint documents stay plain JSON. Every step's
+pending writes (new messages and tool results, including full EMR and trial
+snapshots) are stored as opaque blobs, and those are what get compressed with
+zstd, optionally against a dictionary trained on typical payloads.
+
+CompressedRedisSerializer extends the saver's own JsonPlusRedisSerializer, so
+its json/msgpack handling and the hooks the saver calls on it
+(_revive_if_needed, _preprocess_redis_json, ...) are inherited unchanged.
+CompressedAsyncRedisSaver turns compression on only while it serializes
+writes. The compression is recorded in the blob's type tag ("zstd+json",
+"zstd-d<dict_id>+json"), so blobs written without it decode unchanged.
+
+Imported lazily by deep_agent_service.get_checkpointer, since it loads
+langgraph's Redis saver.
+
+CHECKPOINT_COMPRESSION=0 stops compressing new writes; compressed ones still
+decode. CHECKPOINT_ZSTD_DICT is an os.pathsep separated list of dictionary
+files: the first is used for writing, all of them for reading, so a dictionary
+can be rotated without losing old threads.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "1") == "1"
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3"))
+CHECKPOINT_ZSTD_DICT = os.getenv("CHECKPOINT_ZSTD_DICT", "")
+# Tiny blobs (channel markers, short messages) gain nothing from compression
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESS_MIN_BYTES", "256"))
+
+ZSTD_PREFIX = "zstd"
+
+# Set while the saver serializes pending writes, the only blobs it stores opaque.
+_compressing_writes: ContextVar[bool] = ContextVar("compressing_checkpoint_writes", default=False)
+
+
+@contextmanager
+def compressing_writes():
+    """Marks blobs serialized inside the block as pending writes, so they get compressed."""
+    token = _compressing_writes.set(True)
+    try:
+        yield
+    finally:
+        _compressing_writes.reset(token)
+
+
+def load_dictionaries(paths: str) -> List[Any]:
+    dictionaries = []
+    for path in filter(None, paths.split(os.pathsep)):
+        with open(path, "rb") as f:
+            dictionaries.append(zstandard.ZstdCompressionDict(f.read()))  # type: ignore
+    return dictionaries
+
+
+def train_dictionary(samples: List[bytes], dict_size: int = 64 * 1024) -> Any:
+    """Trains a zstd dictionary from serialized pending-write blobs."""
+    return zstandard.train_dictionary(dict_size, samples)  # type: ignore
+
+
+class CompressedRedisSerializer(JsonPlusRedisSerializer):
+    """JsonPlusRedisSerializer that zstd-compresses pending-write blobs."""
+
+    def __init__(self, *, level: int = CHECKPOINT_ZSTD_LEVEL, dictionaries: Optional[List[Any]] = None,
+                 min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES, compress: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.min_bytes = min_bytes
+        self.compress = compress
+        dictionaries = dictionaries or []
+        write_dict = dictionaries[0] if dictionaries else None
+        self._compressor = zstandard.ZstdCompressor(level=level, dict_data=write_dict)  # type: ignore
+        self._decompressors: Dict[str, Any] = {ZSTD_PREFIX: zstandard.ZstdDecompressor()}  # type: ignore
+        for d in dictionaries:
+            self._decompressors[f"{ZSTD_PREFIX}-d{d.dict_id()}"] = zstandard.ZstdDecompressor(dict_data=d)  # type: ignore
+        self._write_tag = f"{ZSTD_PREFIX}-d{write_dict.dict_id()}" if write_dict else ZSTD_PREFIX
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        # Checkpoint documents are serialized here too and must stay plain JSON.
+        if not (self.compress and _compressing_writes.get()) or type_ not in ("json", "msgpack"):
+            return type_, data
+        if len(data) < self.min_bytes:
+            return type_, data
+        return f"{self._write_tag}+{type_}", self._compressor.compress(data)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.startswith(ZSTD_PREFIX):
+            tag, _, inner_type = type_.partition("+")
+            decompressor = self._decompressors.get(tag)
+            if decompressor is None:
+                raise ValueError(f"No zstd dictionary loaded for checkpoint blob tagged '{tag}'")
+            return super().loads_typed((inner_type, decompressor.decompress(payload)))
+        return super().loads_typed(data)
+
+
+class CompressedAsyncRedisSaver(AsyncRedisSaver):
+    """AsyncRedisSaver that stores its pending writes zstd-compressed."""
+
+    def __init__(self, *args, serde: CompressedRedisSerializer, **kwargs):
+        super().__init__(*args, **kwargs)
+        # BaseRedisSaver always installs a plain JsonPlusRedisSerializer.
+        self.serde = serde
+
+    async def aput_writes(self, *args, **kwargs) -> None:
+        with compressing_writes():
+            await super().aput_writes(*args, **kwargs)
+
+
+def build_checkpointer(redis_client, ttl: Optional[Dict[str, Any]] = None) -> AsyncRedisSaver:
+    """Returns the agent's Redis saver, compressing pending writes when zstandard is installed."""
+    if zstandard is None:
+        print("zstandard is not installed; agent checkpoint writes will be stored uncompressed.")
+        return AsyncRedisSaver(redis_client=redis_client, ttl=ttl)
+    serde = CompressedRedisSerializer(dictionaries=load_dictionaries(CHECKPOINT_ZSTD_DICT),
+                                      compress=CHECKPOINT_COMPRESSION)
+    return CompressedAsyncRedisSaver(redis_client=redis_client, ttl=ttl, serde=serde)
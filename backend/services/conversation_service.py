@@ -0,0 +1,139 @@
+# services/conversation_service.py
+"""
+Keeps agent threads small.
+
+After each turn the thread's checkpointed history is compacted: tool outputs
+larger than AGENT_TOOL_PAYLOAD_MAX_CHARS (full EMR/trial dumps) are replaced by
+a short stub once the model has used them, and turns older than the most
+recent AGENT_HISTORY_WINDOW messages are folded into a running summary. Idle
+threads expire through the checkpointer TTL (AGENT_THREAD_TTL_MINUTES).
+
+Compaction reads the thread and summarizes it without blocking anything; it
+only takes thread_lock() (which agent turns hold for their whole run) to check
+that the checkpoint it read is still the latest one and write back. A turn is
+never overwritten by a stale compaction, and never waits for a summary call.
+"""
+import asyncio
+import os
+import weakref
+
+AGENT_HISTORY_WINDOW = int(os.getenv("AGENT_HISTORY_WINDOW", "12"))
+AGENT_TOOL_PAYLOAD_MAX_CHARS = int(os.getenv("AGENT_TOOL_PAYLOAD_MAX_CHARS", "2000"))
+AGENT_THREAD_TTL_MINUTES = int(os.getenv("AGENT_THREAD_TTL_MINUTES", str(7 * 24 * 60)))
+
+SUMMARY_MARKER = "compacted_summary"
+
+_thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def thread_lock(thread_id: str) -> asyncio.Lock:
+    """The lock serializing turns and compaction for one thread (within this worker)."""
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = _thread_locks[thread_id] = asyncio.Lock()
+    return lock
+
+
+def _checkpoint_id(state) -> str:
+    return (state.config or {}).get("configurable", {}).get("checkpoint_id")
+
+
+def checkpoint_ttl_config() -> dict:
+    """TTL settings for the Redis checkpointer; reads refresh the TTL so only idle threads expire."""
+    return {"default_ttl": AGENT_THREAD_TTL_MINUTES, "refresh_on_read": True}
+
+
+def _is_summary(message) -> bool:
+    return message.type == "system" and message.additional_kwargs.get(SUMMARY_MARKER, False)
+
+
+def _stub_tool_payload(message):
+    from langchain_core.messages import ToolMessage
+
+    content = str(message.content)
+    if len(content) <= AGENT_TOOL_PAYLOAD_MAX_CHARS:
+        return message
+    return ToolMessage(
+        content=f"[{len(content)} characters of '{message.name}' output omitted after use; call the tool again if needed]",
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+    )
+
+
+def _window_start(messages: list) -> int:
+    """Index where the verbatim window begins, moved forward to a user turn so tool calls stay paired."""
+    start = max(0, len(messages) - AGENT_HISTORY_WINDOW)
+    while start < len(messages) and messages[start].type != "human":
+        start += 1
+    return start
+
+
+def _transcript(messages: list) -> str:
+    lines = []
+    for m in messages:
+        if _is_summary(m):
+            lines.append(f"Earlier summary: {m.content}")
+        elif m.type == "human":
+            lines.append(f"User: {m.content}")
+        elif m.type == "ai" and m.content:
+            lines.append(f"Assistant: {m.content}")
+        elif m.type == "tool":
+            lines.append(f"Tool {m.name}: {str(m.content)[:500]}")
+    return "\n".join(lines)
+
+
+async def summarize_messages(llm, messages: list) -> str:
+    prompt = (
+        "Summarize this clinical trial assistant conversation for your own future reference. "
+        "Keep patient/trial IDs, decisions, updates made and open questions. Be concise.\n\n"
+        f"{_transcript(messages)}"
+    )
+    response = await llm.ainvoke(prompt)
+    return str(response.content).strip()
+
+
+async def compact_thread(agent, config: dict, llm) -> bool:
+    """
+    Compacts one thread's history in place. Returns True if the checkpoint was
+    rewritten; False if there was nothing to do or a turn landed meanwhile.
+    """
+    from langchain_core.messages import RemoveMessage, SystemMessage
+    from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+    state = await agent.aget_state(config)
+    messages = list((state.values or {}).get("messages", []))
+    if not messages:
+        return False
+
+    start = _window_start(messages)
+    older, recent = messages[:start], messages[start:]
+    # A lone previous summary isn't worth re-summarizing.
+    needs_summary = any(not _is_summary(m) for m in older)
+    stubbed = [_stub_tool_payload(m) if m.type == "tool" else m for m in recent]
+    if not needs_summary and all(a is b for a, b in zip(stubbed, recent)):
+        return False
+
+    compacted = list(older)
+    if needs_summary:
+        summary = await summarize_messages(llm, older)
+        compacted = [SystemMessage(content=f"Summary of the earlier conversation: {summary}",
+                                   additional_kwargs={SUMMARY_MARKER: True})]
+
+    thread_id = config.get("configurable", {}).get("thread_id")
+    async with thread_lock(thread_id):
+        # The summary call is slow; a turn written meanwhile (e.g. by another worker) wins.
+        if _checkpoint_id(await agent.aget_state(config)) != _checkpoint_id(state):
+            return False
+        # Messages are merged by id, so the only way to reorder (summary first) is to replace the list.
+        await agent.aupdate_state(config, {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *compacted, *stubbed]})
+    return True
+
+
+async def compact_thread_safely(agent, config: dict, llm):
+    """Background-task entry point: compaction failures must never surface to the user."""
+    thread_id = config.get("configurable", {}).get("thread_id")
+    try:
+        await compact_thread(agent, config, llm)
+    except Exception as e:
+        print(f"Thread compaction error for {thread_id}: {e}")
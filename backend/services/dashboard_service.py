@@ -0,0 +1,68 @@
+# services/dashboard_service.py
+"""
+Everything the patient dashboard renders, gathered server-side in one call.
+
+Profile, EMR summary, active enrollment and the trial list are fetched
+concurrently (blocking RTDB reads run in worker threads); the current stage's
+protocol comes from the per-trial stage cache once the enrollment is known.
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from firebase_config import realtime_db
+from services.checklist_service import find_active_enrollment
+from services.live_updates import public_profile
+from services.prompt_builder import project_emr
+from services.stage_service import get_stage
+from services.trial_summaries import get_available_trial_summaries
+
+DASHBOARD_TRIAL_FIELDS = ("id", "title", "status", "description", "condition")
+
+
+def _read(path: str):
+    return realtime_db.reference(path).get()
+
+
+async def _progress(patient_id: str) -> Optional[Dict]:
+    found = await asyncio.to_thread(find_active_enrollment, patient_id)
+    if found is None:
+        return None
+    enrollment_id, enrollment = found
+    number = int(enrollment.get("currentStage") or 1)
+    stage = await asyncio.to_thread(get_stage, enrollment.get("trialId"), number) or {}
+    done = (enrollment.get("checklistProgress") or {}).get(f"stage{number}") or {}
+    return {
+        "enrollment": {
+            "id": enrollment_id,
+            **{k: enrollment.get(k) for k in ("trialId", "orgId", "enrollmentDate", "status", "currentStage")},
+        },
+        "currentStage": {
+            "number": number,
+            "name": stage.get("name"),
+            "duration": stage.get("duration"),
+            "summary": stage.get("summary"),
+            "checklist": [{"item": item, "done": done.get(item) is True} for item in stage.get("checklist") or []],
+        },
+    }
+
+
+def _slim_trials() -> List[Dict]:
+    return [{k: t[k] for k in DASHBOARD_TRIAL_FIELDS if k in t} for t in get_available_trial_summaries()]
+
+
+async def get_patient_dashboard(patient_id: str) -> Dict:
+    profile, emr, progress, trials = await asyncio.gather(
+        asyncio.to_thread(_read, f"users/{patient_id}"),
+        asyncio.to_thread(_read, f"emr_records/{patient_id}"),
+        _progress(patient_id),
+        asyncio.to_thread(_slim_trials),
+    )
+    if not profile:
+        raise ValueError(f"No profile found for patient '{patient_id}'.")
+    return {
+        "profile": public_profile(profile),
+        "emr": project_emr(emr) if isinstance(emr, dict) else None,
+        "enrollment": progress["enrollment"] if progress else None,
+        "currentStage": progress["currentStage"] if progress else None,
+        "trials": trials,
+    }
@@ -1,9 +1,21 @@
+import asyncio
 import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
-from deepagents import create_deep_agent
-from langgraph.checkpoint.redis import RedisSaver
 from firebase_config import realtime_db 
+from services.metrics_service import LLMMetricsCallback
+from services.cache_service import TTLCache
+from services.warmup_service import register_warmup
+from services.conversation_service import checkpoint_ttl_config
+from services.output_schemas import PersonalizedTimeline
+from services.structured_output import output_token_budget, parse_structured
+from services.prompt_builder import build_personalization_prompt, compact_json, project_stages
+from services.checklist_service import apply_checklist_updates
+from services.stage_service import get_stage, get_trial_stages, update_stage
+from services.change_feed import CHANGE_FEED_CACHE_TTL_SECONDS, Change, on_change
+from services.redis_service import get_redis
 import hashlib
 
 @tool
@@ -60,10 +72,9 @@ def get_trial_info(trial_id: str, stage_number: int = None) -> str:  # type: ign
     """Provides info about a clinical trial. If stage_number is given, provides stage-specific info."""
     try:
         if stage_number:
-            ref = realtime_db.reference(f'clinicalTrials/{trial_id}/stages/{stage_number}')
+            snapshot = get_stage(trial_id, stage_number)
         else:
-            ref = realtime_db.reference(f'clinicalTrials/{trial_id}')
-        snapshot = ref.get()
+            snapshot = realtime_db.reference(f'trials/{trial_id}').get()
         return json.dumps(snapshot) if snapshot else f"Info not found for trial '{trial_id}'."
     except Exception as e:
         return f"Error fetching trial info: {e}"
@@ -86,8 +97,7 @@ def get_patient_progress(patient_id: str) -> str:
 def update_trial_protocol(trial_id: str, stage_number: int, update_description: str) -> str:
     """Updates the protocol for a specific stage of a clinical trial."""
     try:
-        stage_ref = realtime_db.reference(f'clinicalTrials/{trial_id}/stages/{stage_number}')
-        stage_ref.update({'summary': update_description})
+        update_stage(trial_id, stage_number, {'summary': update_description})
         return "Trial protocol changes made successfully."
     except Exception as e:
         return f"Error updating trial protocol: {e}"
@@ -96,20 +106,35 @@ def update_trial_protocol(trial_id: str, stage_number: int, update_description:
 def update_checklist_item(patient_id: str, stage_number: int, item_description: str, is_complete: bool) -> str:
     """Updates a single checklist item for a patient's trial stage."""
     try:
-        enrollments_ref = realtime_db.reference('enrollments')
-        all_enrollments = enrollments_ref.get() or {}
-        target_ref = None
-        for key, enrollment in all_enrollments.items(): # type: ignore
-            if enrollment.get("patientId") == patient_id and enrollment.get("isActive") is True:
-                target_ref = enrollments_ref.child(key)
-                break
-        if not target_ref:
-            return f"No active enrollment found for patient '{patient_id}'."
-
-        field_path = f"checklistProgress/stage{stage_number}/{item_description}"
-        target_ref.child(field_path).set(is_complete)
+        result = apply_checklist_updates(patient_id, [(stage_number, item_description, is_complete)])
         status = "marked as complete" if is_complete else "marked as incomplete"
-        return f"Checklist item '{item_description}' for stage {stage_number} was successfully {status}."
+        message = f"Checklist item '{item_description}' for stage {stage_number} was successfully {status}."
+        if result["currentStage"] != result["previousStage"]:
+            message += f" The patient has advanced to stage {result['currentStage']}."
+        return message
+    except ValueError as e:
+        return str(e)
+    except Exception as e:
+        return f"An error occurred while updating the checklist: {e}"
+
+@tool
+def update_checklist_items(patient_id: str, updates: List[Dict[str, Any]]) -> str:
+    """
+    Updates several checklist items for a patient in one write. Each update is
+    {"stage_number": int, "item_description": str, "is_complete": bool}.
+    Prefer this over repeated update_checklist_item calls.
+    """
+    try:
+        entries = [(u["stage_number"], u["item_description"], u["is_complete"]) for u in updates]
+        result = apply_checklist_updates(patient_id, entries)
+        message = f"Updated {result['updated']} checklist items."
+        if result["currentStage"] != result["previousStage"]:
+            message += f" The patient has advanced to stage {result['currentStage']}."
+        return message
+    except (KeyError, TypeError):
+        return "Each update needs stage_number, item_description and is_complete."
+    except ValueError as e:
+        return str(e)
     except Exception as e:
         return f"An error occurred while updating the checklist: {e}"
 
@@ -127,28 +152,18 @@ async def generate_personalized_timeline(patient_id: str, trial_id: str) -> dict
             return {"error": f"No EMR found for patient {patient_id}"}
 
         # Step 2: Fetch protocol stages
-        stages = realtime_db.reference(f'clinicalTrials/{trial_id}/stages').get() or {}
+        stages = get_trial_stages(trial_id)
         if not stages:
             return {"error": f"No protocol found for trial {trial_id}"}
 
-        # Step 3: Prompt LLM
-        prompt = f"""
-        You are a clinical trial assistant. Personalize this trial protocol for the patient.
-
-        **Patient's EMR:**
-        {json.dumps(patient_emr, indent=2)}
-
-        **Generic Trial Protocol:**
-        {json.dumps(stages, indent=2)}
-
-        Instructions:
-        - Rewrite 'summary' for each stage with patient-specific advice.
-        - Rewrite each checklist item into a patient-tailored task (mention exact meds, etc.).
-        - Return ONLY valid JSON, same structure as protocol.
-        """
+        # Step 3: Prompt LLM with only the relevant EMR fields, within the token budget
+        prompt, _ = build_personalization_prompt(patient_emr, stages)  # type: ignore
+        # The answer mirrors the protocol's structure, so size the budget from it.
+        protocol_chars = len(compact_json(project_stages(stages)))
+        max_tokens = REASONING_TOKEN_HEADROOM + output_token_budget(protocol_chars * 2, ceiling=8192)
+        llm = get_llm().bind(response_format={"type": "json_object"}, max_tokens=max_tokens)
         response = await llm.ainvoke(prompt)
-        json_string = response.content.strip().replace("```json", "").replace("```", "")  # type: ignore
-        return json.loads(json_string)
+        return parse_structured(response.content, PersonalizedTimeline)  # type: ignore
 
     except Exception as e:
         print(f"Error generating personalized timeline: {e}")
@@ -216,26 +231,59 @@ async def get_patient_profile_for_dashboard(patient_id: str):
         print(f"Error fetching profile for dashboard: {e}")
         raise
 
+# The trial catalog changes rarely and is read on every list screen, so it is cached.
+trial_catalog_cache = TTLCache("trial_catalog", ttl_seconds=float(os.getenv("TRIAL_CATALOG_TTL_SECONDS", "60")))
+
+def load_available_trials() -> list:
+    """Reads all trials from RTDB and keeps the 'Active' or 'Recruiting' ones."""
+    print("RTDB: Fetching all clinical trials")
+    all_trials = realtime_db.reference('trials').get() or {}
+
+    available_trials = []
+    for trial_id, trial_data in all_trials.items(): # type: ignore
+        if trial_data.get("status") in ["Active", "Recruiting"]:
+            # Add the trial_id to the object for use in the frontend
+            trial_data['id'] = trial_id 
+            available_trials.append(trial_data)
+    return available_trials
+
 async def get_available_trials() -> list:
     """
     Service function to fetch all clinical trials that are 'Active' or 'Recruiting'.
     """
     try:
-        print("RTDB: Fetching all clinical trials")
-        all_trials = realtime_db.reference('trials').get() or {}
-        
-        available_trials = []
-        for trial_id, trial_data in all_trials.items(): # type: ignore
-            if trial_data.get("status") in ["Active", "Recruiting"]:
-                # Add the trial_id to the object for use in the frontend
-                trial_data['id'] = trial_id 
-                available_trials.append(trial_data)
-        
-        return available_trials
+        return trial_catalog_cache.get_or_load("available", load_available_trials)
     except Exception as e:
         print(f"Error fetching available trials: {e}")
         raise
 
+@register_warmup("trial_catalog")
+def warm_trial_catalog():
+    # Also opens the pooled RTDB connection used by every other route.
+    trial_catalog_cache.set("available", load_available_trials())
+
+def _as_available(trial_id: str, trial) -> Optional[dict]:
+    if isinstance(trial, dict) and trial.get("status") in ["Active", "Recruiting"]:
+        return {**trial, "id": trial_id}
+    return None
+
+@on_change("trials")
+def sync_trial_catalog(change: Change):
+    """Keeps the available-trials list current from the change feed instead of reloading on TTL."""
+    if change.key is None:
+        trial_catalog_cache.ttl_seconds = CHANGE_FEED_CACHE_TTL_SECONDS
+        updated = [_as_available(trial_id, trial) for trial_id, trial in change.value.items()]
+    else:
+        current = trial_catalog_cache.get("available")
+        if current is None:
+            return
+        changed = _as_available(change.key, change.value)
+        updated = [changed if t["id"] == change.key else t for t in current]
+        if not any(t["id"] == change.key for t in current):
+            updated.append(changed)
+    # Always a new list object, so indexes built from the previous list know to rebuild
+    trial_catalog_cache.set("available", [t for t in updated if t is not None])
+
 # --- 3. AGENT CONFIGURATION & INITIALIZATION ---
 all_tools = [
     get_patient_profile,
@@ -245,13 +293,14 @@ all_tools = [
     get_patient_progress,
     update_trial_protocol,
     update_checklist_item,
+    update_checklist_items,
 ]
 
 emr_subagent = {
     "name": "EMR_Manager",
     "description": "Manages patient data (profiles, EMRs, checklist).",
     "prompt": "You are a diligent patient data assistant. Handle both personal and medical records accurately.",
-    "tools": [get_patient_profile, get_patient_emr, update_patient_emr, update_checklist_item],
+    "tools": [get_patient_profile, get_patient_emr, update_patient_emr, update_checklist_item, update_checklist_items],
 }
 
 trial_info_subagent = {
@@ -265,7 +314,7 @@ clinical_org_subagent = {
     "name": "Clinical_Org_Assistant",
     "description": "Helps trial staff with progress, checklists, and protocol updates.",
     "prompt": "Be precise and formal. Confirm administrative changes.",
-    "tools": [get_patient_progress, update_trial_protocol, update_checklist_item],
+    "tools": [get_patient_progress, update_trial_protocol, update_checklist_item, update_checklist_items],
 }
 
 main_agent_instructions = """
@@ -276,13 +325,92 @@ You are the router for a clinical trial chat system.
 Route to the best sub-agent. Do NOT call tools directly.
 """
 
-llm = ChatOpenAI(model="gpt-5-nano")
+LLM_MODEL_NAME = "gpt-5-nano"
+# gpt-5 models spend part of max_tokens on hidden reasoning
+REASONING_TOKEN_HEADROOM = int(os.getenv("REASONING_TOKEN_HEADROOM", "2048"))
+
+# The model client and agent graph are built on first use rather than at import,
+# so importing this module (and every router that does) stays cheap.
+@lru_cache(maxsize=1)
+def get_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=LLM_MODEL_NAME, callbacks=[LLMMetricsCallback("openai", LLM_MODEL_NAME)])
+
+_checkpointer = None
+_agent = None
+_agent_lock = asyncio.Lock()
+
+async def get_checkpointer():
+    """
+    Returns the shared async Redis checkpointer. All checkpoint reads and writes
+    go through one pooled redis.asyncio client, so they never block the event loop.
+    """
+    global _checkpointer
+    if _checkpointer is None:
+        from services.checkpoint_serde import build_checkpointer
+
+        # Idle threads expire via TTL so Redis memory stays bounded. Large tool
+        # results (EMR/trial snapshots) are written zstd-compressed.
+        checkpointer = build_checkpointer(get_redis(), ttl=checkpoint_ttl_config())
+        await checkpointer.asetup()
+        _checkpointer = checkpointer
+    return _checkpointer
+
+async def get_agent():
+    global _agent
+    async with _agent_lock:
+        if _agent is None:
+            from deepagents import create_deep_agent
+
+            agent = create_deep_agent(
+                tools=all_tools,
+                instructions=main_agent_instructions,
+                subagents=[emr_subagent, trial_info_subagent, clinical_org_subagent],  # type: ignore
+                model=get_llm(),
+            )
+            agent.checkpointer = await get_checkpointer()  # type: ignore
+            _agent = agent
+    return _agent
+
+SUBAGENTS_BY_NAME = {s["name"]: s for s in (emr_subagent, trial_info_subagent, clinical_org_subagent)}
+
+@lru_cache(maxsize=None)
+def get_subagent_graph(name: str):
+    """A standalone tool-calling agent for one sub-agent, used by the fast-path router."""
+    from langgraph.prebuilt import create_react_agent
+
+    subagent = SUBAGENTS_BY_NAME[name]
+    return create_react_agent(get_llm(), subagent["tools"], prompt=subagent["prompt"])
+
+async def invoke_subagent_directly(name: str, thread_config: dict, content: str) -> str:
+    """
+    Runs one turn on a sub-agent without the main router's model hop. The thread's
+    history is read from, and the new messages written back to, the main agent's
+    checkpoint so the conversation stays a single thread.
+    """
+    from langchain_core.messages import HumanMessage
+
+    agent = await get_agent()
+    state = await agent.aget_state(thread_config)
+    history = list((state.values or {}).get("messages", []))
+
+    result = await get_subagent_graph(name).ainvoke({"messages": [*history, HumanMessage(content=content)]})
+    await agent.aupdate_state(thread_config, {"messages": result["messages"][len(history):]})
+    return result["messages"][-1].content
+
+async def close_agent_resources():
+    """Drops the agent and its checkpointer on shutdown; the Redis pool is closed by close_redis()."""
+    global _checkpointer, _agent
+    _checkpointer = _agent = None
 
-agent = create_deep_agent(
-    tools=all_tools,
-    instructions=main_agent_instructions,
-    subagents=[emr_subagent, trial_info_subagent, clinical_org_subagent],  # type: ignore
-    model=llm,
-)
+@register_warmup("agent")
+async def warm_agent():
+    await get_agent()
+    await get_redis().ping()
 
-agent.checkpointer = RedisSaver.from_conn_string("redis://localhost:6379")  # type: ignore
\ No newline at end of file
+@register_warmup("openai")
+async def warm_openai():
+    # A cheap authenticated request leaves a live TLS connection in the client's pool.
+    client = getattr(get_llm(), "root_async_client", None)
+    if client is not None:
+        await client.models.list()
\ No newline at end of file
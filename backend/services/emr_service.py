@@ -1,9 +1,10 @@
-import json
 from typing import IO
 
 # Import functions and clients from your existing services
-from services.timeline_service import extract_text_from_pdf, medgemma_client
+from services.timeline_service import extract_text_from_pdf, get_medgemma_client
 from services.deep_agent_service import update_patient_emr
+from services.output_schemas import EmrExtraction
+from services.structured_output import output_token_budget, parse_structured
 
 async def extract_emr_details_from_text(emr_text: str) -> dict:
     """Analyzes raw EMR text using MedGemma and extracts key patient details."""
@@ -17,9 +18,11 @@ async def extract_emr_details_from_text(emr_text: str) -> dict:
     {emr_text}
     ---
     """
+    max_tokens = output_token_budget(1200 + len(emr_text) // 20, floor=384, ceiling=1536)
     try:
-        response_text = await medgemma_client.generate(prompt)
-        return json.loads(response_text)
+        response_text = await get_medgemma_client().generate(prompt, max_tokens=max_tokens, json_mode=True)
+        # Unset fields are dropped so the summary counts only what was actually found
+        return {k: v for k, v in parse_structured(response_text, EmrExtraction).items() if v not in (None, [])}
     except Exception as e:
         print(f"Error parsing MedGemma response for EMR: {e}")
         return {"error": "Failed to extract structured data from text."}
@@ -0,0 +1,96 @@
+# services/etag_service.py
+"""
+ETags and conditional GETs for read endpoints.
+
+A response's ETag is a hash of its canonical JSON, tagged with the
+representation the request negotiated (MessagePack bodies get a "-msgpack"
+suffix; CompressionMiddleware makes the ETag of a compressed body weak), and
+responses carry Vary: Accept, Accept-Encoding. The last ETag of each
+resource is cached, so a request whose If-None-Match still matches is
+answered with 304 before any database read. Cached ETags are dropped by the
+change feed when the underlying record changes; without the feed they expire
+after ETAG_CACHE_TTL_SECONDS.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from services.cache_service import TTLCache
+from services.change_feed import CHANGE_FEED_CACHE_TTL_SECONDS, Change, change_feed, on_change
+from services.response_encoding import FastJSONResponse, wants_msgpack
+
+ETAG_CACHE_TTL_SECONDS = float(os.getenv("ETAG_CACHE_TTL_SECONDS", "30"))
+ETAG_CACHE_MAX_ENTRIES = int(os.getenv("ETAG_CACHE_MAX_ENTRIES", "20000"))
+
+# The body depends on Accept (JSON/MessagePack) and its bytes on Accept-Encoding
+_CONDITIONAL_HEADERS = {"Cache-Control": "no-cache", "Vary": "Accept, Accept-Encoding"}
+
+etag_cache = TTLCache("etags", ttl_seconds=ETAG_CACHE_TTL_SECONDS, max_entries=ETAG_CACHE_MAX_ENTRIES)
+
+
+def compute_etag(body: Any) -> str:
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return '"%s"' % hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def representation_etag(etag: str) -> str:
+    """The ETag of the representation this request negotiated."""
+    return etag[:-1] + '-msgpack"' if wants_msgpack() else etag
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, **_CONDITIONAL_HEADERS})
+
+
+async def conditional_json(request: Request, key: Tuple[Hashable, ...], load: Callable[[], Awaitable[Any]]) -> Response:
+    """
+    Serves load()'s JSON body with an ETag, or 304 when If-None-Match matches.
+    key identifies the resource (including any query parameters that shape the body).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    cached = etag_cache.get(key)
+    if cached is not None and _matches(if_none_match, representation_etag(cached)):
+        return _not_modified(representation_etag(cached))
+
+    body = await load()
+    etag = compute_etag(body)
+    etag_cache.set(key, etag)
+    etag = representation_etag(etag)
+    if _matches(if_none_match, etag):
+        return _not_modified(etag)
+    return FastJSONResponse(body, headers={"ETag": etag, **_CONDITIONAL_HEADERS})
+
+
+def invalidate_etags(kinds: Tuple[str, ...], record_id: Optional[str] = None):
+    """Drops cached ETags of these resource kinds (for one record, or all). Call after writing them."""
+    etag_cache.invalidate_where(
+        lambda k: k[0] in kinds and (record_id is None or (len(k) > 1 and k[1] == record_id))
+    )
+
+
+@on_change("trials")
+def invalidate_trial_etags(change: Change):
+    invalidate_etags(("trials_available",))
+    invalidate_etags(("trial_stages",), change.key)
+    if change.key is None and {"trials", "users", "emr_records"} <= set(change_feed.roots):
+        # The feed covers every cached resource: ETags now only go stale through a missed event
+        etag_cache.ttl_seconds = CHANGE_FEED_CACHE_TTL_SECONDS
+
+
+@on_change("users")
+def invalidate_profile_etags(change: Change):
+    invalidate_etags(("patient_profile",), change.key)
+
+
+@on_change("emr_records")
+def invalidate_emr_etags(change: Change):
+    invalidate_etags(("patient_emr",), change.key)
@@ -1,23 +1,51 @@
 import os
-import json
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
-import google.generativeai as genai
+from services.metrics_service import record_llm_call
+from services.warmup_service import register_warmup
+from services.output_schemas import EmrExtraction
+from services.structured_output import output_token_budget, parse_structured
 
 load_dotenv()
 
-# --- Initialize Gemini Client ---
-try:
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+# gemini-2.5 counts thinking tokens against max_output_tokens
+GEMINI_THINKING_HEADROOM = int(os.getenv("GEMINI_THINKING_HEADROOM", "2048"))
+
+# --- Gemini Client (configured on first use) ---
+# lru_cache does not cache exceptions, so a failed setup (e.g. GOOGLE_API_KEY not
+# yet set) is retried on the next call instead of being remembered as None.
+@lru_cache(maxsize=1)
+def _create_gemini_model():
+    import google.generativeai as genai
+
     api_key = os.environ["GOOGLE_API_KEY"]
-    genai.configure(api_key=api_key) # type: ignore
-    gemini_model = genai.GenerativeModel('gemini-2.5-flash') # type: ignore
-except Exception as e:
-    print(f"Failed to initialize Gemini. Make sure GOOGLE_API_KEY is set. Error: {e}")
-    gemini_model = None
+    # GEMINI_API_ENDPOINT points the client at another host (e.g. fake_model_server.py)
+    api_endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    if api_endpoint:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": api_endpoint}) # type: ignore
+    else:
+        genai.configure(api_key=api_key) # type: ignore
+    return genai.GenerativeModel(GEMINI_MODEL_NAME) # type: ignore
+
+def get_gemini_model():
+    try:
+        return _create_gemini_model()
+    except Exception as e:
+        print(f"Failed to initialize Gemini. Make sure GOOGLE_API_KEY is set. Error: {e}")
+        return None
+
+@register_warmup("gemini")
+def warm_gemini():
+    if get_gemini_model() is None:
+        raise ConnectionError("Gemini model is not initialized.")
 
 async def parse_emr_with_gemini(emr_text: str) -> dict:
     """
     Analyzes raw EMR text using Gemini and extracts key patient details into a structured dictionary.
     """
+    gemini_model = get_gemini_model()
     if not gemini_model:
         raise ConnectionError("Gemini model is not initialized.")
 
@@ -40,10 +68,22 @@ async def parse_emr_with_gemini(emr_text: str) -> dict:
     {emr_text}
     ---
     """
+    start = time.perf_counter()
+    try:
+        generation_config = {
+            "response_mime_type": "application/json",
+            "max_output_tokens": GEMINI_THINKING_HEADROOM + output_token_budget(1200 + len(emr_text) // 20, ceiling=1536),
+        }
+        response = await gemini_model.generate_content_async(prompt, generation_config=generation_config)
+    except Exception as e:
+        record_llm_call("gemini", GEMINI_MODEL_NAME, time.perf_counter() - start, error=True)
+        print(f"Error calling Gemini: {e}")
+        return {"error": "Failed to extract data from text using Gemini."}
     try:
-        response = await gemini_model.generate_content_async(prompt)
-        json_string = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(json_string)
+        usage = getattr(response, "usage_metadata", None)
+        record_llm_call("gemini", GEMINI_MODEL_NAME, time.perf_counter() - start,
+                        getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None))
+        return parse_structured(response.text, EmrExtraction)
     except Exception as e:
         print(f"Error parsing with Gemini: {e}")
         return {"error": "Failed to extract data from text using Gemini."}
\ No newline at end of file
@@ -0,0 +1,115 @@
+# services/geo_service.py
+"""
+Nearest-site queries for trials.
+
+Trials carry their site coordinates in `siteLocation: {"lat", "lng"}`. Sites are
+bucketed into a fixed lat/lng grid (GEO_CELL_DEGREES per side), so a radius
+query only looks at the cells overlapping the radius' bounding box before
+computing exact haversine distances for those candidates.
+"""
+import math
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+GEO_CELL_DEGREES = float(os.getenv("GEO_CELL_DEGREES", "0.5"))
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+
+def site_coordinates(trial: Dict) -> Optional[Tuple[float, float]]:
+    site = trial.get("siteLocation") or {}
+    try:
+        return float(site["lat"]), float(site["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def haversine_miles(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class TrialGeoIndex:
+    """Grid-bucketed trial sites built from one trial list."""
+
+    def __init__(self, trials: List[Dict], cell_degrees: float = GEO_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.trials: List[Dict] = []
+        coords = []
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for trial in trials:
+            point = site_coordinates(trial)
+            if point is None:
+                continue
+            self.cells[self._cell(*point)].append(len(self.trials))
+            self.trials.append(trial)
+            coords.append(point)
+        points = np.array(coords, dtype=np.float64).reshape(-1, 2)
+        self.lats, self.lngs = points[:, 0], points[:, 1]
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def _candidates(self, lat: float, lng: float, radius_miles: float) -> np.ndarray:
+        dlat = radius_miles / MILES_PER_DEGREE_LAT
+        # Longitude degrees shrink toward the poles; clamp so the box stays finite
+        dlng = radius_miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        (lat_lo, lng_lo), (lat_hi, lng_hi) = self._cell(lat - dlat, lng - dlng), self._cell(lat + dlat, lng + dlng)
+        if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) > len(self.cells):
+            # Box covers more cells than are occupied: walk the occupied ones instead
+            hits = [i for (cy, cx), idx in self.cells.items()
+                    if lat_lo <= cy <= lat_hi and lng_lo <= cx <= lng_hi for i in idx]
+        else:
+            hits = [i for cy in range(lat_lo, lat_hi + 1) for cx in range(lng_lo, lng_hi + 1)
+                    for i in self.cells.get((cy, cx), ())]
+        return np.array(hits, dtype=np.int64)
+
+    def nearest(self, lat: float, lng: float, radius_miles: Optional[float] = None,
+                limit: Optional[int] = None) -> List[Tuple[Dict, float]]:
+        """(trial, distance in miles) pairs sorted by distance, within radius_miles if given."""
+        if not self.trials:
+            return []
+        idx = np.arange(len(self.trials)) if radius_miles is None else self._candidates(lat, lng, radius_miles)
+        if idx.size == 0:
+            return []
+        distances = haversine_miles(lat, lng, self.lats[idx], self.lngs[idx])
+        if radius_miles is not None:
+            keep = distances <= radius_miles
+            idx, distances = idx[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")[:limit]
+        return [(self.trials[idx[k]], float(distances[k])) for k in order]
+
+
+# One index per catalog list (e.g. summaries and full records): (source list, index)
+_geo_indexes: Dict[str, Tuple[List[Dict], TrialGeoIndex]] = {}
+
+
+def get_geo_index(trials: List[Dict], source: str = "trials") -> TrialGeoIndex:
+    """Index for this source's trial list; rebuilt only when that list itself is replaced."""
+    cached = _geo_indexes.get(source)
+    if cached is None or cached[0] is not trials:
+        cached = _geo_indexes[source] = (trials, TrialGeoIndex(trials))
+    return cached[1]
+
+
+def trials_near(trials: List[Dict], lat: float, lng: float, radius_miles: Optional[float] = None,
+                limit: Optional[int] = None, source: str = "trials") -> List[Dict]:
+    """
+    Copies of the nearest trials with `distanceMiles` and a display `distance` added.
+    Without a radius, trials that have no siteLocation follow the located ones
+    (without distance fields) instead of being dropped. `source` names the
+    catalog list, so each list keeps its own cached index.
+    """
+    located = [
+        {**trial, "distanceMiles": round(miles, 1), "distance": f"{miles:.1f} miles"}
+        for trial, miles in get_geo_index(trials, source).nearest(lat, lng, radius_miles, limit)
+    ]
+    if radius_miles is not None:
+        return located
+    unlocated = [trial for trial in trials if site_coordinates(trial) is None]
+    return (located + unlocated)[:limit]
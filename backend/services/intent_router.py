@@ -0,0 +1,234 @@
+# services/intent_router.py
+"""
+Local intent classifier that picks the sub-agent for a chat turn without a
+model call.
+
+Keyword rules are combined with a small multinomial Naive Bayes model trained
+at first use on the example utterances below (pure Python, CPU only). When the
+combined probability clears the confidence threshold the turn is sent
+straight to that sub-agent; otherwise the caller falls back to the LLM router.
+
+Naive Bayes is overconfident on text unlike anything it was trained on, so
+words outside the training vocabulary are ignored, and a turn with fewer than
+INTENT_ROUTER_MIN_KNOWN_TOKENS known content words always falls back. The
+threshold is calibrated on the held-out CALIBRATION_EXAMPLES (including
+off-topic turns that must fall back) unless INTENT_ROUTER_MIN_CONFIDENCE is
+set.
+"""
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+# Unset: calibrated from CALIBRATION_EXAMPLES (never below CONFIDENCE_FLOOR)
+INTENT_ROUTER_MIN_CONFIDENCE = os.getenv("INTENT_ROUTER_MIN_CONFIDENCE")
+INTENT_ROUTER_MIN_KNOWN_TOKENS = int(os.getenv("INTENT_ROUTER_MIN_KNOWN_TOKENS", "2"))
+CONFIDENCE_FLOOR = 0.85
+# A calibrated threshold of 1.0 would switch the fast path off; it is capped here instead
+CONFIDENCE_CEILING = 0.99
+CALIBRATION_MARGIN = 0.01
+# Each keyword rule hit multiplies a class's likelihood by e^KEYWORD_WEIGHT
+KEYWORD_WEIGHT = 1.5
+
+EMR_MANAGER = "EMR_Manager"
+TRIAL_INFO = "Trial_Info_Specialist"
+CLINICAL_ORG = "Clinical_Org_Assistant"
+
+KEYWORD_RULES: Dict[str, List[str]] = {
+    EMR_MANAGER: [
+        r"\bemr\b", r"medical (record|history)", r"\bprescription", r"\bmedication", r"\ballerg",
+        r"\bdiagnos", r"\bprofile\b", r"\b(add|append|log)\b.*\b(emr|record|log)\b", r"\bsmok", r"\bconditions?\b",
+    ],
+    TRIAL_INFO: [
+        r"\bwhat (is|are|does|happens)\b.*\b(this|the) (clinical )?(trial|study)\b", r"\bexplain\b", r"\beligib", r"\bhow long\b",
+        r"\bduration\b", r"\bphase\b", r"\bsponsor", r"\bside effects?\b", r"\bwhat happens\b",
+    ],
+    CLINICAL_ORG: [
+        r"\bprogress\b", r"\benrol+ment", r"\bprotocol\b", r"\bupdate the (protocol|stage)\b",
+        r"\bcurrent stage\b", r"\bwhich stage\b", r"\bmark\b.*\bfor patient\b", r"\bstaff\b", r"\bcoordinator\b",
+    ],
+}
+
+TRAINING_EXAMPLES: Dict[str, List[str]] = {
+    EMR_MANAGER: [
+        "show me my medical record",
+        "what medications am I on",
+        "add to the emr that the patient reports feeling energetic",
+        "what was the last log entry for this patient",
+        "update my prescriptions",
+        "what conditions are in my record",
+        "give me my profile details",
+        "what is my email on file",
+        "record that I stopped smoking",
+        "list the patient's allergies",
+        "what was I diagnosed with",
+        "append a note to my health record",
+        "which diagnosis codes are on file",
+    ],
+    TRIAL_INFO: [
+        "what is this clinical trial about",
+        "explain stage two of the trial",
+        "how long does the trial last",
+        "what happens during the screening stage",
+        "am I eligible for the diabetes study",
+        "what phase is the hypertension trial in",
+        "who sponsors this study",
+        "what are the possible side effects",
+        "tell me about the trial visits",
+        "what will I need to do in the intervention period",
+        "describe the follow up period",
+        "tell me about the trial sponsor",
+        "what does the baseline period involve",
+    ],
+    CLINICAL_ORG: [
+        "what is the progress of patient john",
+        "show the enrollment status for this patient",
+        "update the protocol summary for stage three",
+        "which stage is the patient currently in",
+        "mark the consent form complete for patient",
+        "change the protocol for stage two",
+        "list checklist progress for the patient",
+        "has the patient finished stage one tasks",
+        "record protocol amendment for the trial",
+        "show outstanding checklist items for my patients",
+        "is the patient's enrollment active",
+        "advance the patient to the next stage",
+    ],
+}
+
+# Held out from training; None marks turns that must go to the LLM router
+CALIBRATION_EXAMPLES: List[Tuple[str, Optional[str]]] = [
+    ("show my prescriptions", EMR_MANAGER),
+    ("what allergies are in my medical record", EMR_MANAGER),
+    ("add a log entry to the patient's emr", EMR_MANAGER),
+    ("what diagnosis is on my record", EMR_MANAGER),
+    ("how long is the follow up period of the trial", TRIAL_INFO),
+    ("explain what happens in the screening stage", TRIAL_INFO),
+    ("who is the sponsor of this study", TRIAL_INFO),
+    ("am I eligible for this trial", TRIAL_INFO),
+    ("what is the enrollment progress for patient maria", CLINICAL_ORG),
+    ("update the protocol for stage one", CLINICAL_ORG),
+    ("which stage is patient john in", CLINICAL_ORG),
+    ("show checklist progress for my patients", CLINICAL_ORG),
+    ("what's the weather tomorrow", None),
+    ("tell me a joke", None),
+    ("hi there", None),
+    ("thanks, that's all", None),
+    ("who won the game last night", None),
+    ("can you help me with something", None),
+    ("what is the capital of france", None),
+    ("what should I do next", None),
+    ("what time is it", None),
+    ("book me a flight to boston", None),
+    # Near misses: share a word or keyword with an intent but are off topic
+    ("what's the progress on the football game", None),
+    ("what is the weather like at the trial site", None),
+    ("is it going to rain during my trial visit", None),
+    ("my record label wants a new song", None),
+]
+
+# Too common to count as evidence for any intent
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "am", "i", "me", "my", "you", "your", "to", "of", "in", "on", "for",
+    "and", "or", "it", "this", "that", "what", "who", "how", "do", "does", "can", "be", "with", "at", "about",
+}
+
+_compiled_rules = {label: [re.compile(p, re.IGNORECASE) for p in patterns] for label, patterns in KEYWORD_RULES.items()}
+
+
+def tokenize(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesIntentModel:
+    """Multinomial Naive Bayes over unigrams and bigrams with Laplace smoothing."""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.labels = list(examples)
+        self.token_counts = {label: Counter() for label in self.labels}
+        self.totals = defaultdict(int)
+        vocabulary = set()
+        for label, texts in examples.items():
+            for text in texts:
+                tokens = tokenize(text)
+                self.token_counts[label].update(tokens)
+                self.totals[label] += len(tokens)
+                vocabulary.update(tokens)
+        self.vocabulary = vocabulary
+        self.vocab_size = len(vocabulary)
+        total_docs = sum(len(texts) for texts in examples.values())
+        self.log_priors = {label: math.log(len(examples[label]) / total_docs) for label in self.labels}
+
+    def known_content_tokens(self, text: str) -> int:
+        return sum(1 for t in set(re.findall(r"[a-z0-9']+", text.lower())) if t in self.vocabulary and t not in STOPWORDS)
+
+    def log_likelihoods(self, text: str) -> Dict[str, float]:
+        # Unseen tokens carry no evidence; smoothing would otherwise favor the smallest class
+        tokens = [t for t in tokenize(text) if t in self.vocabulary]
+        scores = {}
+        for label in self.labels:
+            denominator = self.totals[label] + self.vocab_size
+            counts = self.token_counts[label]
+            scores[label] = self.log_priors[label] + sum(math.log((counts[t] + 1) / denominator) for t in tokens)
+        return scores
+
+
+@lru_cache(maxsize=1)
+def get_intent_model() -> NaiveBayesIntentModel:
+    return NaiveBayesIntentModel(TRAINING_EXAMPLES)
+
+
+def classify_intent(text: str) -> Tuple[Optional[str], float]:
+    """
+    Returns the most likely sub-agent and its probability, or (None, 0.0) when
+    the turn has too little known vocabulary to classify.
+    """
+    model = get_intent_model()
+    if model.known_content_tokens(text) < INTENT_ROUTER_MIN_KNOWN_TOKENS:
+        return None, 0.0
+    scores = model.log_likelihoods(text)
+    for label, rules in _compiled_rules.items():
+        scores[label] += KEYWORD_WEIGHT * sum(1 for rule in rules if rule.search(text))
+
+    # Softmax over the combined log scores
+    top = max(scores.values())
+    exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+    total = sum(exp_scores.values())
+    label = max(exp_scores, key=exp_scores.get)  # type: ignore
+    return label, exp_scores[label] / total
+
+
+def calibrate_threshold(examples: List[Tuple[str, Optional[str]]] = CALIBRATION_EXAMPLES) -> float:
+    """
+    The lowest confidence at which no calibration example is misrouted: just
+    above the most confident wrong (or should-fall-back) prediction, capped at
+    CONFIDENCE_CEILING.
+    """
+    wrong = [(confidence, text) for text, expected in examples
+             for label, confidence in [classify_intent(text)] if label is not None and label != expected]
+    threshold = max([CONFIDENCE_FLOOR] + [c + CALIBRATION_MARGIN for c, _ in wrong])
+    if threshold > CONFIDENCE_CEILING:
+        misrouted = [text for c, text in wrong if c >= CONFIDENCE_CEILING]
+        print(f"Intent router threshold capped at {CONFIDENCE_CEILING} (calibration wanted {threshold:.3f}); "
+              f"still misrouted: {misrouted}")
+        return CONFIDENCE_CEILING
+    return threshold
+
+
+@lru_cache(maxsize=1)
+def min_confidence() -> float:
+    if INTENT_ROUTER_MIN_CONFIDENCE:
+        return float(INTENT_ROUTER_MIN_CONFIDENCE)
+    return calibrate_threshold()
+
+
+def route_fast_path(text: str) -> Optional[str]:
+    """The sub-agent to dispatch to directly, or None to fall back to the LLM router."""
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    label, confidence = classify_intent(text)
+    return label if label is not None and confidence >= min_confidence() else None
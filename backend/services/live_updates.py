@@ -0,0 +1,188 @@
+# services/live_updates.py
+"""
+Server-sent event streams of patient and org changes.
+
+Each stream subscribes to the change feed and emits only the fields that
+changed, as {"type", "id", "changes": {"path/to/field": value}} with None for
+removed fields. A patient stream covers their enrollments, the stages of the
+trials they are enrolled in, their profile and an EMR summary; an org stream
+covers its enrollments and its dashboard summary.
+
+Every connection starts with the current state of each covered record, as
+frames with "replace": true whose changes hold every field, so a client that
+reconnects (or replaces its connection) catches up on whatever changed while
+it was not connected.
+"""
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from services.change_feed import Change, change_feed
+from services.prompt_builder import project_emr
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_QUEUE_MAX_EVENTS = 1000
+
+# Never streamed to clients
+PRIVATE_USER_FIELDS = ("password",)
+
+# (event type, record id, projected record before, projected record after)
+Update = Tuple[str, str, Any, Any]
+Projection = Callable[[Change], List[Update]]
+# The current state of every record a stream covers, as updates from None
+Snapshot = Callable[[], List[Update]]
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, Any]:
+    """{"a": {"b": 1}} -> {"a/b": 1}; lists are indexed like RTDB paths."""
+    if isinstance(value, list):
+        value = {str(i): v for i, v in enumerate(value) if v is not None}
+    if not isinstance(value, dict) or not value:
+        return {prefix: value} if prefix else {}
+    flat = {}
+    for key, child in value.items():
+        flat.update(flatten(child, f"{prefix}/{key}" if prefix else str(key)))
+    return flat
+
+
+def changed_fields(before: Any, after: Any) -> Dict[str, Any]:
+    old, new = flatten(before), flatten(after)
+    changes = {path: value for path, value in new.items() if path not in old or old[path] != value}
+    changes.update({path: None for path in old if path not in new})
+    return changes
+
+
+def _field(record: Any, name: str) -> Any:
+    return record.get(name) if isinstance(record, dict) else None
+
+
+def public_profile(user: Any) -> Optional[Dict]:
+    """A user record without fields that must never reach a client."""
+    return {k: v for k, v in user.items() if k not in PRIVATE_USER_FIELDS} if isinstance(user, dict) else None
+
+
+def patient_projection(patient_id: str) -> Projection:
+    def project(change: Change) -> List[Update]:
+        if change.key is None:
+            return []
+        before, after = change.previous, change.value
+        mirror = change_feed.mirror
+        if change.root == "enrollments":
+            # Includes enrollments that stopped belonging to the patient (or were deleted)
+            if patient_id in (_field(before, "patientId"), _field(after, "patientId")):
+                return [("enrollment", change.key, before, after)]
+        elif change.root == "trials":
+            enrolled = {e.get("trialId") for e in mirror.get("enrollments", {}).values()
+                        if isinstance(e, dict) and e.get("patientId") == patient_id}
+            if change.key in enrolled:
+                return [("stages", change.key, _field(before, "stages"), _field(after, "stages"))]
+        elif change.root == "users" and change.key == patient_id:
+            return [("profile", patient_id, public_profile(before), public_profile(after))]
+        elif change.root == "emr_records":
+            emr_id = _field(mirror.get("users", {}).get(patient_id), "emrId")
+            if change.key in (patient_id, emr_id):
+                return [("emr", patient_id, project_emr(before or {}), project_emr(after or {}))]
+        return []
+
+    return project
+
+
+def patient_snapshot(patient_id: str) -> Snapshot:
+    def snapshot() -> List[Update]:
+        enrollments = {key: e for key, e in change_feed.snapshot("enrollments").items()
+                       if _field(e, "patientId") == patient_id}
+        trials = change_feed.snapshot("trials")
+        user = change_feed.snapshot("users").get(patient_id)
+        emr_records = change_feed.snapshot("emr_records")
+        emr = emr_records.get(patient_id) or emr_records.get(_field(user, "emrId"))
+        updates: List[Update] = [("enrollment", key, None, e) for key, e in enrollments.items()]
+        for trial_id in {e.get("trialId") for e in enrollments.values()}:
+            if trial_id in trials:
+                updates.append(("stages", trial_id, None, _field(trials[trial_id], "stages")))
+        if user is not None:
+            updates.append(("profile", patient_id, None, public_profile(user)))
+        if emr is not None:
+            updates.append(("emr", patient_id, None, project_emr(emr)))
+        return updates
+
+    return snapshot
+
+
+def org_projection(org_id: str) -> Projection:
+    def project(change: Change) -> List[Update]:
+        if change.key is None:
+            return []
+        before, after = change.previous, change.value
+        if change.root == "enrollments" and org_id in (_field(before, "orgId"), _field(after, "orgId")):
+            return [("enrollment", change.key, before, after)]
+        if change.root == "orgSummaries" and change.key == org_id:
+            return [("summary", org_id, before, after)]
+        return []
+
+    return project
+
+
+def org_snapshot(org_id: str) -> Snapshot:
+    def snapshot() -> List[Update]:
+        updates: List[Update] = [("enrollment", key, None, e) for key, e in change_feed.snapshot("enrollments").items()
+                                 if _field(e, "orgId") == org_id]
+        summary = change_feed.snapshot("orgSummaries").get(org_id)
+        if summary is not None:
+            updates.append(("summary", org_id, None, summary))
+        return updates
+
+    return snapshot
+
+
+def _frame(kind: str, record_id: str, changes: Dict[str, Any], replace: bool = False) -> str:
+    message = {"type": kind, "id": record_id, "changes": changes}
+    if replace:
+        message["replace"] = True
+    return f"event: {kind}\ndata: {json.dumps(message, default=str)}\n\n"
+
+
+async def stream_changes(project: Projection, snapshot: Snapshot,
+                         is_disconnected: Callable[[], Any]) -> AsyncIterator[str]:
+    """
+    Yields SSE frames with the current state of every record the snapshot
+    covers, then the changed fields of every record the projection selects.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAX_EVENTS)
+
+    def on_change(change: Change):
+        # Runs on the listener thread; hand over to the event loop
+        for update in project(change):
+            loop.call_soon_threadsafe(_offer, queue, update)
+
+    unsubscribe = change_feed.subscribe(on_change)
+    # Diffs are taken against what this client was last sent, so a dropped
+    # event is folded into the next one instead of being lost.
+    last_sent: Dict[Tuple[str, str], Any] = {}
+    try:
+        yield "retry: 3000\n\n"
+        # Read after subscribing: a change landing in between is queued and diffs to nothing new
+        for kind, record_id, _, current in snapshot():
+            last_sent[(kind, record_id)] = current
+            yield _frame(kind, record_id, flatten(current), replace=True)
+        while not await is_disconnected():
+            try:
+                kind, record_id, before, after = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment frame keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            changes = changed_fields(last_sent.get((kind, record_id), before), after)
+            last_sent[(kind, record_id)] = after
+            if changes:
+                yield _frame(kind, record_id, changes)
+    finally:
+        unsubscribe()
+
+
+def _offer(queue: asyncio.Queue, update: Update):
+    try:
+        queue.put_nowait(update)
+    except asyncio.QueueFull:
+        print("Live update queue full; dropping a change for a slow client")
@@ -0,0 +1,411 @@
+# services/matching_service.py
+"""
+Vectorized patient-trial eligibility matching.
+
+Trial criteria and patient features are compiled once into NumPy arrays:
+
+- conditions: a shared vocabulary of trial condition terms; patients get a
+  multi-hot row (P, n x c) and trials a multi-hot row (T, m x c)
+- age: patient ages vs. each trial's [minAge, maxAge] (from `eligibility`, or
+  parsed from "aged 30-65" in the description)
+- smoking: current smokers vs. trials with eligibility.excludeSmokers
+- capacity/status: trials that are Recruiting/Active with open slots
+
+Scores are P @ T.T normalized by the trial's term count, masked by the
+eligibility checks, so every patient is scored against every trial in one
+pass (chunked over patients to bound memory).
+
+With the change feed running, a changed user, EMR or trial patches just its
+row of the cached index. Changes that alter the condition vocabulary (new
+trials or terms) rebuild the index on a background thread from the feed's
+mirror, while requests keep scoring against the current one.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from firebase_config import realtime_db
+from services.cache_service import TTLCache
+from services.warmup_service import register_warmup
+from services.change_feed import CHANGE_FEED_CACHE_TTL_SECONDS, Change, change_feed, on_change
+
+MATCHING_INDEX_TTL_SECONDS = float(os.getenv("MATCHING_INDEX_TTL_SECONDS", "300"))
+MATCHING_CHUNK_SIZE = int(os.getenv("MATCHING_CHUNK_SIZE", "8192"))
+OPEN_STATUSES = ("Recruiting", "Active")
+# Patients with no recorded age are not excluded by age limits, but rank below known-eligible ones
+UNKNOWN_AGE_FACTOR = 0.9
+
+_AGE_RANGE = re.compile(r"aged\s+(\d{1,3})\s*(?:-|–|to)\s*(\d{1,3})", re.IGNORECASE)
+
+
+def _emr_id(main_id: str) -> str:
+    return hashlib.sha256(main_id.encode()).hexdigest()
+
+
+def _patient_condition_texts(emr: Dict) -> List[str]:
+    texts = list(emr.get("underlying_conditions") or []) + list(emr.get("conditions") or [])
+    log = emr.get("log") or []
+    for entry in (log.values() if isinstance(log, dict) else log):
+        if isinstance(entry, dict) and entry.get("type") == "diagnosis":
+            texts.append(entry.get("description", ""))
+    return [str(t).lower() for t in texts if t]
+
+
+def _trial_terms(trial: Dict) -> List[str]:
+    eligibility = trial.get("eligibility") or {}
+    terms = list(eligibility.get("conditions") or [])
+    if trial.get("condition"):
+        terms.append(trial["condition"])
+    return sorted({t.strip().lower() for t in terms if t and t.strip()})
+
+
+def _trial_age_range(trial: Dict) -> Tuple[float, float]:
+    eligibility = trial.get("eligibility") or {}
+    low, high = eligibility.get("minAge"), eligibility.get("maxAge")
+    if low is None and high is None:
+        match = _AGE_RANGE.search(trial.get("description") or "")
+        if match:
+            low, high = int(match.group(1)), int(match.group(2))
+    return float(low) if low is not None else -np.inf, float(high) if high is not None else np.inf
+
+
+class MatchingIndex:
+    """Compiled patient and trial arrays for one snapshot of users, EMRs and trials."""
+
+    def __init__(self, users: Dict, emr_records: Dict, trials: Dict):
+        self.trial_ids = list(trials)
+        self.trial_index = {trial_id: j for j, trial_id in enumerate(self.trial_ids)}
+        self.trials = [trials[t] for t in self.trial_ids]
+        self.vocabulary = sorted({term for trial in self.trials for term in _trial_terms(trial)})
+        self.term_index = {term: i for i, term in enumerate(self.vocabulary)}
+        # Rows are patched in place from the change feed while requests score
+        self._lock = threading.RLock()
+
+        # Trial side (m trials)
+        m, c = len(self.trials), len(self.vocabulary)
+        self.T = np.zeros((m, c), dtype=np.float32)
+        self.min_age = np.zeros(m, dtype=np.float32)
+        self.max_age = np.zeros(m, dtype=np.float32)
+        self.excludes_smokers = np.zeros(m, dtype=bool)
+        self.trial_open = np.zeros(m, dtype=bool)
+        self.inv_term_counts = np.zeros(m, dtype=np.float32)
+        for j, trial in enumerate(self.trials):
+            self._set_trial_row(j, trial)
+
+        # Patient side (n patients). Condition strings repeat a lot, so their term rows are memoized.
+        self.patient_ids = [uid for uid, u in users.items() if isinstance(u, dict) and u.get("userType") == "patient"]
+        self.patient_index = {uid: i for i, uid in enumerate(self.patient_ids)}
+        n = len(self.patient_ids)
+        self.patients: List[Dict] = [{}] * n
+        self.P = np.zeros((n, c), dtype=np.float32)
+        self.age = np.full(n, np.nan, dtype=np.float32)
+        self.smoker = np.zeros(n, dtype=bool)
+        self.present = np.ones(n, dtype=bool)
+        # emrId (and main id) -> patient id, to route EMR changes to their row
+        self.emr_owner: Dict[str, str] = {}
+        self._row_cache: Dict[str, np.ndarray] = {}
+        for i, uid in enumerate(self.patient_ids):
+            self._set_patient_row(i, uid, users[uid], self._emr_for(uid, users[uid], emr_records))
+
+    @staticmethod
+    def _emr_for(uid: str, user: Dict, emr_records: Dict) -> Dict:
+        return emr_records.get(uid) or emr_records.get(user.get("emrId") or _emr_id(uid)) or {}
+
+    def _set_trial_row(self, j: int, trial: Dict):
+        self.T[j] = 0.0
+        for term in _trial_terms(trial):
+            self.T[j, self.term_index[term]] = 1.0
+        self.min_age[j], self.max_age[j] = _trial_age_range(trial)
+        self.excludes_smokers[j] = bool((trial.get("eligibility") or {}).get("excludeSmokers"))
+        capacity = trial.get("maxParticipants") or np.inf
+        self.trial_open[j] = trial.get("status") in OPEN_STATUSES and (trial.get("currentParticipants") or 0) < capacity
+        term_count = self.T[j].sum()
+        self.inv_term_counts[j] = 1.0 / term_count if term_count else 0.0
+
+    def _set_patient_row(self, i: int, uid: str, user: Dict, emr: Dict):
+        # Only display fields are kept; user records also carry password hashes
+        self.patients[i] = {k: user.get(k) for k in ("firstName", "lastName", "age", "emrId", "orgId")}
+        self.emr_owner[user.get("emrId") or _emr_id(uid)] = uid
+        self.emr_owner[uid] = uid
+        self.P[i] = 0.0
+        for text in _patient_condition_texts(emr):
+            row = self._row_cache.get(text)
+            if row is None:
+                row = np.array([term in text or text in term for term in self.vocabulary], dtype=np.float32)
+                self._row_cache[text] = row
+            np.maximum(self.P[i], row, out=self.P[i])
+        self.age[i] = user["age"] if isinstance(user.get("age"), (int, float)) else np.nan
+        self.smoker[i] = str(emr.get("smoker_status", "")).lower().startswith("current")
+        self.present[i] = True
+
+    def upsert_patient(self, uid: str, user: Optional[Dict], emr: Dict):
+        """Re-scores one patient's row (appending it if new); a non-patient or None removes it."""
+        with self._lock:
+            i = self.patient_index.get(uid)
+            if not isinstance(user, dict) or user.get("userType") != "patient":
+                if i is not None:
+                    self.present[i] = False
+                    del self.patient_index[uid]
+                return
+            if i is None:
+                i = len(self.patient_ids)
+                self.patient_ids.append(uid)
+                self.patients.append({})
+                self.P = np.vstack([self.P, np.zeros((1, len(self.vocabulary)), dtype=np.float32)])
+                self.age = np.append(self.age, np.float32(np.nan))
+                self.smoker = np.append(self.smoker, False)
+                self.present = np.append(self.present, True)
+            self.patient_index[uid] = i
+            self._set_patient_row(i, uid, user, emr)
+
+    def upsert_trial(self, trial_id: str, trial: Optional[Dict]) -> bool:
+        """
+        Patches one trial's row in place. Returns False when the change needs a
+        rebuild (a new trial, or condition terms outside the vocabulary).
+        """
+        with self._lock:
+            j = self.trial_index.get(trial_id)
+            if trial is None:
+                if j is not None:
+                    self.trial_open[j] = False
+                    del self.trial_index[trial_id]
+                return True
+            if j is None or not set(_trial_terms(trial)) <= set(self.vocabulary):
+                return False
+            self.trials[j] = trial
+            self._set_trial_row(j, trial)
+            return True
+
+    def patients_in_org(self, org_id: str) -> List[str]:
+        with self._lock:
+            return [uid for uid, p in zip(self.patient_ids, self.patients) if p.get("orgId") == org_id]
+
+    def score_block(self, patient_rows: slice, trial_cols=slice(None)) -> np.ndarray:
+        """Eligibility-masked match scores for a block of patients x trials."""
+        with self._lock:
+            return self._score_block(patient_rows, trial_cols)
+
+    def _score_block(self, patient_rows: slice, trial_cols) -> np.ndarray:
+        P, age, smoker = self.P[patient_rows], self.age[patient_rows], self.smoker[patient_rows]
+        condition_score = (P @ self.T[trial_cols].T) * self.inv_term_counts[trial_cols]
+
+        age_col = age[:, None]
+        known_age = ~np.isnan(age_col)
+        age_ok = ~known_age | ((age_col >= self.min_age[trial_cols]) & (age_col <= self.max_age[trial_cols]))
+        smoker_ok = ~(smoker[:, None] & self.excludes_smokers[trial_cols])
+        eligible = age_ok & smoker_ok & self.trial_open[trial_cols] & self.present[patient_rows][:, None]
+
+        scores = np.where(eligible, condition_score, 0.0)
+        return np.where(known_age, scores, scores * UNKNOWN_AGE_FACTOR).astype(np.float32)
+
+    def score_all(self, chunk_size: int = MATCHING_CHUNK_SIZE) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (first_patient_row, scores) for every patient against every trial, chunk by chunk."""
+        for start in range(0, len(self.patient_ids), chunk_size):
+            yield start, self.score_block(slice(start, start + chunk_size))
+
+    def candidates_for_trial(self, trial_id: str, limit: int, exclude: Optional[set] = None,
+                             include: Optional[set] = None) -> List[Dict]:
+        """Top patients for a trial; include restricts the ranking to those patient ids."""
+        with self._lock:
+            return self._candidates_for_trial(trial_id, limit, exclude, include)
+
+    def _candidates_for_trial(self, trial_id, limit, exclude, include) -> List[Dict]:
+        j = self.trial_index[trial_id]
+        scores = np.concatenate([s[:, 0] for _, s in self._column_chunks(j)]) if self.patient_ids else np.zeros(0)
+        results = []
+        for i in np.argsort(-scores, kind="stable"):
+            if scores[i] <= 0 or len(results) >= limit:
+                break
+            if (exclude and self.patient_ids[i] in exclude) or (include is not None and self.patient_ids[i] not in include):
+                continue
+            patient = self.patients[i]
+            results.append({
+                "patientId": self.patient_ids[i],
+                "firstName": patient.get("firstName"),
+                "lastName": patient.get("lastName"),
+                "age": patient.get("age"),
+                "score": round(float(scores[i]), 4),
+                "matchedConditions": [t for t, hit in zip(self.vocabulary, self.P[i] * self.T[j]) if hit],
+            })
+        return results
+
+    def _column_chunks(self, j: int):
+        for start in range(0, len(self.patient_ids), MATCHING_CHUNK_SIZE):
+            yield start, self.score_block(slice(start, start + MATCHING_CHUNK_SIZE), slice(j, j + 1))
+
+    def trials_for_patient(self, patient_id: str, limit: int) -> List[Dict]:
+        with self._lock:
+            return self._trials_for_patient(patient_id, limit)
+
+    def _trials_for_patient(self, patient_id: str, limit: int) -> List[Dict]:
+        i = self.patient_index[patient_id]
+        scores = self.score_block(slice(i, i + 1))[0]
+        results = []
+        for j in np.argsort(-scores, kind="stable")[:limit]:
+            if scores[j] <= 0:
+                break
+            trial = self.trials[j]
+            results.append({
+                "trialId": self.trial_ids[j],
+                "title": trial.get("title"),
+                "condition": trial.get("condition"),
+                "status": trial.get("status"),
+                "location": trial.get("location"),
+                "score": round(float(scores[j]), 4),
+                "matchedConditions": [t for t, hit in zip(self.vocabulary, self.P[i] * self.T[j]) if hit],
+            })
+        return results
+
+
+matching_index_cache = TTLCache("matching_index", ttl_seconds=MATCHING_INDEX_TTL_SECONDS)
+
+
+def load_matching_index() -> MatchingIndex:
+    print("RTDB: Building patient-trial matching index")
+    users = realtime_db.reference('users').get() or {}
+    emr_records = realtime_db.reference('emr_records').get() or {}
+    trials = realtime_db.reference('trials').get() or {}
+    return MatchingIndex(users, emr_records, trials)  # type: ignore
+
+
+def get_matching_index() -> MatchingIndex:
+    return matching_index_cache.get_or_load("index", load_matching_index)
+
+
+@register_warmup("matching_index")
+def warm_matching_index():
+    matching_index_cache.set("index", load_matching_index())
+
+
+_MATCHING_ROOTS = ("users", "emr_records", "trials")
+_rebuild_lock = threading.Lock()
+_rebuild_pending = threading.Event()
+
+
+def _feed_covers_matching() -> bool:
+    return change_feed.running and all(root in change_feed.roots for root in _MATCHING_ROOTS)
+
+
+def _build_index() -> MatchingIndex:
+    if _feed_covers_matching():
+        # The change-feed mirror already holds every record; no RTDB reads needed
+        return MatchingIndex(*(change_feed.snapshot(root) for root in _MATCHING_ROOTS))
+    return load_matching_index()
+
+
+def schedule_matching_rebuild():
+    """Rebuilds the index on a background thread; requests keep using the current one meanwhile."""
+    _rebuild_pending.set()
+    if not _rebuild_lock.acquire(blocking=False):
+        return  # The running rebuild picks up the pending request
+    threading.Thread(target=_rebuild_loop, name="matching-rebuild", daemon=True).start()
+
+
+def _rebuild_loop():
+    try:
+        while _rebuild_pending.is_set():
+            _rebuild_pending.clear()
+            try:
+                matching_index_cache.set("index", _build_index())
+            except Exception as e:
+                print(f"Matching index rebuild failed: {e}")
+    finally:
+        _rebuild_lock.release()
+    if _rebuild_pending.is_set():
+        schedule_matching_rebuild()
+
+
+def _patchable_index() -> Optional[MatchingIndex]:
+    """The cached index if a change can be patched into it, otherwise None (after scheduling a rebuild)."""
+    index = matching_index_cache.get("index")
+    if index is None:
+        return None
+    if not _feed_covers_matching():
+        schedule_matching_rebuild()
+        return None
+    if _rebuild_lock.locked():
+        # The rebuild in flight may predate this change; patch now and rebuild once more after it
+        _rebuild_pending.set()
+    return index
+
+
+def _on_matching_snapshot():
+    # The listener's initial snapshot is skipped: the warm-up just built from the same data.
+    if _feed_covers_matching():
+        matching_index_cache.ttl_seconds = CHANGE_FEED_CACHE_TTL_SECONDS
+
+
+@on_change("users")
+def sync_matching_patient(change: Change):
+    if change.key is None:
+        return _on_matching_snapshot()
+    index = _patchable_index()
+    if index is not None:
+        user = change.value if isinstance(change.value, dict) else None
+        emr = MatchingIndex._emr_for(change.key, user or {}, change_feed.mirror.get("emr_records", {}))
+        index.upsert_patient(change.key, user, emr)
+
+
+@on_change("emr_records")
+def sync_matching_emr(change: Change):
+    if change.key is None:
+        return _on_matching_snapshot()
+    index = _patchable_index()
+    owner = index.emr_owner.get(change.key) if index is not None else None
+    if owner is not None:
+        emr = change.value if isinstance(change.value, dict) else {}
+        index.upsert_patient(owner, change_feed.mirror.get("users", {}).get(owner), emr)  # type: ignore
+
+
+@on_change("trials")
+def sync_matching_trial(change: Change):
+    if change.key is None:
+        return _on_matching_snapshot()
+    index = _patchable_index()
+    if index is not None and not index.upsert_trial(change.key, change.value if isinstance(change.value, dict) else None):
+        # New trial or new condition terms: the vocabulary changes, so rebuild off the request path
+        schedule_matching_rebuild()
+
+
+def _enrollments_where(field: str, value: str) -> List[Dict]:
+    # Indexed query: needs ".indexOn": ["patientId", "trialId", "orgId"] on enrollments
+    matches = realtime_db.reference('enrollments').order_by_child(field).equal_to(value).get() or {}
+    return [e for e in matches.values() if isinstance(e, dict)]  # type: ignore
+
+
+async def get_trial_candidates(org_id: str, trial_id: str, limit: int = 50) -> List[Dict]:
+    """
+    Ranks the org's patients eligible for a trial the org runs, skipping those
+    already actively enrolled in it. Patients belong to an org through their
+    orgId or an enrollment with it; trials through their orgId or, when they
+    have none, an enrollment with it. Other orgs' trials are reported as not found.
+    """
+    # A cold index is built from RTDB and the enrollment queries block, so both run off the event loop
+    index, trial_enrollments, org_enrollments = await asyncio.gather(
+        asyncio.to_thread(get_matching_index),
+        asyncio.to_thread(_enrollments_where, 'trialId', trial_id),
+        asyncio.to_thread(_enrollments_where, 'orgId', org_id),
+    )
+    if trial_id not in index.trial_index:
+        raise ValueError(f"Trial '{trial_id}' not found.")
+    trial_org = index.trials[index.trial_index[trial_id]].get("orgId")
+    runs_trial = trial_org == org_id if trial_org else any(e.get("orgId") == org_id for e in trial_enrollments)
+    if not runs_trial:
+        raise ValueError(f"Trial '{trial_id}' not found.")
+
+    org_patients = {e.get("patientId") for e in org_enrollments}
+    org_patients.update(index.patients_in_org(org_id))
+    enrolled = {e.get("patientId") for e in trial_enrollments if e.get("isActive") is True}
+    return index.candidates_for_trial(trial_id, limit, exclude=enrolled, include=org_patients)
+
+
+async def get_matching_trials_for_patient(patient_id: str, limit: int = 20) -> List[Dict]:
+    index = await asyncio.to_thread(get_matching_index)
+    if patient_id not in index.patient_index:
+        raise ValueError(f"No patient profile found for '{patient_id}'.")
+    return index.trials_for_patient(patient_id, limit)
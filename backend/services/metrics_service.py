@@ -0,0 +1,281 @@
+# services/metrics_service.py
+"""
+In-process metrics registry exposed in Prometheus text format at /metrics.
+
+Covers per-route HTTP latency and in-flight requests, RTDB calls by path prefix,
+LLM calls by provider/model and cache hit ratios.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from starlette.routing import Match
+
+from services.rtdb_budget import record_call as record_rtdb_call
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_label_str(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        self._counts: Dict[tuple, list] = {}
+        self._sums: Dict[tuple, float] = defaultdict(float)
+
+    def observe(self, *label_values: str, value: float):
+        with self._lock:
+            counts = self._counts.setdefault(label_values, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[label_values] += value
+
+    def render(self) -> list:
+        lines = self.header()
+        with self._lock:
+            items = [(k, list(v), self._sums[k]) for k, v in self._counts.items()]
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets, counts):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+# --- Metric definitions ---
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served by route.", ("method", "route"))
+
+rtdb_call_duration = Histogram("rtdb_call_duration_seconds", "Realtime Database call latency by operation and path prefix.", ("op", "prefix"))
+rtdb_call_errors = Counter("rtdb_call_errors_total", "Realtime Database calls that raised.", ("op", "prefix"))
+
+llm_call_duration = Histogram("llm_call_duration_seconds", "Model call latency by provider and model.", ("provider", "model"))
+llm_tokens = Counter("llm_tokens_total", "Model tokens by provider, model and kind (prompt/completion).", ("provider", "model", "kind"))
+llm_call_errors = Counter("llm_call_errors_total", "Model calls that failed.", ("provider", "model"))
+llm_prompt_tokens = Histogram("llm_prompt_tokens", "Prompt size in tokens by purpose.", ("purpose",),
+                              buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+
+cache_lookups = Counter("cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result"))
+
+agent_routes = Counter("agent_routes_total", "Agent turns by routing path (fast-path sub-agent or llm_router).", ("route",))
+
+change_feed_events = Counter("change_feed_events_total", "RTDB change-feed events by root and type (put/patch).", ("root", "event_type"))
+
+admission_rejections = Counter("admission_rejections_total", "Requests shed by admission control by route class and status (429/503).", ("route_class", "status"))
+admission_queue_depth = Gauge("admission_queue_depth", "Requests waiting for a concurrency slot by route class.", ("route_class",))
+
+ALL_METRICS = [
+    http_request_duration, http_requests_in_flight,
+    rtdb_call_duration, rtdb_call_errors,
+    llm_call_duration, llm_tokens, llm_call_errors, llm_prompt_tokens,
+    cache_lookups,
+    agent_routes,
+    change_feed_events,
+    admission_rejections, admission_queue_depth,
+]
+
+
+def record_llm_call(provider: str, model: str, duration: float, prompt_tokens: Optional[int] = None,
+                    completion_tokens: Optional[int] = None, error: bool = False):
+    """Records one model call. Token counts are optional since not every provider reports them."""
+    llm_call_duration.observe(provider, model, value=duration)
+    if prompt_tokens:
+        llm_tokens.inc(provider, model, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        llm_tokens.inc(provider, model, "completion", amount=completion_tokens)
+    if error:
+        llm_call_errors.inc(provider, model)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    cache_lookups.inc(cache, "hit" if hit else "miss")
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+
+    # Hit ratios are derived so dashboards don't have to divide counters themselves.
+    lines += ["# HELP cache_hit_ratio Fraction of cache lookups that hit.", "# TYPE cache_hit_ratio gauge"]
+    caches = {key[0] for key, _ in list(cache_lookups._values.items())}
+    for cache in sorted(caches):
+        hits, misses = cache_lookups.value(cache, "hit"), cache_lookups.value(cache, "miss")
+        total = hits + misses
+        lines.append(f'cache_hit_ratio{{cache="{cache}"}} {hits / total if total else 0.0}')
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP instrumentation ---
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route_template(self, scope) -> str:
+        router = scope["app"].router
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_template(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method, route)
+            http_request_duration.observe(method, route, str(status["code"]), value=time.perf_counter() - start)
+
+
+# --- RTDB instrumentation ---
+def rtdb_path_prefix(path: str) -> str:
+    """'/users/abc/profile' -> 'users'."""
+    return path.strip("/").split("/", 1)[0] or "/"
+
+
+def _ref_path(obj) -> str:
+    # Reference exposes .path; Query only keeps the REST url suffix ('/users.json').
+    path = getattr(obj, "path", None) or getattr(obj, "_pathurl", "/")
+    return path[:-len(".json")] if path.endswith(".json") else path
+
+
+def _instrument_method(cls, op: str):
+    original = getattr(cls, op)
+    if getattr(original, "_metrics_wrapped", False):
+        return
+
+    def wrapper(self, *args, **kwargs):
+        path = _ref_path(self)
+        prefix = rtdb_path_prefix(path)
+        start = time.perf_counter()
+        try:
+            result = original(self, *args, **kwargs)
+        except Exception:
+            rtdb_call_errors.inc(op, prefix)
+            raise
+        finally:
+            rtdb_call_duration.observe(op, prefix, value=time.perf_counter() - start)
+        # Reads are sized by what came back, writes by what was sent.
+        payload = result if op == "get" else (args[0] if args and op in ("set", "update", "push") else None)
+        record_rtdb_call(op, path, payload)
+        return result
+
+    wrapper._metrics_wrapped = True  # type: ignore
+    wrapper.__wrapped__ = original  # type: ignore
+    wrapper.__doc__ = original.__doc__
+    setattr(cls, op, wrapper)
+
+
+def instrument_rtdb():
+    """Wraps firebase_admin Reference/Query operations so every RTDB call is measured and budgeted."""
+    from firebase_admin import db
+
+    for op in ("get", "set", "update", "push", "delete", "transaction"):
+        _instrument_method(db.Reference, op)
+    _instrument_method(db.Query, "get")
+
+
+# --- LLM instrumentation (LangChain models) ---
+class LLMMetricsCallback(AsyncCallbackHandler):
+    """Records latency, token usage and errors for LangChain chat model calls."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self._starts: Dict[Any, float] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        duration = time.perf_counter() - self._starts.pop(run_id, time.perf_counter())
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        record_llm_call(self.provider, self.model, duration, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        duration = time.perf_counter() - self._starts.pop(run_id, time.perf_counter())
+        record_llm_call(self.provider, self.model, duration, error=True)
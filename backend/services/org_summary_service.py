@@ -0,0 +1,141 @@
+# services/org_summary_service.py
+"""
+Per-organization dashboard aggregates, stored at orgSummaries/{org_id}:
+
+    {
+      "activePatients": 12,
+      "checklistItems": 140, "checklistCompleted": 95,
+      "trials": {
+        "<trialId>": {
+          "activePatients": 4,
+          "stages": {"stage1": 1, "stage2": 3},
+          "checklistItems": 50, "checklistCompleted": 31
+        }
+      }
+    }
+
+Only active enrollments are counted. Checklist totals cover every item in the
+trial's protocol checklists (stage_checklists), whether or not the enrollment's
+checklistProgress mentions it yet. Every enrollment write calls
+apply_enrollment_delta(before, after), which adds the difference in a
+transaction, so reading a summary is a single lookup. recompute_org_summaries()
+rebuilds all of them from the enrollments node, e.g. after a protocol's
+checklists change.
+"""
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from firebase_config import realtime_db
+from services.stage_service import get_trial_stages, stage_checklists
+from services.warmup_service import register_warmup
+
+SUMMARY_ROOT = "orgSummaries"
+
+Counters = Dict[Tuple[str, ...], int]
+
+
+def _checklist_counts(enrollment: Dict) -> Tuple[int, int]:
+    """(protocol checklist items, items this enrollment has completed) for its trial."""
+    checklists = stage_checklists(get_trial_stages(enrollment.get("trialId"))) if enrollment.get("trialId") else {}
+    progress = enrollment.get("checklistProgress") or {}
+    items = completed = 0
+    for number, checklist in checklists.items():
+        done = progress.get(f"stage{number}")
+        done = done if isinstance(done, dict) else {}
+        items += len(checklist)
+        completed += sum(1 for item in checklist if done.get(item) is True)
+    return items, completed
+
+
+def enrollment_counters(enrollment: Optional[Dict]) -> Dict[str, Counters]:
+    """The counters one enrollment contributes, keyed by org id."""
+    if not enrollment or enrollment.get("isActive") is not True or not enrollment.get("orgId"):
+        return {}
+    trial = ("trials", str(enrollment.get("trialId") or "unknown"))
+    items, completed = _checklist_counts(enrollment)
+    counters: Counters = {
+        ("activePatients",): 1,
+        ("checklistItems",): items,
+        ("checklistCompleted",): completed,
+        trial + ("activePatients",): 1,
+        # "stageN" keys keep RTDB from turning the map into an array
+        trial + ("stages", f"stage{enrollment.get('currentStage') or 1}"): 1,
+        trial + ("checklistItems",): items,
+        trial + ("checklistCompleted",): completed,
+    }
+    return {enrollment["orgId"]: counters}
+
+
+def _diff(before: Optional[Dict], after: Optional[Dict]) -> Dict[str, Counters]:
+    deltas: Dict[str, Counters] = defaultdict(lambda: defaultdict(int))
+    for sign, enrollment in ((-1, before), (1, after)):
+        for org_id, counters in enrollment_counters(enrollment).items():
+            for path, value in counters.items():
+                deltas[org_id][path] += sign * value
+    return {org: {p: v for p, v in c.items() if v} for org, c in deltas.items() if any(c.values())}
+
+
+def _add(summary: Dict, counters: Counters) -> Dict:
+    for path, delta in counters.items():
+        node = summary
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = max((node.get(path[-1]) or 0) + delta, 0)
+    return summary
+
+
+def apply_enrollment_delta(before: Optional[Dict], after: Optional[Dict]) -> None:
+    """Updates the affected org summaries for an enrollment changing from `before` to `after` (None = absent)."""
+    for org_id, counters in _diff(before, after).items():
+        def transaction_update(current):
+            summary = _add(current or {}, counters)
+            summary["updatedAt"] = int(time.time())
+            return summary
+        try:
+            realtime_db.reference(f"{SUMMARY_ROOT}/{org_id}").transaction(transaction_update)
+        except Exception as e:
+            # The write itself succeeded; a later recompute repairs the summary.
+            print(f"Error updating summary for org {org_id}: {e}")
+
+
+def build_org_summaries(enrollments: Dict) -> Dict[str, Dict]:
+    summaries: Dict[str, Dict] = {}
+    now = int(time.time())
+    for enrollment in enrollments.values():
+        for org_id, counters in enrollment_counters(enrollment).items():
+            _add(summaries.setdefault(org_id, {"updatedAt": now}), counters)
+    return summaries
+
+
+def recompute_org_summaries() -> Dict[str, Dict]:
+    """Rebuilds every org summary from scratch (one read of enrollments, one write)."""
+    print("RTDB: Recomputing all org summaries")
+    summaries = build_org_summaries(realtime_db.reference("enrollments").get() or {})  # type: ignore
+    realtime_db.reference(SUMMARY_ROOT).set(summaries)
+    return summaries
+
+
+def _with_rates(summary: Dict) -> Dict:
+    def rate(node: Dict) -> float:
+        items = node.get("checklistItems") or 0
+        return round((node.get("checklistCompleted") or 0) / items, 4) if items else 0.0
+
+    trials = {
+        trial_id: {**trial, "checklistCompletionRate": rate(trial)}
+        for trial_id, trial in (summary.get("trials") or {}).items()
+        if trial.get("activePatients")
+    }
+    return {**summary, "trials": trials, "checklistCompletionRate": rate(summary)}
+
+
+async def get_org_summary(org_id: str) -> Dict:
+    summary = realtime_db.reference(f"{SUMMARY_ROOT}/{org_id}").get()
+    return _with_rates(summary or {"activePatients": 0, "checklistItems": 0, "checklistCompleted": 0})  # type: ignore
+
+
+@register_warmup("org_summaries")
+def warm_org_summaries():
+    # Databases seeded before summaries existed get them built once.
+    if not realtime_db.reference(SUMMARY_ROOT).get(shallow=True):
+        recompute_org_summaries()
@@ -0,0 +1,79 @@
+# services/output_schemas.py
+"""Typed schemas for the JSON the models are asked to return."""
+import re
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, RootModel, field_validator
+
+
+class Prescription(BaseModel):
+    name: str
+    dosage: Optional[str] = None
+
+
+class EmrExtraction(BaseModel):
+    """Patient details extracted from EMR text (parse_emr_with_gemini / extract_emr_details_from_text)."""
+    model_config = ConfigDict(extra="allow")
+
+    age: Optional[int] = None
+    gender_at_birth: Optional[str] = None
+    underlying_conditions: List[str] = []
+    prescriptions: List[Prescription] = []
+    smoker_status: Optional[str] = None
+    alcohol_usage: Optional[str] = None
+    pregnancy_status: Optional[str] = None
+
+    # Models answer in prose as often as in the requested types: "52 years",
+    # "Metformin 500mg; Lisinopril", "diabetes, hypertension", false.
+    @field_validator("age", mode="before")
+    @classmethod
+    def _coerce_age(cls, value):
+        if isinstance(value, str):
+            match = re.search(r"\d+", value)
+            return int(match.group()) if match else None
+        if isinstance(value, float):
+            return int(value)
+        return value
+
+    @field_validator("underlying_conditions", mode="before")
+    @classmethod
+    def _coerce_conditions(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [part.strip() for part in re.split(r"[,;\n]", value) if part.strip()]
+        return value
+
+    @field_validator("prescriptions", mode="before")
+    @classmethod
+    def _coerce_prescriptions(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = [part.strip() for part in re.split(r"[;\n]", value) if part.strip()]
+        elif isinstance(value, dict):
+            value = [value]
+        return [{"name": item} if isinstance(item, str) else item for item in value]
+
+    @field_validator("gender_at_birth", "smoker_status", "alcohol_usage", "pregnancy_status", mode="before")
+    @classmethod
+    def _coerce_text(cls, value):
+        if isinstance(value, bool):
+            return "Yes" if value else "No"
+        return str(value) if isinstance(value, (int, float)) else value
+
+
+class ProtocolTimeline(RootModel[Dict[str, str]]):
+    """{"Stage 1": "summary", "Stage 2": "summary", ...} from generate_timeline_from_text."""
+
+
+class PersonalizedStage(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    name: Optional[str] = None
+    summary: str = ""
+    checklist: List[Union[str, Dict[str, Any]]] = []
+
+
+class PersonalizedTimeline(RootModel[Dict[str, PersonalizedStage]]):
+    """Stage key -> personalized stage, same keys as the protocol it was built from."""
@@ -0,0 +1,134 @@
+# services/prompt_builder.py
+"""
+Token-budgeted prompt construction for timeline personalization.
+
+Only the EMR fields that matter for personalizing a protocol are projected
+(conditions, prescriptions, allergies, lifestyle flags and the most recent log
+entries) and everything is serialized compactly. If the prompt is still over
+PERSONALIZATION_PROMPT_TOKEN_BUDGET, the oldest log entries are dropped first
+and then long free-text values are shortened, so the same inputs always give
+the same prompt.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from services.metrics_service import llm_prompt_tokens
+
+PERSONALIZATION_PROMPT_TOKEN_BUDGET = int(os.getenv("PERSONALIZATION_PROMPT_TOKEN_BUDGET", "3000"))
+PERSONALIZATION_MAX_LOG_ENTRIES = int(os.getenv("PERSONALIZATION_MAX_LOG_ENTRIES", "10"))
+TRUNCATED_TEXT_CHARS = 160
+
+EMR_FIELDS = (
+    "underlying_conditions", "conditions", "prescriptions", "currentMedications", "allergies",
+    "smoker_status", "alcohol_usage", "pregnancy_status",
+)
+LOG_ENTRY_FIELDS = ("date", "type", "description")
+STAGE_FIELDS = ("name", "duration", "summary", "checklist")
+
+PERSONALIZATION_INSTRUCTIONS = """You are a clinical trial assistant. Personalize this trial protocol for the patient.
+
+Instructions:
+- Rewrite 'summary' for each stage with patient-specific advice.
+- Rewrite each checklist item into a patient-tailored task (mention exact meds, etc.).
+- Return ONLY valid JSON, same structure as protocol."""
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Exact count with tiktoken when installed, otherwise the ~4 characters per token estimate."""
+    encoder = _encoder()
+    return len(encoder.encode(text)) if encoder else (len(text) + 3) // 4
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _recent_log_entries(log: Any) -> List[Any]:
+    entries = [e for e in (log.values() if isinstance(log, dict) else log or []) if e]
+    if all(isinstance(e, dict) and e.get("date") for e in entries):
+        entries = sorted(entries, key=lambda e: str(e["date"]))
+    entries = entries[-PERSONALIZATION_MAX_LOG_ENTRIES:]
+    return [{k: e[k] for k in LOG_ENTRY_FIELDS if k in e} if isinstance(e, dict) else e for e in entries]
+
+
+def project_emr(emr: Dict) -> Dict:
+    """Keeps only the EMR fields relevant to personalization; the log is cut to recent entries."""
+    projected = {k: emr[k] for k in EMR_FIELDS if emr.get(k) not in (None, "", [], {})}
+    log = _recent_log_entries(emr.get("log"))
+    if log:
+        projected["recent_log"] = log
+    return projected
+
+
+def project_stages(stages: Any) -> Dict:
+    if isinstance(stages, list):
+        stages = {str(i): s for i, s in enumerate(stages) if s is not None}
+    return {key: {k: stage[k] for k in STAGE_FIELDS if k in stage} for key, stage in stages.items() if stage}
+
+
+def _shorten(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > TRUNCATED_TEXT_CHARS:
+        return value[:TRUNCATED_TEXT_CHARS] + "..."
+    if isinstance(value, list):
+        return [_shorten(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _shorten(v) for k, v in value.items()}
+    return value
+
+
+def _render(emr: Dict, stages: Dict) -> str:
+    return (
+        f"{PERSONALIZATION_INSTRUCTIONS}\n\n"
+        f"Patient EMR:\n{compact_json(emr)}\n\n"
+        f"Generic Trial Protocol:\n{compact_json(stages)}\n"
+    )
+
+
+def build_personalization_prompt(patient_emr: Dict, stages: Any,
+                                 token_budget: int = PERSONALIZATION_PROMPT_TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """Returns (prompt, report) where report has the prompt's token count and what was trimmed."""
+    emr = project_emr(patient_emr)
+    protocol = project_stages(stages)
+    log = emr.pop("recent_log", [])
+
+    def render(kept: int, shorten: bool = False) -> str:
+        candidate = dict(emr, recent_log=log[len(log) - kept:]) if kept else dict(emr)
+        return _render(_shorten(candidate) if shorten else candidate, protocol)
+
+    # Largest number of most-recent log entries that fits (binary search keeps re-renders low)
+    low, high = 0, len(log)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(render(mid)) <= token_budget:
+            low = mid
+        else:
+            high = mid - 1
+    prompt = render(low)
+    shortened = False
+    if count_tokens(prompt) > token_budget:
+        prompt, shortened = render(0, shorten=True), True
+
+    tokens = count_tokens(prompt)
+    report = {
+        "prompt_tokens": tokens,
+        "token_budget": token_budget,
+        "log_entries_kept": low,
+        "log_entries_dropped": len(log) - low,
+        "shortened": shortened,
+        "over_budget": tokens > token_budget,
+    }
+    llm_prompt_tokens.observe("personalization", value=tokens)
+    print(f"Personalization prompt: {tokens}/{token_budget} tokens, "
+          f"{low} log entries kept, {len(log) - low} dropped{', text shortened' if shortened else ''}")
+    return prompt, report
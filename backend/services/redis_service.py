@@ -0,0 +1,33 @@
+# services/redis_service.py
+"""
+The process-wide Redis client.
+
+Everything that has to be shared between server workers (agent checkpoints,
+verification codes, sessions) lives in Redis and goes through this one pooled
+redis.asyncio client. It is created on first use, i.e. after the worker has
+forked, so preloading the app never shares a socket between processes.
+"""
+import os
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+
+_redis_client = None
+
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        from redis.asyncio import ConnectionPool, Redis
+
+        pool = ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+        _redis_client = Redis(connection_pool=pool)
+    return _redis_client
+
+
+async def close_redis():
+    """Releases the connection pool on shutdown."""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose(close_connection_pool=True)
+    _redis_client = None
@@ -0,0 +1,211 @@
+# services/response_encoding.py
+"""
+Response serialization and compression.
+
+- FastJSONResponse encodes with orjson (falling back to the standard encoder
+  when it is not installed) and is the app's default response class. When the
+  client sends `Accept: application/msgpack` and msgpack is installed, the
+  same response is encoded as MessagePack instead.
+- CompressionMiddleware compresses bodies of at least COMPRESSION_MIN_BYTES
+  with brotli (if installed and accepted) or gzip. Event streams and bodies
+  that are already encoded pass through untouched. A compressed body's
+  ETag is made weak, since its bytes differ from the uncompressed body's.
+"""
+import gzip
+import json
+import os
+import zlib
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional encoding
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "image/", "audio/", "video/", "application/zip", "application/gzip")
+
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+def encode_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=str, use_bin_type=True)
+
+
+def wants_msgpack() -> bool:
+    """Whether the current request negotiated MessagePack (and it can be produced)."""
+    return msgpack is not None and _wants_msgpack.get()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON via orjson, or MessagePack when the request negotiated it."""
+
+    def render(self, content: Any) -> bytes:
+        if wants_msgpack():
+            # Starlette sets the content-type header from media_type after render()
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return encode_msgpack(content)
+        return encode_json(content)
+
+
+def _accepts(header: str, token: str) -> bool:
+    """Whether an Accept/Accept-Encoding header lists token with a non-zero q value."""
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if name.lower() != token:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data) if self.encoding == "br" else self._c.compress(data)
+
+    def finish(self) -> bytes:
+        return self._c.finish() if self.encoding == "br" else self._c.flush()
+
+
+def add_vary(headers: list, *names: str) -> list:
+    """Raw ASGI headers with names added to Vary (merged into an existing Vary header)."""
+    existing = [v.decode("latin-1") for k, v in headers if k.lower() == b"vary"]
+    values = [v.strip() for header in existing for v in header.split(",") if v.strip()]
+    values += [name for name in names if name.lower() not in {v.lower() for v in values}]
+    return [(k, v) for k, v in headers if k.lower() != b"vary"] + [(b"vary", ", ".join(values).encode("latin-1"))]
+
+
+def weaken_etag(headers: list) -> list:
+    """Raw ASGI headers with a strong ETag made weak (for a content-coded body)."""
+    return [(k, b"W/" + v if k.lower() == b"etag" and v.startswith(b'"') else v) for k, v in headers]
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return "br"
+    if _accepts(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware: MessagePack negotiation plus brotli/gzip response compression."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _wants_msgpack.set(_accepts(_header(scope, b"accept"), MSGPACK_MEDIA_TYPE))
+        encoding = negotiate_encoding(_header(scope, b"accept-encoding")) if COMPRESSION_ENABLED else None
+        try:
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size))
+        finally:
+            _wants_msgpack.reset(token)
+
+
+class _CompressingSender:
+    """Holds the response start until the first body chunk shows whether compression applies."""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _eligible(self, headers) -> bool:
+        names = {k.lower(): v for k, v in headers}
+        content_type = names.get(b"content-type", b"").decode("latin-1")
+        return b"content-encoding" not in names and not content_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            if message["status"] == 304:
+                # Revalidates the compressed body this client negotiated, so its ETag is the weak one
+                message = {**message, "headers": weaken_etag(message.get("headers", []))}
+            self.start = message
+            self.passthrough = message["status"] == 304 or not self._eligible(message.get("headers", []))
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body, more = message.get("body", b""), message.get("more_body", False)
+        if self.compressor is None:
+            if not more and len(body) < self.minimum_size:
+                # Small single-chunk response: not worth compressing
+                await self.send(self.start)
+                await self.send(message)
+                self.passthrough = True
+                return
+            self.compressor = _Compressor(self.encoding)
+            headers = [(k, v) for k, v in self.start.get("headers", []) if k.lower() != b"content-length"]
+            headers = add_vary(weaken_etag(headers), "Accept-Encoding")
+            headers.append((b"content-encoding", self.encoding.encode()))
+            await self.send({**self.start, "headers": headers})
+
+        chunk = self.compressor.compress(body)
+        if not more:
+            chunk += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more})
@@ -0,0 +1,141 @@
+# services/rtdb_budget.py
+"""
+Request-scoped RTDB round-trip accounting.
+
+Every firebase_admin Reference/Query operation is counted against the current
+request (see metrics_service.instrument_rtdb). Routes can declare a budget with
+@rtdb_budget(max_calls=..., max_bytes=...), and repeated reads of the same path
+pattern with different keys (the N+1 shape) are flagged automatically.
+
+Violations are logged; with RTDB_BUDGET_STRICT=1 (test mode) they raise
+RtdbBudgetExceeded from the offending call instead.
+"""
+import functools
+import inspect
+import json
+import os
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+RTDB_BUDGET_STRICT = os.getenv("RTDB_BUDGET_STRICT", "0") == "1"
+# Distinct keys read under one path pattern before a request counts as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("RTDB_N_PLUS_ONE_THRESHOLD", "5"))
+
+# Child names that are part of the schema rather than record keys
+SCHEMA_SEGMENTS = {"log", "stages", "checklist", "checklistProgress", "currentStage", "isActive", "summary"}
+
+
+class RtdbBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request exceeds its RTDB budget or loops over a path pattern."""
+
+
+class RtdbRequestStats:
+    def __init__(self, route: str):
+        self.route = route
+        self.calls = 0
+        self.bytes = 0
+        self.max_calls: Optional[int] = None
+        self.max_bytes: Optional[int] = None
+        self.pattern_keys = defaultdict(set)
+        self.violations = []
+
+    def violate(self, message: str):
+        self.violations.append(message)
+        print(f"[RTDB BUDGET] {self.route}: {message}")
+        if RTDB_BUDGET_STRICT:
+            raise RtdbBudgetExceeded(f"{self.route}: {message}")
+
+
+_current_stats: ContextVar[Optional[RtdbRequestStats]] = ContextVar("rtdb_request_stats", default=None)
+
+
+def current_stats() -> Optional[RtdbRequestStats]:
+    return _current_stats.get()
+
+
+def path_pattern(path: str) -> str:
+    """'/users/-Nabc/log' -> 'users/*/log'. Record keys collapse to '*'."""
+    segments = path.strip("/").split("/")
+    return "/".join([segments[0]] + [s if s in SCHEMA_SEGMENTS else "*" for s in segments[1:]])
+
+
+def _payload_size(value) -> int:
+    if value is None:
+        return 0
+    try:
+        return len(json.dumps(value, separators=(",", ":"), default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def record_call(op: str, path: str, payload=None):
+    """Counts one RTDB operation (and its approximate payload size) against the current request."""
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    stats.calls += 1
+    stats.bytes += _payload_size(payload)
+
+    if op == "get":
+        pattern = path_pattern(path)
+        keys = stats.pattern_keys[pattern]
+        keys.add(path)
+        if len(keys) == N_PLUS_ONE_THRESHOLD:
+            stats.violate(f"N+1 pattern: {len(keys)} reads of '{pattern}' in one request")
+
+    if stats.max_calls is not None and stats.calls == stats.max_calls + 1:
+        stats.violate(f"exceeded call budget ({stats.calls} > {stats.max_calls})")
+    if stats.max_bytes is not None and stats.bytes > stats.max_bytes and not any("byte budget" in v for v in stats.violations):
+        stats.violate(f"exceeded byte budget ({stats.bytes} > {stats.max_bytes})")
+
+
+def rtdb_budget(max_calls: Optional[int] = None, max_bytes: Optional[int] = None):
+    """Declares the RTDB budget for a route handler. Place it below the router decorator."""
+    def decorator(func):
+        def apply():
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.max_calls, stats.max_bytes = max_calls, max_bytes
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                apply()
+                return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            apply()
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RtdbBudgetMiddleware:
+    """ASGI middleware that opens a stats scope per request and reports totals as response headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RtdbRequestStats(f"{scope['method']} {scope['path']}")
+        token = _current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-rtdb-calls", str(stats.calls).encode()))
+                headers.append((b"x-rtdb-bytes", str(stats.bytes).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_stats.reset(token)
@@ -0,0 +1,105 @@
+# services/stage_service.py
+"""
+Trial stages in one canonical form.
+
+Stages live only at trials/{trial_id}/stages, keyed by stage number:
+    {"1": {"name", "duration", "summary", "checklist"}, "2": {...}}
+RTDB hands back sequential numeric keys as a list, and older writers stored
+other shapes (timelines as {"Stage 1": "summary"}, list-shaped stages). Reads
+fetch only the stages subtree, convert it once with canonical_stages() and
+cache the result per trial, so request handlers never convert on the hot path.
+The cache is patched from the change feed when it is running.
+
+normalize_stages.py rewrites stored stages into the canonical form once.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from firebase_config import realtime_db
+from services.cache_service import TTLCache
+from services.change_feed import CHANGE_FEED_CACHE_TTL_SECONDS, Change, on_change
+
+STAGE_CACHE_TTL_SECONDS = float(os.getenv("STAGE_CACHE_TTL_SECONDS", "300"))
+
+stage_cache = TTLCache("trial_stages", ttl_seconds=STAGE_CACHE_TTL_SECONDS, max_entries=5000)
+
+_STAGE_LABEL = re.compile(r"^\s*stage\s*(\d+)\s*$", re.IGNORECASE)
+
+
+def _stage_number(key: Any) -> Optional[int]:
+    if isinstance(key, int):
+        return key
+    key = str(key)
+    if key.isdigit():
+        return int(key)
+    match = _STAGE_LABEL.match(key)
+    return int(match.group(1)) if match else None
+
+
+def canonical_stages(stages: Any) -> Dict[str, Dict]:
+    """
+    Any stored stage shape -> {"1": {...}, "2": {...}} in stage order.
+    Lists are indexed by stage number, and a bare summary string becomes
+    {"name": "Stage N", "summary": ...}. Entries without a stage number are dropped.
+    """
+    if isinstance(stages, list):
+        stages = dict(enumerate(stages))
+    if not isinstance(stages, dict):
+        return {}
+    numbered = {}
+    for key, stage in stages.items():
+        number = _stage_number(key)
+        if number is None or number < 1 or not stage:
+            continue
+        if not isinstance(stage, dict):
+            stage = {"name": f"Stage {number}", "summary": str(stage)}
+        numbered[number] = stage
+    return {str(n): numbered[n] for n in sorted(numbered)}
+
+
+def _load(trial_id: str) -> Dict[str, Dict]:
+    print(f"RTDB: Fetching stages for trial {trial_id}")
+    return canonical_stages(realtime_db.reference(f'trials/{trial_id}/stages').get())
+
+
+def get_trial_stages(trial_id: str) -> Dict[str, Dict]:
+    """The trial's canonical stages ({} when it has none). Blocking on a cache miss."""
+    return stage_cache.get_or_load(trial_id, lambda: _load(trial_id))
+
+
+def get_stage(trial_id: str, stage_number: int) -> Optional[Dict]:
+    return get_trial_stages(trial_id).get(str(stage_number))
+
+
+def stage_checklists(stages: Dict[str, Dict]) -> Dict[int, List[str]]:
+    """{stage number: protocol checklist} for canonical stages."""
+    return {int(key): list(stage.get("checklist") or []) for key, stage in stages.items()}
+
+
+def write_trial_stages(trial_id: str, stages: Any) -> Dict[str, Dict]:
+    """Stores stages in canonical form and refreshes the cache; returns what was written."""
+    canonical = canonical_stages(stages)
+    realtime_db.reference(f'trials/{trial_id}/stages').set(canonical)
+    stage_cache.set(trial_id, canonical)
+    return canonical
+
+
+def update_stage(trial_id: str, stage_number: int, fields: Dict) -> None:
+    realtime_db.reference(f'trials/{trial_id}/stages/{stage_number}').update(fields)
+    stage_cache.invalidate(trial_id)
+
+
+@on_change("trials")
+def sync_stage_cache(change: Change):
+    if change.key is None:
+        stage_cache.ttl_seconds = CHANGE_FEED_CACHE_TTL_SECONDS
+        stage_cache.clear()
+        for trial_id, trial in change.value.items():
+            if isinstance(trial, dict):
+                stage_cache.set(trial_id, canonical_stages(trial.get("stages")))
+        return
+    if isinstance(change.value, dict):
+        stage_cache.set(change.key, canonical_stages(change.value.get("stages")))
+    else:
+        stage_cache.invalidate(change.key)
@@ -0,0 +1,127 @@
+# services/structured_output.py
+"""
+Parsing model output into typed JSON in a single call.
+
+parse_model_json() tolerates code fences and leading or trailing prose.
+Output truncated at the token limit is rejected with TruncatedOutputError
+rather than returned as if it were complete, while malformed but complete
+output (a stray comma) is repaired. Output token budgets are sized to the
+expected response instead of a fixed limit.
+"""
+import json
+import re
+from typing import Any, List, Type, TypeVar
+
+from pydantic import BaseModel
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+_decoder = json.JSONDecoder()
+
+
+class ModelOutputError(ValueError):
+    """Raised when model output contains no recoverable JSON."""
+
+
+class TruncatedOutputError(ModelOutputError):
+    """Raised when model output stops mid-document."""
+
+    def __init__(self):
+        super().__init__("Model output was truncated before the JSON document was complete.")
+
+
+def _close_fragment(fragment: str) -> str:
+    """Closes any string, object or array left open at the end of a JSON fragment."""
+    stack: List[str] = []
+    in_string = escaped = False
+    for ch in fragment:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if escaped:
+        fragment = fragment[:-1]
+    if in_string:
+        fragment += '"'
+    fragment = fragment.rstrip().rstrip(",")
+    if fragment.endswith(":"):
+        fragment += " null"
+    return fragment + "".join(reversed(stack))
+
+
+def _member_boundaries(fragment: str) -> List[int]:
+    """Positions of commas outside strings, i.e. where a complete member ends."""
+    positions, in_string, escaped = [], False, False
+    for i, ch in enumerate(fragment):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            positions.append(i)
+    return positions
+
+
+def repair_json(fragment: str) -> Any:
+    """Recovers the longest valid prefix of a truncated JSON document."""
+    try:
+        return json.loads(_close_fragment(fragment))
+    except ValueError:
+        pass
+    # Drop the partial trailing member and retry, working backwards.
+    for cut in reversed(_member_boundaries(fragment)[-50:]):
+        try:
+            return json.loads(_close_fragment(fragment[:cut]))
+        except ValueError:
+            continue
+    raise ModelOutputError("Model output is not recoverable JSON.")
+
+
+def parse_model_json(text: str) -> Any:
+    """Extracts the JSON value from raw model output; raises TruncatedOutputError if it is incomplete."""
+    text = re.sub(r"```(?:json)?", "", text or "")
+    match = re.search(r"[{\[]", text)
+    if not match:
+        raise ModelOutputError("Model output contains no JSON.")
+    try:
+        # raw_decode stops at the end of the value, ignoring any trailing prose
+        value, _ = _decoder.raw_decode(text, match.start())
+        return value
+    except ValueError:
+        fragment = text[match.start():].strip()
+        # Malformed but complete output (a stray comma) is repaired silently; a cut-off document is not
+        if _close_fragment(fragment) != fragment:
+            raise TruncatedOutputError()
+        return repair_json(fragment)
+
+
+def parse_structured(text: str, schema: Type[ModelT]) -> dict:
+    """
+    Parses model output and validates it against a schema, returning plain JSON
+    data. Only fields the model actually returned are included, so defaults
+    never overwrite stored values.
+    """
+    return schema.model_validate(parse_model_json(text)).model_dump(exclude_unset=True)
+
+
+def output_token_budget(expected_chars: int, floor: int = 256, ceiling: int = 4096, headroom: float = 1.3) -> int:
+    """
+    Sizes max_tokens for a response of roughly expected_chars characters
+    (~4 characters per token), with headroom and clamped to [floor, ceiling].
+    """
+    return max(floor, min(ceiling, int(expected_chars / 4 * headroom)))
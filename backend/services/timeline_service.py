@@ -1,14 +1,23 @@
 # services/timeline_service.py
 import PyPDF2
-import json
 import os
 from dotenv import load_dotenv
 from typing import IO
 import aiohttp
-from firebase_config import realtime_db 
+import time
+from functools import lru_cache
+from services.metrics_service import record_llm_call
+from services.warmup_service import register_warmup
+from services.output_schemas import ProtocolTimeline
+from services.stage_service import canonical_stages, get_trial_stages, write_trial_stages
+from services.structured_output import output_token_budget, parse_structured
 
 load_dotenv()
 
+# Ask the MedGemma server for JSON-constrained decoding. response_format belongs to the
+# chat completions API, so only enable this for servers that also honor it on /v1/completions.
+MEDGEMMA_JSON_MODE = os.getenv("MEDGEMMA_JSON_MODE", "0") == "1"
+
 class MedGemmaClient:
     def __init__(self):
         self.api_key = os.getenv("MEDGEMMA_API_KEY")
@@ -21,33 +30,67 @@ class MedGemmaClient:
         if not self.session or self.session.closed:
             self.session = aiohttp.ClientSession(headers={'Authorization': f'Bearer {self.api_key}'})
         return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
     
-    async def generate(self, prompt: str) -> str:
+    model = "alibayram/medgemma:27b"
+
+    async def generate(self, prompt: str, max_tokens: int = 1024, json_mode: bool = False) -> str:
         session = await self._get_session()
+        openai_input = {
+            "model": self.model,
+            "prompt": prompt,
+            "temperature": 0.1,
+            "max_tokens": max_tokens
+        }
+        if json_mode and MEDGEMMA_JSON_MODE:
+            openai_input["response_format"] = {"type": "json_object"}
         payload = {
             "input": {
                 "openai_route": "/v1/completions",
-                "openai_input": {
-                    "model": "alibayram/medgemma:27b",
-                    "prompt": prompt,
-                    "temperature": 0.1,
-                    "max_tokens": 1024
-                }
+                "openai_input": openai_input
             }
         }
+        start = time.perf_counter()
         try:
             async with session.post(f"{self.base_url}/runsync", json=payload, timeout=60) as response:  # type: ignore
                 response.raise_for_status()
                 result = await response.json()
                 if result.get('status') == 'COMPLETED':
-                    text = result['output'][0]['choices'][0]['text'].strip()
+                    output = result['output'][0]
+                    usage = output.get('usage') or {}
+                    record_llm_call("medgemma", self.model, time.perf_counter() - start,
+                                    usage.get('prompt_tokens'), usage.get('completion_tokens'))
+                    choice = output['choices'][0]
+                    if choice.get('finish_reason') == 'length':
+                        print(f"MedGemma output hit max_tokens={max_tokens}; it will be repaired before parsing.")
+                    text = choice['text'].strip()
                     return text.replace("```json", "").replace("```", "").strip()
                 else:
                     raise RuntimeError(f"MedGemma failed: {result}")
         except Exception as e:
+            record_llm_call("medgemma", self.model, time.perf_counter() - start, error=True)
             raise RuntimeError(f"MedGemma API error: {e}")
 
-medgemma_client = MedGemmaClient()
+@lru_cache(maxsize=1)
+def get_medgemma_client() -> MedGemmaClient:
+    """Returns the shared MedGemma client, creating it on first use."""
+    return MedGemmaClient()
+
+async def close_medgemma_client():
+    """Closes the pooled aiohttp session on shutdown, if the client was ever created."""
+    if get_medgemma_client.cache_info().currsize:
+        await get_medgemma_client().close()
+
+@register_warmup("medgemma")
+async def warm_medgemma():
+    # Opens the pooled aiohttp connection (TCP + TLS) ahead of the first timeline request.
+    client = get_medgemma_client()
+    session = await client._get_session()
+    async with session.head(client.base_url, timeout=aiohttp.ClientTimeout(total=10)):  # type: ignore
+        pass
 
 
 def extract_text_from_pdf(pdf_file_stream: IO[bytes]) -> str:
@@ -72,19 +115,24 @@ async def generate_timeline_from_text(protocol_text: str) -> dict:
     {protocol_text}
     ---
     """
+    # A timeline is a handful of one-line stage summaries; it grows slowly with protocol length.
+    max_tokens = output_token_budget(800 + len(protocol_text) // 10, floor=384, ceiling=2048)
     try:
-        response_text = await medgemma_client.generate(prompt)
-        return json.loads(response_text)
+        response_text = await get_medgemma_client().generate(prompt, max_tokens=max_tokens, json_mode=True)
+        return parse_structured(response_text, ProtocolTimeline)
     except Exception as e:
         print(f"Error parsing MedGemma response for timeline: {e}")
         return {"error": "Failed to generate a valid timeline from the provided text."}
 
 
 async def save_timeline_to_db(trial_id: str, timeline: dict) -> str:
-    """Saves the generated timeline into RTDB under clinicalTrials/{trial_id}/stages."""
+    """Saves the generated stage summaries into the trial's stages, keeping their names and checklists."""
     try:
-        ref = realtime_db.reference(f'clinicalTrials/{trial_id}/stages')
-        ref.set(timeline)
+        existing = get_trial_stages(trial_id)
+        stages = dict(existing)
+        for key, stage in canonical_stages(timeline).items():
+            stages[key] = {**stage, **existing.get(key, {}), "summary": stage.get("summary")}
+        write_trial_stages(trial_id, stages)
         return f"Timeline saved for trial '{trial_id}'."
     except Exception as e:
         return f"Error saving timeline: {e}"
@@ -92,8 +140,7 @@ async def save_timeline_to_db(trial_id: str, timeline: dict) -> str:
 async def get_timeline_from_db(trial_id: str) -> dict:
     """Fetches the saved timeline from RTDB for a trial."""
     try:
-        ref = realtime_db.reference(f'clinicalTrials/{trial_id}/stages')
-        timeline = ref.get()
+        timeline = get_trial_stages(trial_id)
         return timeline if timeline else {"error": f"No timeline found for trial '{trial_id}'."} # type: ignore
     except Exception as e:
         return {"error": f"Error fetching timeline: {e}"}
\ No newline at end of file
@@ -0,0 +1,333 @@
+# services/trial_search_index.py
+"""
+Offline semantic search over trials.
+
+Trial text (title, condition, description, sponsor, location, stage names) is
+embedded when trials are written, and queries are answered from an in-memory
+vector index with no network call:
+
+- Embeddings come from a local CPU sentence-transformers model when
+  TRIAL_SEARCH_MODEL names one and the package is installed; otherwise from
+  TF-IDF (projected with LSA once the corpus is large enough). Lay phrases are
+  expanded with their clinical terms first, so "high blood pressure" reaches
+  hypertension trials even without a neural model.
+- Search is exact brute-force cosine similarity in NumPy, or approximate
+  (hnswlib) when TRIAL_SEARCH_ANN=1 and the index is large.
+- upsert()/remove() update one trial: it is embedded into the current space
+  and its row patched in place, so searches never wait on a refit. The TF-IDF
+  weights, LSA projection and ANN graph are refitted on a background thread.
+- The neural model is loaded by the first rebuild (the startup warm-up), not
+  at import.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+TRIAL_SEARCH_MODEL = os.getenv("TRIAL_SEARCH_MODEL", "")
+TRIAL_SEARCH_ANN = os.getenv("TRIAL_SEARCH_ANN", "0") == "1"
+ANN_MIN_TRIALS = 5000
+LSA_DIMS = int(os.getenv("TRIAL_SEARCH_LSA_DIMS", "128"))
+# LSA only helps once there are several documents per latent dimension
+LSA_MIN_DOCS_PER_DIM = 2
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it", "of", "on",
+    "or", "the", "to", "with", "that", "this", "their", "than", "versus", "vs", "new", "study", "trial",
+}
+
+# Lay phrase -> clinical vocabulary appended to the text before tokenizing
+SYNONYMS = {
+    "high blood pressure": "hypertension cardiovascular",
+    "blood pressure": "hypertension",
+    "blood sugar": "diabetes glucose",
+    "sugar": "diabetes glucose",
+    "insulin": "diabetes",
+    "breathing": "respiratory asthma",
+    "wheezing": "asthma respiratory",
+    "inhaler": "asthma respiratory",
+    "lung": "respiratory pulmonary",
+    "memory loss": "alzheimer dementia cognitive",
+    "dementia": "alzheimer cognitive",
+    "forgetful": "alzheimer cognitive",
+    "heart": "cardiovascular cardiology",
+    "cancer": "oncology tumor",
+    "joint pain": "arthritis",
+    "back pain": "pain musculoskeletal",
+}
+
+SEARCHABLE_FIELDS = ("title", "condition", "description", "sponsor", "location", "phases")
+
+
+def trial_text(trial: Dict) -> str:
+    parts = [str(trial.get(field, "")) for field in SEARCHABLE_FIELDS]
+    stages = trial.get("stages") or {}
+    for stage in (stages.values() if isinstance(stages, dict) else stages):
+        if isinstance(stage, dict):
+            parts.append(str(stage.get("name", "")))
+    return " ".join(p for p in parts if p)
+
+
+def expand_synonyms(text: str) -> str:
+    lowered = text.lower()
+    expansions = [clinical for phrase, clinical in SYNONYMS.items() if phrase in lowered]
+    return " ".join([lowered] + expansions)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = re.findall(r"[a-z0-9]+", expand_synonyms(text))
+    # Light stemming: plural 's' only, which is enough for condition names
+    return [t[:-1] if len(t) > 4 and t.endswith("s") and not t.endswith("ss") else t
+            for t in tokens if t not in STOPWORDS and len(t) > 1]
+
+
+class TfidfEmbedder:
+    """TF-IDF vectors over the current corpus, optionally reduced with LSA."""
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.projection: Optional[np.ndarray] = None
+
+    def fit(self, term_counts: List[Counter]):
+        for counts in term_counts:
+            for term in counts:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+        df = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for counts in term_counts:
+            for term in counts:
+                df[self.vocabulary[term]] += 1
+        n = max(len(term_counts), 1)
+        self.idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+
+        self.projection = None
+        if LSA_DIMS and len(term_counts) >= LSA_DIMS * LSA_MIN_DOCS_PER_DIM:
+            _, _, vt = np.linalg.svd(self._tfidf(term_counts), full_matrices=False)
+            self.projection = vt[:LSA_DIMS].T.astype(np.float32)
+
+    def _tfidf(self, term_counts: List[Counter]) -> np.ndarray:
+        matrix = np.zeros((len(term_counts), len(self.vocabulary)), dtype=np.float32)
+        for i, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                j = self.vocabulary.get(term)
+                if j is not None:
+                    matrix[i, j] = 1 + math.log(count)
+        return matrix * self.idf
+
+    def embed(self, term_counts: List[Counter]) -> np.ndarray:
+        matrix = self._tfidf(term_counts)
+        if self.projection is not None:
+            matrix = matrix @ self.projection
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-transformers model (no network at query time once downloaded)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode([expand_synonyms(t) for t in texts], convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _load_neural_embedder() -> Optional[SentenceTransformerEmbedder]:
+    if not TRIAL_SEARCH_MODEL:
+        return None
+    try:
+        return SentenceTransformerEmbedder(TRIAL_SEARCH_MODEL)
+    except Exception as e:
+        print(f"Could not load search model '{TRIAL_SEARCH_MODEL}', falling back to TF-IDF: {e}")
+        return None
+
+
+class TrialSearchIndex:
+    """In-memory vector index of trials, kept current by upsert()/remove() on every trial write."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.trials: Dict[str, Dict] = {}
+        self._term_counts: Dict[str, Counter] = {}
+        self._versions: Dict[str, int] = {}
+        self._neural_vectors: Dict[str, np.ndarray] = {}
+        # The embedding model is loaded by the first rebuild (the startup warm-up), never at import
+        self._neural: Optional[SentenceTransformerEmbedder] = None
+        self._embedder_loaded = False
+        self._tfidf = TfidfEmbedder()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ann = None
+        self._refit_lock = threading.Lock()
+        self._refit_pending = threading.Event()
+        self.loaded = False
+
+    def rebuild(self, trials: Dict[str, Dict]):
+        if not self._embedder_loaded:
+            self._neural = _load_neural_embedder()
+            self._embedder_loaded = True
+        items = [(tid, t) for tid, t in trials.items() if isinstance(t, dict)]
+        vectors = self._neural.embed_texts([trial_text(t) for _, t in items]) if self._neural and items else []
+        with self._lock:
+            self.trials = dict(items)
+            self._term_counts = {tid: Counter(tokenize(trial_text(t))) for tid, t in items}
+            self._versions = {tid: self._versions.get(tid, 0) + 1 for tid, _ in items}
+            self._neural_vectors = {tid: v for (tid, _), v in zip(items, vectors)}
+            self._install(*self._fit(self._sources()))
+            self.loaded = True
+
+    def upsert(self, trial_id: str, trial: Dict, merge: bool = True):
+        """Adds or updates one trial; merge=False replaces the stored trial instead of merging fields."""
+        with self._lock:
+            merged = {**self.trials.get(trial_id, {}), **trial} if merge else dict(trial)
+        vector = self._neural.embed_texts([trial_text(merged)])[0] if self._neural else None
+        with self._lock:
+            self.trials[trial_id] = merged
+            self._term_counts[trial_id] = Counter(tokenize(trial_text(merged)))
+            self._versions[trial_id] = self._versions.get(trial_id, 0) + 1
+            if vector is not None:
+                self._neural_vectors[trial_id] = vector
+            self._place(trial_id)
+        self._schedule_refit()
+
+    def remove(self, trial_id: str):
+        with self._lock:
+            for store in (self.trials, self._term_counts, self._versions, self._neural_vectors):
+                store.pop(trial_id, None)
+            self._place(trial_id)
+        self._schedule_refit()
+
+    def _vector(self, trial_id: str) -> np.ndarray:
+        if self._neural:
+            return self._neural_vectors[trial_id]
+        return self._tfidf.embed([self._term_counts[trial_id]])[0]
+
+    def _place(self, trial_id: str):
+        """
+        Projects one written trial into the current space: its row is patched,
+        appended or dropped. TF-IDF terms the fitted vocabulary has not seen yet
+        count from the next refit.
+        """
+        row = self._rows.get(trial_id)
+        if trial_id not in self.trials:
+            if row is None:
+                return
+            self._matrix = np.delete(self._matrix, row, axis=0)
+            self._ids.pop(row)
+            self._rows = {tid: i for i, tid in enumerate(self._ids)}
+        elif row is not None:
+            self._matrix[row] = self._vector(trial_id)
+        else:
+            vector = self._vector(trial_id)
+            self._matrix = np.vstack([self._matrix, vector]) if self._ids else vector[None, :].copy()
+            self._rows[trial_id] = len(self._ids)
+            self._ids.append(trial_id)
+        # The approximate index is rebuilt by the refit; exact search covers the gap
+        self._ann = None
+
+    def _sources(self) -> Dict[str, Tuple[object, int]]:
+        store = self._neural_vectors if self._neural else self._term_counts
+        return {tid: (store[tid], self._versions[tid]) for tid in self.trials}
+
+    def _fit(self, sources: Dict[str, Tuple[object, int]]):
+        """Fits a fresh space over a snapshot of the corpus. Neural vectors are reused as-is."""
+        ids = list(sources)
+        embedder = self._tfidf
+        if not ids:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        elif self._neural:
+            matrix = np.stack([sources[t][0] for t in ids])
+        else:
+            counts = [sources[t][0] for t in ids]
+            embedder = TfidfEmbedder()
+            embedder.fit(counts)  # type: ignore
+            matrix = embedder.embed(counts)  # type: ignore
+        ann = self._build_ann(matrix) if TRIAL_SEARCH_ANN and len(ids) >= ANN_MIN_TRIALS else None
+        return sources, embedder, matrix, ann
+
+    def _install(self, sources: Dict[str, Tuple[object, int]], embedder: TfidfEmbedder, matrix: np.ndarray, ann):
+        self._tfidf, self._matrix, self._ann = embedder, matrix, ann
+        self._ids = list(sources)
+        self._rows = {tid: i for i, tid in enumerate(self._ids)}
+        # Trials written while the space was being fitted are projected into it
+        for trial_id in set(self._ids) | set(self.trials):
+            if sources.get(trial_id, (None, None))[1] != self._versions.get(trial_id):
+                self._place(trial_id)
+
+    def _needs_refit(self) -> bool:
+        # Neural vectors never go stale; only the TF-IDF space and the ANN graph are refitted
+        return not self._neural or (TRIAL_SEARCH_ANN and len(self.trials) >= ANN_MIN_TRIALS)
+
+    def _schedule_refit(self):
+        """Refits the space on a background thread; searches keep using the current one meanwhile."""
+        if not self.loaded or not self._needs_refit():
+            return
+        self._refit_pending.set()
+        if not self._refit_lock.acquire(blocking=False):
+            return  # The running refit picks up the pending request
+        threading.Thread(target=self._refit_loop, name="trial-search-refit", daemon=True).start()
+
+    def _refit_loop(self):
+        try:
+            while self._refit_pending.is_set():
+                self._refit_pending.clear()
+                try:
+                    with self._lock:
+                        sources = self._sources()
+                    fitted = self._fit(sources)
+                    with self._lock:
+                        self._install(*fitted)
+                except Exception as e:
+                    print(f"Trial search refit failed: {e}")
+        finally:
+            self._refit_lock.release()
+        if self._refit_pending.is_set():
+            self._schedule_refit()
+
+    @staticmethod
+    def _build_ann(matrix: np.ndarray):
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+        ann = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        ann.init_index(max_elements=matrix.shape[0], ef_construction=200, M=16)
+        ann.add_items(matrix, np.arange(matrix.shape[0]))
+        ann.set_ef(64)
+        return ann
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        if self._neural:
+            return self._neural.embed_texts([query])[0]
+        return self._tfidf.embed([Counter(tokenize(query))])[0]
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """Returns (trial_id, cosine similarity) pairs, best first, with similarity > 0."""
+        with self._lock:
+            if not self._ids or not query.strip():
+                return []
+            q = self._embed_query(query)
+            k = min(limit, len(self._ids))
+            if self._ann is not None:
+                labels, distances = self._ann.knn_query(q, k=k)
+                hits = [(self._ids[i], 1.0 - float(d)) for i, d in zip(labels[0], distances[0])]
+            else:
+                scores = self._matrix @ q
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top], kind="stable")]
+                hits = [(self._ids[i], float(scores[i])) for i in top]
+        return [(trial_id, score) for trial_id, score in hits if score > 0]
+
+
+trial_search_index = TrialSearchIndex()
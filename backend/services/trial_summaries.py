@@ -0,0 +1,127 @@
+# services/trial_summaries.py
+"""
+Slim trial summaries for list screens.
+
+List screens only show a trial's title, status, condition, location and a
+few other scalar fields, and fetch stages separately. Those fields are kept
+in a precomputed trialSummaries/{trial_id} node (written alongside every
+trial write, backfilled at startup when missing), so the list is one small
+read instead of the whole trials tree with every stage and checklist.
+
+get_trial_list(fields) serves the summary by default, any subset of summary
+fields from the same data, and falls back to the full trial catalog only when
+a field outside the summary (such as stages) is requested.
+"""
+import os
+from typing import Dict, List, Optional, Sequence
+
+from firebase_config import realtime_db
+from services.cache_service import TTLCache
+from services.change_feed import CHANGE_FEED_CACHE_TTL_SECONDS, Change, on_change
+from services.geo_service import trials_near
+from services.warmup_service import register_warmup
+
+SUMMARY_ROOT = "trialSummaries"
+SUMMARY_FIELDS = (
+    "title", "status", "condition", "location", "siteLocation", "description", "sponsor",
+    "insurance", "phases", "estimatedDuration", "maxParticipants", "currentParticipants",
+)
+AVAILABLE_STATUSES = ("Active", "Recruiting")
+ALL_FIELDS = ("all", "*")
+
+trial_summary_cache = TTLCache("trial_summaries", ttl_seconds=float(os.getenv("TRIAL_CATALOG_TTL_SECONDS", "60")))
+
+
+def summarize_trial(trial: Dict) -> Dict:
+    summary = {k: trial[k] for k in SUMMARY_FIELDS if trial.get(k) is not None}
+    stages = trial.get("stages") or {}
+    summary["stageCount"] = sum(1 for s in (stages.values() if isinstance(stages, dict) else stages) if s)
+    return summary
+
+
+def rebuild_trial_summaries() -> Dict[str, Dict]:
+    """Recomputes every summary from the trials node (one full read, one write)."""
+    print("RTDB: Rebuilding all trial summaries")
+    trials = realtime_db.reference('trials').get() or {}
+    summaries = {trial_id: summarize_trial(t) for trial_id, t in trials.items() if isinstance(t, dict)}  # type: ignore
+    realtime_db.reference(SUMMARY_ROOT).set(summaries)
+    return summaries
+
+
+def write_trial_summary(trial_id: str, trial: Optional[Dict]):
+    """Keeps trialSummaries/{trial_id} in step with a trial write (None = the trial was deleted)."""
+    ref = realtime_db.reference(f'{SUMMARY_ROOT}/{trial_id}')
+    if trial is None:
+        ref.delete()
+    else:
+        ref.set(summarize_trial(trial))
+
+
+def _available(summaries: Dict) -> List[Dict]:
+    return [{**s, "id": trial_id} for trial_id, s in summaries.items()
+            if isinstance(s, dict) and s.get("status") in AVAILABLE_STATUSES]
+
+
+def load_trial_summaries() -> List[Dict]:
+    print("RTDB: Fetching trial summaries")
+    summaries = realtime_db.reference(SUMMARY_ROOT).get()
+    if summaries is None:
+        summaries = rebuild_trial_summaries()
+    return _available(summaries)  # type: ignore
+
+
+def get_available_trial_summaries() -> List[Dict]:
+    return trial_summary_cache.get_or_load("available", load_trial_summaries)
+
+
+@register_warmup("trial_summaries")
+def warm_trial_summaries():
+    trial_summary_cache.set("available", load_trial_summaries())
+
+
+@on_change("trials")
+def sync_trial_summaries(change: Change):
+    """Patches the cached summary list from the change feed, like the full catalog."""
+    if change.key is None:
+        trial_summary_cache.ttl_seconds = CHANGE_FEED_CACHE_TTL_SECONDS
+        summaries = {trial_id: summarize_trial(t) for trial_id, t in change.value.items() if isinstance(t, dict)}
+        trial_summary_cache.set("available", _available(summaries))
+        return
+    current = trial_summary_cache.get("available")
+    if current is None:
+        return
+    changed = _available({change.key: summarize_trial(change.value)}) if isinstance(change.value, dict) else []
+    updated = [t for t in current if t["id"] != change.key]
+    position = next((i for i, t in enumerate(current) if t["id"] == change.key), len(updated))
+    trial_summary_cache.set("available", updated[:position] + changed + updated[position:])
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Sequence[str]]:
+    """None for every field, otherwise the requested field names (default: the summary)."""
+    if fields is None or not fields.strip():
+        return SUMMARY_FIELDS + ("stageCount",)
+    if fields.strip() in ALL_FIELDS:
+        return None
+    return tuple(f.strip() for f in fields.split(",") if f.strip())
+
+
+async def get_trial_list(fields: Optional[Sequence[str]], lat: Optional[float] = None, lng: Optional[float] = None,
+                         radius_miles: Optional[float] = None) -> List[Dict]:
+    """
+    Available trials projected to `fields` (None = full records), always including "id".
+    With lat/lng they are nearest-first and carry distance fields, as in trials_near();
+    trials without a site come last unless radius_miles is given.
+    """
+    if fields is not None and set(fields) <= set(SUMMARY_FIELDS) | {"id", "stageCount"}:
+        source, trials = "summaries", get_available_trial_summaries()
+    else:
+        # Imported here so the seeder can use this module without the agent stack
+        from services.deep_agent_service import get_available_trials
+        source, trials = "trials", await get_available_trials()
+    extra: tuple = ("id",)
+    if lat is not None and lng is not None:
+        trials = trials_near(trials, lat, lng, radius_miles, source=source)
+        extra += ("distance", "distanceMiles")
+    if fields is None:
+        return trials
+    return [{k: t[k] for k in extra + tuple(fields) if k in t} for t in trials]
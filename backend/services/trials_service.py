@@ -2,6 +2,32 @@
 import json
 from typing import List, Dict, Optional
 from firebase_admin import db as realtime_db
+from services.trial_search_index import trial_search_index
+from services.warmup_service import register_warmup
+from services.change_feed import Change, on_change
+from services.stage_service import canonical_stages, stage_cache
+from services.trial_summaries import write_trial_summary
+
+
+def ensure_search_index():
+    """Builds the semantic search index from all trials on first use."""
+    if not trial_search_index.loaded:
+        trial_search_index.rebuild(realtime_db.reference('trials').get() or {})
+
+
+@register_warmup("trial_search_index")
+def warm_trial_search_index():
+    ensure_search_index()
+
+
+@on_change("trials")
+def sync_trial_search_index(change: Change):
+    if change.key is None:
+        trial_search_index.rebuild(change.value)
+    elif change.value is None:
+        trial_search_index.remove(change.key)
+    else:
+        trial_search_index.upsert(change.key, change.value, merge=False)
 
 class ClinicalTrialsService:
     """Service for managing clinical trials data in Firebase Realtime Database"""
@@ -44,8 +70,12 @@ class ClinicalTrialsService:
     async def create_trial(trial_data: Dict) -> str:
         """Create a new clinical trial"""
         try:
+            if 'stages' in trial_data:
+                trial_data = {**trial_data, 'stages': canonical_stages(trial_data['stages'])}
             ref = realtime_db.reference('trials')
             new_trial_ref = ref.push(trial_data)
+            write_trial_summary(new_trial_ref.key, trial_data)
+            trial_search_index.upsert(new_trial_ref.key, trial_data)
             return new_trial_ref.key
         except Exception as e:
             raise Exception(f"Error creating clinical trial: {str(e)}")
@@ -54,8 +84,13 @@ class ClinicalTrialsService:
     async def update_trial(trial_id: str, trial_data: Dict) -> bool:
         """Update an existing clinical trial"""
         try:
+            if 'stages' in trial_data:
+                trial_data = {**trial_data, 'stages': canonical_stages(trial_data['stages'])}
             ref = realtime_db.reference(f'trials/{trial_id}')
             ref.update(trial_data)
+            stage_cache.invalidate(trial_id)
+            write_trial_summary(trial_id, ref.get())
+            trial_search_index.upsert(trial_id, trial_data)
             return True
         except Exception as e:
             raise Exception(f"Error updating trial {trial_id}: {str(e)}")
@@ -66,14 +101,25 @@ class ClinicalTrialsService:
         try:
             ref = realtime_db.reference(f'trials/{trial_id}')
             ref.delete()
+            stage_cache.invalidate(trial_id)
+            write_trial_summary(trial_id, None)
+            trial_search_index.remove(trial_id)
             return True
         except Exception as e:
             raise Exception(f"Error deleting trial {trial_id}: {str(e)}")
     
     @staticmethod
-    async def search_trials(query: str = "", status_filter: str = "All") -> List[Dict]:
-        """Search and filter clinical trials"""
+    async def search_trials(query: str = "", status_filter: str = "All", mode: str = "keyword",
+                            limit: int = 20) -> List[Dict]:
+        """
+        Search and filter clinical trials.
+        mode="keyword" does substring matching; mode="semantic" ranks trials by
+        similarity from the in-memory index (no database read once it is built).
+        """
         try:
+            if mode == "semantic" and query:
+                return ClinicalTrialsService._semantic_search(query, status_filter, limit)
+
             all_trials = await ClinicalTrialsService.get_all_trials()
             
             if not all_trials:
@@ -105,4 +151,16 @@ class ClinicalTrialsService:
             return filtered_trials
         except Exception as e:
             raise Exception(f"Error searching clinical trials: {str(e)}")
-    
+
+    @staticmethod
+    def _semantic_search(query: str, status_filter: str, limit: int) -> List[Dict]:
+        ensure_search_index()
+        # Over-fetch so the status filter still leaves up to `limit` results
+        hits = trial_search_index.search(query, limit=limit if status_filter == "All" else limit * 5)
+        results = []
+        for trial_id, score in hits:
+            trial = trial_search_index.trials.get(trial_id)
+            if trial is None or (status_filter != "All" and trial.get('status') != status_filter):
+                continue
+            results.append({**trial, 'id': trial_id, 'score': round(score, 4)})
+        return results[:limit]
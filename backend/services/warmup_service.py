@@ -0,0 +1,67 @@
+# services/warmup_service.py
+"""
+Startup warm-up registry.
+
+Services register warm-up steps (open pooled connections, preload caches and
+indexes) with @register_warmup. main.py runs them all during the lifespan
+startup phase and only reports ready on /health/ready once every one of them
+has succeeded. Failed components are listed under "failed" and retried every
+WARMUP_RETRY_SECONDS until they come up.
+"""
+import asyncio
+import inspect
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "15"))
+
+WarmupFn = Callable[[], Union[None, Awaitable[None]]]
+
+_warmups: List[Tuple[str, WarmupFn]] = []
+readiness: Dict = {"ready": False, "failed": [], "components": {}}
+
+
+def register_warmup(name: str):
+    """Registers a sync or async warm-up step under a component name."""
+    def decorator(func: WarmupFn) -> WarmupFn:
+        _warmups.append((name, func))
+        return func
+    return decorator
+
+
+async def _run_one(name: str, func: WarmupFn) -> bool:
+    start = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(func):
+            await asyncio.wait_for(func(), WARMUP_TIMEOUT_SECONDS)
+        else:
+            # Blocking clients (firebase_admin, redis) warm up off the event loop.
+            await asyncio.wait_for(asyncio.to_thread(func), WARMUP_TIMEOUT_SECONDS)
+        status = "ok"
+    except Exception as e:
+        print(f"Warm-up of '{name}' failed: {e}")
+        status = f"failed: {e}"
+    readiness["components"][name] = {"status": status, "seconds": round(time.perf_counter() - start, 3)}
+    return status == "ok"
+
+
+async def run_warmups():
+    """
+    Runs every registered warm-up concurrently and marks the process ready once
+    all have succeeded, retrying the failed ones in the meantime.
+    """
+    pending = list(_warmups) if WARMUP_ENABLED else []
+    if pending:
+        print(f"Warming up {len(pending)} components...")
+    while pending:
+        results = await asyncio.gather(*(_run_one(name, func) for name, func in pending))
+        pending = [warmup for warmup, ok in zip(pending, results) if not ok]
+        readiness["failed"] = [name for name, _ in pending]
+        if pending:
+            print(f"Not ready; retrying {readiness['failed']} in {WARMUP_RETRY_SECONDS:.0f}s.")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    readiness["ready"] = True
+    print("Warm-up complete; reporting ready.")
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("langgraph.checkpoint.redis")
+zstandard = pytest.importorskip("zstandard")
+
+import redis.asyncio as aioredis  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage  # noqa: E402
+from langgraph.checkpoint.base import empty_checkpoint  # noqa: E402
+from langgraph.checkpoint.redis.base import BaseRedisSaver  # noqa: E402
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer  # noqa: E402
+
+from services.checkpoint_serde import (  # noqa: E402
+    CompressedAsyncRedisSaver,
+    CompressedRedisSerializer,
+    compressing_writes,
+)
+
+
+def _turn():
+    snapshot = "; ".join(f"2024-03-{d:02d} Metformin 500mg continued, HbA1c {6 + d / 10:.1f}" for d in range(1, 29))
+    return [
+        HumanMessage(content="Summarize this patient's record.", id="h1"),
+        AIMessage(content="", tool_calls=[{"name": "get_patient_emr", "args": {"patient_id": "p1"}, "id": "call_1"}],
+                  id="a1"),
+        ToolMessage(content=snapshot, tool_call_id="call_1", name="get_patient_emr", id="t1"),
+        AIMessage(content="HbA1c has been rising steadily this month.", id="a2"),
+    ]
+
+
+def _assert_restored(messages):
+    assert messages == _turn()
+    assert isinstance(messages[1], AIMessage) and messages[1].tool_calls[0]["id"] == "call_1"
+    assert isinstance(messages[2], ToolMessage) and messages[2].tool_call_id == "call_1"
+
+
+@pytest.fixture
+def saver():
+    # Constructing the saver does not connect; only the blob helpers are used here.
+    return CompressedAsyncRedisSaver(redis_client=aioredis.Redis(), serde=CompressedRedisSerializer())
+
+
+def test_pending_writes_round_trip_compressed(saver):
+    # What aput_writes stores, read back through the saver's own write loader.
+    with compressing_writes():
+        type_, blob = saver.serde.dumps_typed(_turn())
+    assert type_ == "zstd+json"
+    stored = {"channel": "messages", "type": type_, "blob": saver._encode_blob(blob)}
+    [(task_id, channel, value)] = BaseRedisSaver._load_writes(saver.serde, {("task-1", "0"): stored})
+    assert (task_id, channel) == ("task-1", "messages")
+    _assert_restored(value)
+
+
+def test_checkpoint_documents_stay_plain_json(saver):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": _turn()}
+    document = saver._dump_checkpoint(checkpoint)
+    assert document["type"] == "json"
+    _assert_restored(saver._recursive_deserialize(document["channel_values"])["messages"])
+
+
+def test_small_and_disabled_writes_are_not_compressed():
+    with compressing_writes():
+        assert CompressedRedisSerializer().dumps_typed({"step": 1})[0] == "json"
+        assert CompressedRedisSerializer(compress=False).dumps_typed(_turn())[0] == "json"
+
+
+def test_blobs_from_the_msgpack_wrapper_still_decode():
+    type_, data = JsonPlusSerializer().dumps_typed(_turn())
+    blob = ("zstd+" + type_, zstandard.ZstdCompressor().compress(data))
+    _assert_restored(CompressedRedisSerializer().loads_typed(blob))
+
+
+def test_unknown_dictionary_is_reported():
+    with pytest.raises(ValueError):
+        CompressedRedisSerializer().loads_typed(("zstd-d12345+json", b""))
+
+
+def test_async_saver_round_trip_against_redis():
+    # Needs Redis Stack (RedisJSON + RediSearch), e.g. REDIS_URL=redis://localhost:6379
+    url = os.getenv("REDIS_URL")
+    if not url:
+        pytest.skip("REDIS_URL is not set")
+
+    async def round_trip():
+        client = aioredis.Redis.from_url(url)
+        try:
+            saver = CompressedAsyncRedisSaver(redis_client=client, serde=CompressedRedisSerializer())
+            await saver.asetup()
+            config = {"configurable": {"thread_id": f"test-{uuid.uuid4()}", "checkpoint_ns": ""}}
+            config = await saver.aput(config, empty_checkpoint(), {"source": "loop", "step": 0}, {})
+            await saver.aput_writes(config, [("messages", _turn())], task_id="task-1")
+            return await saver.aget_tuple(config)
+        finally:
+            await client.aclose()
+
+    try:
+        saved = asyncio.run(round_trip())
+    except aioredis.ConnectionError:
+        pytest.skip("Redis is not reachable")
+    [(task_id, channel, value)] = saved.pending_writes
+    assert (task_id, channel) == ("task-1", "messages")
+    _assert_restored(value)
@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.intent_router import (  # noqa: E402
+    CALIBRATION_EXAMPLES,
+    CLINICAL_ORG,
+    CONFIDENCE_CEILING,
+    CONFIDENCE_FLOOR,
+    EMR_MANAGER,
+    TRAINING_EXAMPLES,
+    TRIAL_INFO,
+    calibrate_threshold,
+    classify_intent,
+    min_confidence,
+    route_fast_path,
+)
+
+
+# Seen by neither training nor calibration
+HELD_OUT = [
+    ("list my medications", EMR_MANAGER),
+    ("show me the patient's smoking status", EMR_MANAGER),
+    ("what does the trial involve", TRIAL_INFO),
+    ("what are the side effects of the study drug", TRIAL_INFO),
+    ("how long is the screening phase", TRIAL_INFO),
+    ("show the enrollment status for patient maria", CLINICAL_ORG),
+    ("what is the current stage for patient anna", CLINICAL_ORG),
+    ("update the protocol for the baseline stage", CLINICAL_ORG),
+]
+
+
+def test_held_out_examples_are_unseen():
+    seen = {text for texts in TRAINING_EXAMPLES.values() for text in texts}
+    seen.update(text for text, _ in CALIBRATION_EXAMPLES)
+    assert not seen & {text for text, _ in HELD_OUT}
+
+
+@pytest.mark.parametrize("text, expected", HELD_OUT)
+def test_held_out_examples_route_as_labelled(text, expected):
+    assert route_fast_path(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "what's the weather tomorrow",
+    "tell me a joke",
+    "hello",
+    "",
+    "asdf qwerty zxcv",
+    "explain the rules of chess",
+    "how long is the movie",
+])
+def test_off_topic_falls_back(text):
+    assert route_fast_path(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "what's the progress on the football game",
+    "what is the weather like at the trial site",
+    "is it going to rain during my trial visit",
+    "my record label wants a new song",
+    "how long is the line at the dmv",
+])
+def test_near_misses_fall_back(text):
+    assert route_fast_path(text) is None
+
+
+def test_unknown_vocabulary_is_not_classified():
+    assert classify_intent("zebra xylophone quantum") == (None, 0.0)
+
+
+def test_threshold_sits_above_every_misroute():
+    threshold = calibrate_threshold()
+    assert CONFIDENCE_FLOOR <= threshold <= CONFIDENCE_CEILING
+    for text, expected in CALIBRATION_EXAMPLES:
+        label, confidence = classify_intent(text)
+        if label is not None and label != expected:
+            assert confidence < threshold
+
+
+def test_threshold_rises_with_confident_misroutes():
+    assert calibrate_threshold([("list my medications", TRIAL_INFO)]) > min_confidence()
+
+
+def test_threshold_is_capped_below_one():
+    assert calibrate_threshold([("list my medications", TRIAL_INFO), ("what does the trial involve", EMR_MANAGER)]) == \
+        CONFIDENCE_CEILING
@@ -0,0 +1,145 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# matching_service reads RTDB through the deployment's firebase_config
+pytest.importorskip("firebase_config")
+
+from services import matching_service  # noqa: E402
+from services.change_feed import Change, change_feed  # noqa: E402
+from services.matching_service import MatchingIndex, matching_index_cache  # noqa: E402
+
+HANDLERS = {
+    "users": matching_service.sync_matching_patient,
+    "emr_records": matching_service.sync_matching_emr,
+    "trials": matching_service.sync_matching_trial,
+}
+
+
+def _data():
+    return {
+        "users": {
+            "p1": {"userType": "patient", "firstName": "Ana", "age": 52, "orgId": "org1", "emrId": "p1"},
+            "p2": {"userType": "patient", "firstName": "Ben", "age": 70, "orgId": "org1", "emrId": "p2"},
+            "p3": {"userType": "patient", "firstName": "Cy", "orgId": "org2", "emrId": "p3"},
+            "s1": {"userType": "staff", "firstName": "Dee", "orgId": "org1"},
+        },
+        "emr_records": {
+            "p1": {"underlying_conditions": ["Type 2 Diabetes"], "smoker_status": "Non-smoker"},
+            "p2": {"underlying_conditions": ["Hypertension"], "smoker_status": "Current Smoker"},
+            "p3": {"log": [{"type": "diagnosis", "description": "asthma"}]},
+        },
+        "trials": {
+            "t1": {"condition": "Type 2 Diabetes", "status": "Recruiting",
+                   "eligibility": {"minAge": 40, "maxAge": 65}},
+            "t2": {"condition": "Hypertension", "status": "Active", "eligibility": {"excludeSmokers": True}},
+            "t3": {"condition": "Asthma", "status": "Recruiting", "maxParticipants": 10, "currentParticipants": 2},
+        },
+    }
+
+
+def _scores(index: MatchingIndex) -> dict:
+    """(patient, trial) -> score for every live patient and trial, independent of row order."""
+    scores = {}
+    for start, block in index.score_all():
+        for offset, row in enumerate(block):
+            uid = index.patient_ids[start + offset]
+            if index.patient_index.get(uid) != start + offset:
+                continue  # soft-deleted row
+            for trial_id, j in index.trial_index.items():
+                scores[(uid, trial_id)] = float(row[j])
+    return scores
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """A running change feed over in-memory records, with the index built from them."""
+    data = _data()
+    monkeypatch.setattr(change_feed, "mirror", data)
+    monkeypatch.setattr(matching_service, "_feed_covers_matching", lambda: True)
+    matching_index_cache.set("index", MatchingIndex(data["users"], data["emr_records"], data["trials"]))
+    yield data
+    matching_index_cache.invalidate("index")
+
+
+def apply(data: dict, root: str, key: str, value):
+    """Applies a write to the mirror and delivers it to the matching handler, as the feed does."""
+    previous = data[root].get(key)
+    if value is None:
+        data[root].pop(key, None)
+    else:
+        data[root][key] = value
+    HANDLERS[root](Change(root, key, value, previous))
+
+
+def assert_matches_fresh_build(data: dict):
+    fresh = MatchingIndex(data["users"], data["emr_records"], data["trials"])
+    assert _scores(matching_index_cache.get("index")) == pytest.approx(_scores(fresh))
+
+
+def test_patient_and_emr_changes_patch_their_rows(feed):
+    index = matching_index_cache.get("index")
+    apply(feed, "emr_records", "p2", {"underlying_conditions": ["Hypertension", "Asthma"], "smoker_status": "Former"})
+    apply(feed, "users", "p1", {**feed["users"]["p1"], "age": 30})
+    apply(feed, "users", "p4", {"userType": "patient", "firstName": "Eve", "age": 45, "emrId": "p4"})
+    apply(feed, "emr_records", "p4", {"conditions": ["type 2 diabetes"]})
+    assert matching_index_cache.get("index") is index
+    assert_matches_fresh_build(feed)
+
+
+def test_deletes_are_soft(feed):
+    index = matching_index_cache.get("index")
+    apply(feed, "users", "p1", None)
+    apply(feed, "users", "p2", {**feed["users"]["p2"], "userType": "staff"})
+    apply(feed, "trials", "t3", None)
+    assert matching_index_cache.get("index") is index
+    assert "p1" not in index.patient_index and "t3" not in index.trial_index
+    assert_matches_fresh_build(feed)
+
+
+def test_trial_change_within_vocabulary_is_patched(feed):
+    index = matching_index_cache.get("index")
+    apply(feed, "trials", "t1", {**feed["trials"]["t1"], "eligibility": {"minAge": 18, "maxAge": 50}})
+    apply(feed, "trials", "t2", {**feed["trials"]["t2"], "status": "Completed"})
+    assert matching_index_cache.get("index") is index
+    assert_matches_fresh_build(feed)
+
+
+def test_new_vocabulary_rebuilds(feed, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(matching_service, "schedule_matching_rebuild", lambda: scheduled.append(True))
+    apply(feed, "trials", "t4", {"condition": "Hyperlipidemia", "status": "Recruiting"})
+    apply(feed, "trials", "t1", {**feed["trials"]["t1"], "eligibility": {"conditions": ["Obesity"]}})
+    assert len(scheduled) == 2
+
+    # What the scheduled background thread runs, here on the test thread
+    assert matching_service._rebuild_lock.acquire(blocking=False)
+    matching_service._rebuild_pending.set()
+    matching_service._rebuild_loop()
+    assert "t4" in matching_index_cache.get("index").trial_index
+    assert_matches_fresh_build(feed)
+
+
+def test_change_during_a_rebuild_is_not_lost(feed, monkeypatch):
+    builds = []
+
+    def build():
+        snapshot = {root: dict(records) for root, records in feed.items()}
+        if not builds:
+            # Lands after this build read its snapshot: patched in now, and the rebuild runs again
+            apply(feed, "emr_records", "p3", {"underlying_conditions": ["Hypertension"]})
+            assert matching_service._rebuild_pending.is_set()
+            assert_matches_fresh_build(feed)
+        builds.append(snapshot)
+        return MatchingIndex(snapshot["users"], snapshot["emr_records"], snapshot["trials"])
+
+    monkeypatch.setattr(matching_service, "_build_index", build)
+    assert matching_service._rebuild_lock.acquire(blocking=False)
+    matching_service._rebuild_pending.set()
+    matching_service._rebuild_loop()
+    assert len(builds) == 2
+    assert not matching_service._rebuild_lock.locked()
+    assert_matches_fresh_build(feed)
@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.output_schemas import EmrExtraction, PersonalizedTimeline, ProtocolTimeline  # noqa: E402
+from services.structured_output import (  # noqa: E402
+    ModelOutputError,
+    TruncatedOutputError,
+    parse_model_json,
+    parse_structured,
+)
+
+
+def test_fenced_json_with_prose():
+    assert parse_model_json('Here you go:\n```json\n{"a": 1}\n```\nDone.') == {"a": 1}
+
+
+def test_stray_comma_is_repaired():
+    assert parse_model_json('{"a": 1, "b": 2,}') == {"a": 1, "b": 2}
+
+
+@pytest.mark.parametrize("text", [
+    '{"Stage 1": "Screening", "Stage 2": "Baseli',
+    '{"Stage 1": "Screening", "Stage 2":',
+    '{"age": 52, "prescriptions": [{"name": "Metformin"},',
+])
+def test_truncated_output_is_rejected(text):
+    with pytest.raises(TruncatedOutputError):
+        parse_model_json(text)
+
+
+def test_truncated_output_is_not_stored_as_complete():
+    with pytest.raises(ModelOutputError):
+        parse_structured('{"Stage 1": "Screening", "Stage 2": "Base', ProtocolTimeline)
+
+
+def test_no_json():
+    with pytest.raises(ModelOutputError):
+        parse_model_json("I could not find any stages.")
+
+
+def test_emr_fields_are_coerced():
+    data = parse_structured(
+        '{"age": "52 years", "underlying_conditions": "diabetes, hypertension",'
+        ' "prescriptions": "Metformin 500mg; Lisinopril", "smoker_status": false}',
+        EmrExtraction,
+    )
+    assert data == {
+        "age": 52,
+        "underlying_conditions": ["diabetes", "hypertension"],
+        "prescriptions": [{"name": "Metformin 500mg"}, {"name": "Lisinopril"}],
+        "smoker_status": "No",
+    }
+
+
+def test_emr_prescription_list_of_strings_and_single_object():
+    assert parse_structured('{"prescriptions": ["Aspirin"]}', EmrExtraction)["prescriptions"] == [
+        {"name": "Aspirin"}]
+    assert parse_structured('{"prescriptions": {"name": "Aspirin", "dosage": "81mg"}}', EmrExtraction)[
+        "prescriptions"] == [{"name": "Aspirin", "dosage": "81mg"}]
+
+
+def test_emr_unparseable_age_is_dropped():
+    assert parse_structured('{"age": "unknown"}', EmrExtraction) == {"age": None}
+
+
+def test_personalized_stages_keep_only_returned_fields():
+    data = parse_structured('{"1": {"checklist": ["Fast before the visit"]}}', PersonalizedTimeline)
+    assert data == {"1": {"checklist": ["Fast before the visit"]}}
@@ -180,7 +180,7 @@ const ClinicalTrials = () => {
                   </View>
 
                   <View style={styles.distanceLocationRow}>
-                      <Text style={styles.distance}>📍 {trial.distance}</Text>
+                      {trial.distance ? <Text style={styles.distance}>📍 {trial.distance}</Text> : null}
                       <Text style={styles.condition}>{trial.condition}</Text>
                   </View>
 
@@ -0,0 +1,87 @@
+// src/liveUpdates.js
+import { useEffect, useRef } from 'react';
+
+const RECONNECT_DELAY_MS = 3000;
+// XMLHttpRequest keeps the whole stream in responseText, so a long-lived
+// connection is replaced once it has received this many characters.
+const MAX_STREAM_CHARS = 1024 * 1024;
+
+// Applies {"a/b/c": value} changes from the server to a copy of `target`.
+// A null value removes the field.
+export const applyChanges = (target, changes) => {
+  const result = { ...(target || {}) };
+  Object.entries(changes).forEach(([path, value]) => {
+    const keys = path.split('/');
+    let node = result;
+    keys.slice(0, -1).forEach((key) => {
+      node[key] = { ...(node[key] || {}) };
+      node = node[key];
+    });
+    const last = keys[keys.length - 1];
+    if (value === null) {
+      delete node[last];
+    } else {
+      node[last] = value;
+    }
+  });
+  return result;
+};
+
+// Subscribes to a server-sent event stream (e.g. `${API_BASE_URL}/patient/${id}/events`)
+// and calls onUpdate({ type, id, changes, replace }) for every change. Each connection
+// (including reconnects) starts with the current state of every record, flagged with
+// replace: true, so apply those to an empty record rather than the previous one.
+// React Native has no EventSource, so the stream is read incrementally through XMLHttpRequest.
+export const useLiveUpdates = (url, onUpdate) => {
+  const handlerRef = useRef(onUpdate);
+  handlerRef.current = onUpdate;
+
+  useEffect(() => {
+    if (!url) return undefined;
+    let xhr = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const connect = () => {
+      let seen = 0;
+      let buffer = '';
+      const request = new XMLHttpRequest();
+      xhr = request;
+      request.open('GET', url);
+      request.setRequestHeader('Accept', 'text/event-stream');
+      request.onprogress = () => {
+        buffer += request.responseText.slice(seen);
+        seen = request.responseText.length;
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        frames.forEach((frame) => {
+          const data = frame.split('\n').filter((line) => line.startsWith('data: ')).map((line) => line.slice(6)).join('\n');
+          if (!data) return;
+          try {
+            handlerRef.current(JSON.parse(data));
+          } catch (err) {
+            console.error('Bad live update:', err);
+          }
+        });
+        if (seen >= MAX_STREAM_CHARS && !buffer) {
+          // The replacement starts by resending current state, so nothing changed in between is missed
+          request.onprogress = null;
+          request.onloadend = null;
+          connect();
+          request.abort();
+        }
+      };
+      request.onloadend = () => {
+        if (!closed) reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+      };
+      request.send();
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      if (xhr) xhr.abort();
+    };
+  }, [url]);
+};
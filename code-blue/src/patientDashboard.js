@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { View, Text, StyleSheet, ScrollView, TouchableOpacity, ActivityIndicator, Alert } from 'react-native';
 import * as DocumentPicker from 'expo-document-picker';
 import { useAuth } from './AuthContext';
+import { applyChanges, useLiveUpdates } from './liveUpdates';
 
 const API_BASE_URL = 'http://100.66.12.93:8000/api'; 
 
@@ -39,19 +40,13 @@ const PatientDashboard = ({ route }) => {
     const fetchDashboardData = async () => {
       // Fetching logic remains the same...
       try {
-        const [profileResponse, trialsResponse] = await Promise.all([
-          fetch(`${API_BASE_URL}/patient/${patientId}/profile`),
-          fetch(`${API_BASE_URL}/trials/available`)
-        ]);
+        // One round trip; the server gathers profile, enrollment and trials concurrently
+        const response = await fetch(`${API_BASE_URL}/patient/${patientId}/dashboard`);
+        if (!response.ok) throw new Error('Failed to fetch dashboard data.');
 
-        if (!profileResponse.ok) throw new Error('Failed to fetch patient profile.');
-        if (!trialsResponse.ok) throw new Error('Failed to fetch clinical trials.');
-
-        const profile = await profileResponse.json();
-        const trialsData = await trialsResponse.json();
-
-        setProfileData(profile);
-        setTrials(trialsData.available_trials || []);
+        const dashboard = await response.json();
+        setProfileData(dashboard.profile);
+        setTrials(dashboard.trials || []);
       } catch (err) {
         setError(err.message);
       } finally {
@@ -61,6 +56,13 @@ const PatientDashboard = ({ route }) => {
     fetchDashboardData();
   }, [patientId]);
 
+  // Profile edits made by a CRC or the agent arrive as changed fields only
+  useLiveUpdates(patientId ? `${API_BASE_URL}/patient/${patientId}/events` : null, (update) => {
+    if (update.type === 'profile') {
+      setProfileData((prev) => applyChanges(update.replace ? {} : prev, update.changes));
+    }
+  });
+
   const handleUploadEMR = async () => {
     // Upload logic remains the same...
     try {